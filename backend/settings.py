@@ -42,6 +42,21 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Shared cache when REDIS_URL is set, otherwise per-process memory
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -122,12 +137,153 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024 
+# Uploads are stored once per content hash (main_app/media/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'main_app.media.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Multipart files above this are spooled to a temp file instead of worker RAM
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10240
 
+# Media: background worker threads for image processing (re-encoding,
+# renditions) and worker processes for the Pillow encoding itself.
+# 0 runs the work inline.
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))
+MEDIA_PROCESSES = int(os.environ.get('MEDIA_PROCESSES', 2))
+
+# Media: uploads are re-encoded to this format (WEBP or AVIF) with metadata
+# stripped and the longest side capped
+MEDIA_IMAGE_FORMAT = os.environ.get('MEDIA_IMAGE_FORMAT', 'WEBP')
+MEDIA_IMAGE_QUALITY = int(os.environ.get('MEDIA_IMAGE_QUALITY', 80))
+MEDIA_IMAGE_MAX_SIDE = int(os.environ.get('MEDIA_IMAGE_MAX_SIDE', 2560))
+
+# Media: resumable chunked uploads (/uploads/). Chunks are streamed to
+# MEDIA_ROOT/.uploads, never buffered whole.
+MEDIA_UPLOAD_CHUNK_SIZE = int(os.environ.get('MEDIA_UPLOAD_CHUNK_SIZE', 1024 * 1024))
+MEDIA_UPLOAD_MAX_CHUNK = int(os.environ.get('MEDIA_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024))
+MEDIA_UPLOAD_MAX_SIZE = int(os.environ.get('MEDIA_UPLOAD_MAX_SIZE', 10 * 1024 * 1024))
+
+# Media: uploads are validated from the image header only; images with more
+# pixels than this are rejected before anything decodes them
+MEDIA_MAX_IMAGE_PIXELS = int(os.environ.get('MEDIA_MAX_IMAGE_PIXELS', 50_000_000))
+
+# Media: serving under MEDIA_URL. MEDIA_SENDFILE = 'x-accel-redirect' (nginx,
+# internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile'
+# lets the proxy stream files; empty serves them with sendfile from the worker.
+# Content-addressed names are cached forever, others for MEDIA_CACHE_MAX_AGE.
+MEDIA_SERVE = os.environ.get('MEDIA_SERVE', 'True') == 'True'
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+
+# Media: manage.py gc_media keeps unreferenced files younger than this, so
+# uploads whose row is not committed yet survive a concurrent run
+MEDIA_GC_GRACE_HOURS = float(os.environ.get('MEDIA_GC_GRACE_HOURS', 24))
+
+# Media: resume checkpoints of bulk reprocessing commands (main_app/media/bulk.py)
+MEDIA_BULK_CHECKPOINT_DIR = os.environ.get('MEDIA_BULK_CHECKPOINT_DIR', str(BASE_DIR / 'checkpoints'))
+
+# Workout plans: workers cache the global plans and check WorkoutPlanVersion
+# for changes at most this often (seconds)
+WORKOUT_PLAN_CHECK_INTERVAL = float(os.environ.get('WORKOUT_PLAN_CHECK_INTERVAL', 5))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main_app': {
+            'handlers': ['console'],
+            # Quiet by default (tests, production); APP_LOG_LEVEL=INFO opts in to per-request logs
+            'level': os.environ.get('APP_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+# AI coach: token budget for stored conversation history sent with each request
+AI_HISTORY_TOKEN_BUDGET = int(os.environ.get('AI_HISTORY_TOKEN_BUDGET', 1200))
+
+# AI coach: upstream call resilience (retries, circuit breaker, hedging)
+OPENAI_API_URL = os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/responses')
+AI_REQUEST_TIMEOUT = float(os.environ.get('AI_REQUEST_TIMEOUT', 30))
+AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES', 2))
+AI_RETRY_BACKOFF = float(os.environ.get('AI_RETRY_BACKOFF', 0.5))
+AI_RETRY_BACKOFF_MAX = float(os.environ.get('AI_RETRY_BACKOFF_MAX', 8))
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('AI_CIRCUIT_FAILURE_THRESHOLD', 5))
+AI_CIRCUIT_RESET_TIMEOUT = float(os.environ.get('AI_CIRCUIT_RESET_TIMEOUT', 30))
+# Fire a second request when the first exceeds this latency percentile (empty = off)
+AI_HEDGE_PERCENTILE = float(os.environ['AI_HEDGE_PERCENTILE']) if os.environ.get('AI_HEDGE_PERCENTILE') else None
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get('AI_HEDGE_MIN_SAMPLES', 20))
+
+# AI coach: seconds a successful reply is reused for an identical resubmission
+AI_RESULT_CACHE_TTL = float(os.environ.get('AI_RESULT_CACHE_TTL', 10))
+
+# AI coach: answer safety alerts, equipment how-tos and video requests locally
+AI_LOCAL_FAST_PATH = os.environ.get('AI_LOCAL_FAST_PATH', 'True') == 'True'
+
+# AI coach: model/output-token routing per detail level and mode. None uses the
+# defaults in main_app/ai/routing.py; override with a dict of the same shape.
+AI_MODEL_ROUTES = None
+AI_MODE_ROUTES = None
+
+# AI coach: keep only the equipment instructions and optional mode-guidance
+# sections that match the message (safety rules are always sent)
+AI_RETRIEVAL_ENABLED = os.environ.get('AI_RETRIEVAL_ENABLED', 'True') == 'True'
+AI_RETRIEVAL_TOP_K = int(os.environ.get('AI_RETRIEVAL_TOP_K', 3))
+
+# AI coach: seconds between checks of the catalog version (videos, equipment,
+# images, safety alerts); workers reload their snapshot only when it changes
+AI_CATALOG_CHECK_INTERVAL = float(os.environ.get('AI_CATALOG_CHECK_INTERVAL', 5))
+
+# AI coach: background job mode (POST /api/openai/ with "async": true)
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 4))
+AI_JOB_QUEUE_LIMIT = int(os.environ.get('AI_JOB_QUEUE_LIMIT', 32))
+# Jobs still queued/running this many seconds after submission are failed
+# (their worker process restarted); finished jobs are pruned after the
+# retention period by the prune_ai_jobs command
+AI_JOB_TIMEOUT = float(os.environ.get('AI_JOB_TIMEOUT', 300))
+AI_JOB_RETENTION_DAYS = float(os.environ.get('AI_JOB_RETENTION_DAYS', 7))
+
+# AI coach: reuse replies to near-identical generic questions (cosine similarity
+# of local n-gram embeddings, per coarse profile bucket)
+AI_SEMANTIC_CACHE_ENABLED = os.environ.get('AI_SEMANTIC_CACHE_ENABLED', 'True') == 'True'
+AI_SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('AI_SEMANTIC_CACHE_THRESHOLD', 0.92))
+AI_SEMANTIC_CACHE_TTL = float(os.environ.get('AI_SEMANTIC_CACHE_TTL', 3600))
+AI_SEMANTIC_CACHE_CAPACITY = int(os.environ.get('AI_SEMANTIC_CACHE_CAPACITY', 512))
+AI_SEMANTIC_CACHE_MAX_BUCKETS = int(os.environ.get('AI_SEMANTIC_CACHE_MAX_BUCKETS', 64))
+
+# AI coach: add a Server-Timing header (per-stage durations) to chat replies.
+# Stage timings are always recorded as ai_stage_ms{stage=...} histograms.
+AI_SERVER_TIMING = os.environ.get('AI_SERVER_TIMING', 'False') == 'True'
+
+# AI coach: token-bucket rate limits for POST /api/openai/. Buckets are kept in
+# the AI_THROTTLE_CACHE cache; it must be shared (REDIS_URL) for the limits to
+# hold across workers. None uses the defaults in main_app/ai/throttling.py;
+# override with {'rate': '20/min', 'burst': 10} (per mode: a dict of those).
+AI_THROTTLE_ENABLED = os.environ.get('AI_THROTTLE_ENABLED', 'True') == 'True'
+AI_THROTTLE_CACHE = os.environ.get('AI_THROTTLE_CACHE', 'default')
+AI_THROTTLE_USER_LIMIT = None
+AI_THROTTLE_GLOBAL_LIMIT = None
+AI_THROTTLE_MODE_LIMITS = None
+
+# AI coach: append-only call log (gzip JSONL, written off the request path) for
+# manage.py replay_ai_log. Empty disables it.
+AI_CALL_LOG_DIR = os.environ.get('AI_CALL_LOG_DIR', '')
+AI_CALL_LOG_MAX_BYTES = int(os.environ.get('AI_CALL_LOG_MAX_BYTES', 50 * 1024 * 1024))
+AI_CALL_LOG_BACKUPS = int(os.environ.get('AI_CALL_LOG_BACKUPS', 20))
+AI_CALL_LOG_QUEUE_SIZE = int(os.environ.get('AI_CALL_LOG_QUEUE_SIZE', 10000))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -14,15 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from main_app.media.serve import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('main_app.urls'))
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media is served in production too: immutable caching, ranges and sendfile
+# offload to the front proxy (main_app/media/serve.py)
+if settings.MEDIA_SERVE and settings.MEDIA_URL.startswith('/'):
+    urlpatterns.append(
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media')
+    )
 
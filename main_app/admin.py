@@ -1,7 +1,17 @@
 from django.contrib import admin
-from .models import WorkoutPlan, Post, Comment, UserProfile
+from .models import (
+    WorkoutPlan, Post, Comment, UserProfile, ChatMessage,
+    CatalogVideo, GymEquipment, ExerciseImage, SafetyAlert, MediaBlob, MediaUpload,
+)
 
 admin.site.register(WorkoutPlan)
 admin.site.register(Post)
 admin.site.register(Comment)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
+admin.site.register(ChatMessage)
+admin.site.register(CatalogVideo)
+admin.site.register(GymEquipment)
+admin.site.register(ExerciseImage)
+admin.site.register(SafetyAlert)
+admin.site.register(MediaBlob)
+admin.site.register(MediaUpload)
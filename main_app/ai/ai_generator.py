@@ -1,8 +1,10 @@
+import logging
 import os
+import time
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.response import Response
-import requests
 
 from ..models import UserProfile
 from .disabilities import (
@@ -54,6 +56,7 @@ from .inactivity import (
 from .utils import (
     detect_emotion,
     detect_language,
+    estimate_tokens,
     extract_profile_data,
     extract_response_text,
 )
@@ -76,11 +79,32 @@ from .workouts import (
     should_offer_adaptive_plan,
     should_suggest_image,
 )
+from . import metrics
+from .call_log import context_hash, log_call
+from .client import CircuitOpenError, UpstreamError, get_client
+from .coalesce import SingleFlight, request_key
+from .fast_path import answer_locally
+from .history import pack_history, record_exchange
+from .retrieval import select_relevant_guidance
+from .routing import select_route
+from .tracing import StageTimer
+from .semantic_cache import (
+    RESPONSE_CACHE,
+    anonymize_reply,
+    goal_group,
+    is_cacheable,
+    personalize_reply,
+    profile_bucket,
+)
 from .prompts import SYSTEM_PROMPT
 
 
+logger = logging.getLogger(__name__)
+
 USER_BEHAVIOR_STATE = {}
 
+IN_FLIGHT_REQUESTS = SingleFlight(result_ttl=getattr(settings, 'AI_RESULT_CACHE_TTL', 10))
+
 
 class _AIRequest:
     def __init__(self, user, data):
@@ -96,12 +120,14 @@ class AIEngine:
         self.user_message = user_message
         self.request_data = request_data or {}
         self.current_time = timezone.now()
+        self.timer = StageTimer()
         
         # Get user profile
-        try:
-            profile = UserProfile.objects.get(user=user)
-        except UserProfile.DoesNotExist:
-            raise ValueError('Profile not found. Please complete your profile first.')
+        with self.timer.span('profile_query'):
+            try:
+                profile = UserProfile.objects.get(user=user)
+            except UserProfile.DoesNotExist:
+                raise ValueError('Profile not found. Please complete your profile first.')
         
         self.profile_data = extract_profile_data(profile)
         self.user_name = self.profile_data.get('name') or user.username
@@ -118,11 +144,13 @@ class AIEngine:
         self.progress = self.state.get('adjusted_progress', self.base_progress)
         
         # Detect language and emotion
-        self.language = detect_language(user_message)
-        self.emotion = detect_emotion(user_message)
+        with self.timer.span('detectors'):
+            self.language = detect_language(user_message)
+            self.emotion = detect_emotion(user_message)
         
         # Fetch last workout timestamp
-        last_workout_ts = get_last_workout_timestamp(user)
+        with self.timer.span('last_workout_query'):
+            last_workout_ts = get_last_workout_timestamp(user)
         if last_workout_ts:
             self.state['last_workout_logged'] = last_workout_ts
         else:
@@ -130,7 +158,35 @@ class AIEngine:
         self.last_workout_ts = last_workout_ts
         
         # Update behavior state
-        update_behavior_state(self.state, user_message, self.emotion, self.current_time)
+        with self.timer.span('detectors'):
+            update_behavior_state(self.state, user_message, self.emotion, self.current_time)
+        
+        # Per-section prompt sizes, filled by build_context/generate
+        self.prompt_sizes = {}
+        
+        # Filled by build_context for the local fast path
+        self.equipment_key = None
+        self.video_recommendation = None
+        
+        # Set by build_context when the prompt carries user-specific plans,
+        # progress or media picks; such turns bypass the semantic cache
+        self.personalised_context = False
+        self.notifications = []
+        # Prompt for cacheable turns, built by build_context from the coarse profile
+        # fields only, so the reply can be shared by everyone in the cache bucket
+        self.shared_context = None
+        # Prior turns sent with the prompt (never with the shared context)
+        self.history = []
+        
+        # Which tier served the reply ('local', 'cache' or 'llm') and the local rule that matched
+        self.tier = None
+        self.local_intent = None
+        self.route = None
+        
+        # Filled by generate for the call log
+        self.context_hash = None
+        self.usage = None
+        self.reply = None
     
     def _get_user_state(self, user_id):
         """Get or initialize user behavior state"""
@@ -199,7 +255,7 @@ class AIEngine:
                     'days_postpartum': None,
                     'stage': None,
                 },
-                'used_videos': [],
+                'used_video_bits': 0,
             }
             USER_BEHAVIOR_STATE[user_id] = state
         return state
@@ -457,6 +513,7 @@ class AIEngine:
             disability_context = build_disability_adaptive_context(
                 disability_info, self.profile_data, self.metrics, self.language
             )
+            disability_context = select_relevant_guidance(disability_context, self.user_message)
             if disability_context:
                 disability_text = safe_str(disability_context)
         
@@ -548,6 +605,7 @@ class AIEngine:
         
         if pregnancy_mode.get('enabled', False) and pregnancy_mode.get('trimester'):
             pregnancy_context = build_pregnancy_mode_context(pregnancy_mode, self.profile_data, self.metrics, self.language)
+            pregnancy_context = select_relevant_guidance(pregnancy_context, self.user_message)
             if pregnancy_context:
                 if pregnancy_text:
                     pregnancy_text += "\n" + safe_str(pregnancy_context)
@@ -604,6 +662,7 @@ class AIEngine:
         
         if postpartum_mode.get('enabled', False) and postpartum_mode.get('phase'):
             postpartum_context = build_postpartum_mode_context(postpartum_mode, self.profile_data, self.metrics, self.language)
+            postpartum_context = select_relevant_guidance(postpartum_context, self.user_message)
             if postpartum_context:
                 if pregnancy_text:
                     pregnancy_text += "\n" + safe_str(postpartum_context)
@@ -657,6 +716,7 @@ class AIEngine:
         
         if diastasis_mode.get('enabled', False) and diastasis_mode.get('stage'):
             diastasis_context = build_diastasis_mode_context(diastasis_mode, self.profile_data, self.metrics, self.language)
+            diastasis_context = select_relevant_guidance(diastasis_context, self.user_message)
             if diastasis_context:
                 if pregnancy_text:
                     pregnancy_text += "\n" + safe_str(diastasis_context)
@@ -666,8 +726,9 @@ class AIEngine:
         # Equipment context
         if detect_gym_equipment_request(self.user_message, self.request_data):
             equipment_key = recognize_equipment_from_text(self.user_message)
+            self.equipment_key = equipment_key
             if equipment_key:
-                equipment_context = build_equipment_instructions_context(equipment_key, self.language)
+                equipment_context = build_equipment_instructions_context(equipment_key, self.language, self.user_message)
                 if equipment_context:
                     workout_text = safe_str(equipment_context)
         
@@ -677,6 +738,7 @@ class AIEngine:
                 self.profile_data, self.metrics, self.state, self.last_workout_ts, self.current_time, self.language, self._calculate_progress
             )
             if adaptive_context:
+                self.personalised_context = True
                 if workout_text:
                     workout_text += "\n" + safe_str(adaptive_context)
                 else:
@@ -720,6 +782,7 @@ class AIEngine:
             else:
                 video = get_video_recommendation(self.state, self.profile_data, self.language)
             
+            self.video_recommendation = video
             if video:
                 video_info = format_video_info(video, self.language)
                 if video_info:
@@ -755,9 +818,31 @@ class AIEngine:
         
         # Notifications
         notifications = generate_notifications(self.state, self.current_time)
+        self.notifications = notifications
         if notifications:
             notifications_text = f"System reminders: {', '.join([safe_str(n) for n in notifications])}"
         
+        # Record per-section sizes for prompt accounting
+        sections = {
+            'profile': profile_text,
+            'detected_factors': detected_factors_text,
+            'workout': workout_text,
+            'nutrition': nutrition_text,
+            'pregnancy': pregnancy_text,
+            'disability': disability_text,
+            'inactivity': inactivity_text,
+            'video': video_text,
+            'image': image_text,
+            'notifications': notifications_text,
+            'message': safe_str(self.user_message),
+        }
+        for name, text in sections.items():
+            self._record_prompt_size(name, text)
+        self.personalised_context = self.personalised_context or bool(
+            progress_adjustment_lines or nutrition_text or pregnancy_text or disability_text
+            or inactivity_text or video_text or image_text
+        )
+        
         # Build final context string - ALWAYS return a string
         final_parts = []
         if profile_text:
@@ -783,34 +868,65 @@ class AIEngine:
         
         final_parts.append(f"User message: {safe_str(self.user_message)}")
         
+        # Cacheable turns carry nothing beyond the semantic cache bucket fields
+        shared_profile = "\n".join([
+            f"Goal: {goal_group(self.profile_data.get('goal'))}",
+            f"BMI category: {safe_str(self.metrics.get('bmi_category') or 'unknown')}",
+        ])
+        self.shared_context = "\n\n".join(
+            [f"User profile:\n{shared_profile}"]
+            + [part for part in final_parts if not part.startswith(("User profile:", "Detected factors:"))]
+        )
+        
         # Join all parts and return as single string
         return "\n\n".join(final_parts)
     
-    def generate(self):
-        """Generate AI response by calling OpenAI API"""
-        # Build context
-        context = self.build_context()
-        
+    def _record_prompt_size(self, section, text):
+        """Track characters and estimated tokens for one prompt section"""
+        self.prompt_sizes[section] = {
+            'chars': len(text or ''),
+            'tokens': estimate_tokens(text),
+        }
+    
+    def _report_prompt_sizes(self):
+        """Log the prompt breakdown and feed the prompt size histograms"""
+        for section, size in self.prompt_sizes.items():
+            metrics.observe('ai_prompt_chars', size['chars'], section=section)
+            metrics.observe('ai_prompt_tokens', size['tokens'], section=section)
+        total_tokens = sum(size['tokens'] for size in self.prompt_sizes.values())
+        metrics.observe('ai_prompt_tokens_total', total_tokens)
+        logger.info(
+            'AI prompt size user=%s total_tokens=%s sections=%s',
+            self.user.id,
+            total_tokens,
+            ' '.join(f"{name}={size['tokens']}" for name, size in self.prompt_sizes.items() if size['chars']),
+        )
+    
+    def _call_model(self, context):
+        """Send the prompt upstream and return the reply text"""
         # Get API key
         api_key = os.environ.get('OPENAI_API_KEY', '').strip().strip('"').strip("'")
         if not api_key or api_key == 'your-openai-api-key-here' or api_key == 'your-openai-api-key':
             raise ValueError('OpenAI API key is not configured')
         
-        # Replace user name placeholder in system prompt
-        system_prompt_filled = SYSTEM_PROMPT.replace("{{user_name}}", self.user_name)
+        # Static system prompt first so every request shares a byte-identical,
+        # provider-cacheable prefix; everything per-user (name, profile, modes)
+        # lives in the context built above.
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": context})
         
-        # Build messages array
-        messages = [
-            {"role": "system", "content": system_prompt_filled},
-            {"role": "user", "content": context},
-        ]
+        self._record_prompt_size('system', SYSTEM_PROMPT)
+        self._record_prompt_size('history', "\n".join(message['content'] for message in self.history))
+        self._report_prompt_sizes()
         
-        # Call OpenAI API
+        # Call OpenAI API with the model/output budget routed for this turn
+        self.route = select_route(self.user_message, self.state)
         payload = {
-            "model": "gpt-4.1",
+            "model": self.route['model'],
             "input": messages,
             "temperature": 0.7,
-            "max_output_tokens": 400,
+            "max_output_tokens": self.route['max_output_tokens'],
         }
         
         headers = {
@@ -818,38 +934,98 @@ class AIEngine:
             "Content-Type": "application/json",
         }
         
+        started = time.monotonic()
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/responses",
-                headers=headers,
-                json=payload,
-                timeout=30,
-            )
-        except requests.RequestException as exc:
-            raise Exception(f'OpenAI API request failed: {exc}')
-        
-        if response.status_code >= 400:
-            try:
-                error_data = response.json()
-                error_message = error_data.get('error', {}).get('message', response.text) if isinstance(error_data, dict) else response.text
-            except:
-                error_message = response.text
-            
-            raise Exception(f'OpenAI API error (Status {response.status_code}): {error_message[:500]}')
-        
-        try:
-            completion = response.json()
-        except ValueError:
-            raise Exception('Invalid response from OpenAI')
+            with self.timer.span('upstream'):
+                completion = get_client().post(payload, headers)
+        finally:
+            metrics.observe('ai_route_latency_ms', (time.monotonic() - started) * 1000, route=self.route['name'])
+        metrics.increment('ai_route_requests', route=self.route['name'], model=self.route['model'])
+        self.usage = completion.get('usage')
         
         content = extract_response_text(completion).strip()
         if not content:
-            raise Exception('Empty response from OpenAI')
+            raise UpstreamError('Empty response from OpenAI')
+        return content
+    
+    def _answer_from_cache_or_model(self, context):
+        """Reuse a cached reply to a near-identical question, else call upstream and cache it"""
+        cacheable = getattr(settings, 'AI_SEMANTIC_CACHE_ENABLED', True) and is_cacheable(self)
+        if not cacheable:
+            metrics.increment('ai_semantic_cache', outcome='bypass')
+            self.tier = 'llm'
+            with self.timer.span('history'):
+                self.history = pack_history(self.user)
+            return self._call_model(context)
+        
+        bucket = profile_bucket(self)
+        with self.timer.span('semantic_cache'):
+            cached, similarity = RESPONSE_CACHE.lookup(bucket, self.user_message)
+        if cached is not None:
+            metrics.increment('ai_semantic_cache', outcome='hit')
+            metrics.observe('ai_semantic_cache_similarity', similarity)
+            self.tier = 'cache'
+            return personalize_reply(cached, self.user_name)
+        
+        metrics.increment('ai_semantic_cache', outcome='miss')
+        self.tier = 'llm'
+        # A standalone question: answered without name, numbers or history so any bucket member can reuse it
+        content = self._call_model(self.shared_context)
+        RESPONSE_CACHE.store(bucket, self.user_message, anonymize_reply(content, self.user_name))
+        return content
+    
+    def generate(self):
+        """Generate AI response, answering locally when a deterministic rule matches"""
+        error = None
+        try:
+            return self._generate()
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self._report_stages()
+            log_call(self, error)
+    
+    def _report_stages(self):
+        """Structured log line with this request's stage timings"""
+        stages = self.timer.log_fields()
+        logger.info(
+            'AI stages user=%s tier=%s %s',
+            self.user.id,
+            self.tier,
+            ' '.join(f'{name}={elapsed}ms' for name, elapsed in stages.items()),
+            extra={'ai_user_id': self.user.id, 'ai_tier': self.tier, 'ai_stages_ms': stages},
+        )
+    
+    def _generate(self):
+        # Build context
+        with self.timer.span('build_context'):
+            context = self.build_context()
+        self.context_hash = context_hash(context)
+        
+        # Local tier first: canned safety alerts, equipment how-tos and video lookups
+        # need no upstream round trip
+        local_answer = None
+        if getattr(settings, 'AI_LOCAL_FAST_PATH', True):
+            with self.timer.span('local_fast_path'):
+                local_answer = answer_locally(self)
+        if local_answer:
+            self.tier = 'local'
+            self.local_intent, content = local_answer
+        else:
+            content = self._answer_from_cache_or_model(context)
+        metrics.increment('ai_responses', tier=self.tier)
         
         # Format for accessibility if needed
         accessibility_mode = self.state.get('accessibility_mode', {})
         if accessibility_mode.get('enabled', False) and accessibility_mode.get('voice_friendly', False):
-            content = format_voice_friendly_response(content)
+            with self.timer.span('voice_format'):
+                content = format_voice_friendly_response(content)
+        
+        # Persist the turn so the next request has history
+        with self.timer.span('record_exchange'):
+            record_exchange(self.user, self.user_message, content)
+        self.reply = content
         
         # Update state
         self.state['last_interaction'] = self.current_time
@@ -870,36 +1046,62 @@ class _OpenAIHandler:
         if not user_message:
             return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            engine = AIEngine(request.user, user_message, data)
-            content = engine.generate()
-        except ValueError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
-        
-        # Build response data
-        response_data = {'message': content}
-        
-        # Add mode flags if active
-        state = engine.state
-        if state.get('accessibility_mode', {}).get('enabled', False):
-            response_data['accessibility_mode'] = True
-            response_data['visual_impairment'] = state['accessibility_mode'].get('visual_impairment', 'none')
-        
-        if state.get('deaf_mode', {}).get('enabled', False):
-            response_data['deaf_mode'] = True
-            response_data['hearing_impairment'] = state['deaf_mode'].get('hearing_impairment', 'none')
-        
-        if state.get('postpartum_mode', {}).get('enabled', False):
-            response_data['postpartum_mode'] = True
-            response_data['phase'] = state['postpartum_mode'].get('phase')
-        
-        if state.get('diastasis_mode', {}).get('enabled', False):
-            response_data['diastasis_mode'] = True
-            response_data['stage'] = state['diastasis_mode'].get('stage')
-        
-        return Response(response_data, status=status.HTTP_200_OK)
+        response_data, status_code, headers = coalesced_ai_request(request.user, user_message, data)
+        return Response(dict(response_data), status=status_code, headers=headers)
+
+
+def coalesced_ai_request(user, user_message, data):
+    """run_ai_request, shared between identical concurrent submissions (double taps, client retries)"""
+    key = request_key(user.id, user_message, data)
+    result, shared = IN_FLIGHT_REQUESTS.do(
+        key,
+        lambda: run_ai_request(user, user_message, data),
+        cache_if=lambda result: result[1] == status.HTTP_200_OK,
+    )
+    if shared:
+        metrics.increment('ai_coalesced_requests')
+    return result
+
+
+def run_ai_request(user, user_message, data):
+    """Build the engine, call upstream and return (response_data, status_code, headers)"""
+    try:
+        engine = AIEngine(user, user_message, data)
+        content = engine.generate()
+    except ValueError as e:
+        return {'error': str(e)}, status.HTTP_400_BAD_REQUEST, None
+    except CircuitOpenError as e:
+        return {'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        return {'error': str(e)}, status.HTTP_502_BAD_GATEWAY, None
+    
+    # Build response data
+    response_data = {'message': content, 'tier': engine.tier}
+    if engine.local_intent:
+        response_data['local_intent'] = engine.local_intent
+    
+    # Add mode flags if active
+    state = engine.state
+    if state.get('accessibility_mode', {}).get('enabled', False):
+        response_data['accessibility_mode'] = True
+        response_data['visual_impairment'] = state['accessibility_mode'].get('visual_impairment', 'none')
+    
+    if state.get('deaf_mode', {}).get('enabled', False):
+        response_data['deaf_mode'] = True
+        response_data['hearing_impairment'] = state['deaf_mode'].get('hearing_impairment', 'none')
+    
+    if state.get('postpartum_mode', {}).get('enabled', False):
+        response_data['postpartum_mode'] = True
+        response_data['phase'] = state['postpartum_mode'].get('phase')
+    
+    if state.get('diastasis_mode', {}).get('enabled', False):
+        response_data['diastasis_mode'] = True
+        response_data['stage'] = state['diastasis_mode'].get('stage')
+    
+    headers = None
+    if getattr(settings, 'AI_SERVER_TIMING', False):
+        headers = {'Server-Timing': engine.timer.server_timing()}
+    return response_data, status.HTTP_200_OK, headers
 
 
 def generate_ai_response(user, message, request_data):
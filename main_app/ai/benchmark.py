@@ -0,0 +1,260 @@
+"""Offline load benchmark for the AI chat endpoint.
+
+Drives OpenAIView in-process with a mix of Arabic and English messages
+against the local fake upstream (fake_upstream.FakeUpstream) and reports
+end-to-end latency percentiles, throughput, and how request time splits
+between build_context and the upstream call. replay_call_log sends
+captured traffic (call_log.py) the same way, paced at a fixed rate or at
+the recorded spacing.
+"""
+
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ..models import UserProfile
+from ..views import OpenAIView
+from . import metrics
+from .client import reset_client
+from .fake_upstream import FakeUpstream
+from .tracing import STAGE_METRIC
+
+
+BENCH_USERNAME_PREFIX = 'ai_bench_'
+
+DEFAULT_MESSAGES = [
+    'hi coach',
+    'how do I use the leg press?',
+    'give me a 20 minute home workout for fat loss',
+    'what should I eat after training?',
+    'I feel tired today, should I still train?',
+    'كيف استخدم جهاز ضغط الأرجل؟',
+    'ابغى خطة تمارين للبيت ٣ أيام بالأسبوع',
+    'وش آكل بعد التمرين؟',
+    'تعبانة اليوم، أتمرن ولا أرتاح؟',
+    'give me a workout video',
+]
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 2)
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def get_bench_users(count):
+    """Create (or reuse) profiled benchmark users; returns (users, pks of the users created here)"""
+    users, created_pks = [], []
+    for index in range(count):
+        user, created = User.objects.get_or_create(username=f'{BENCH_USERNAME_PREFIX}{index}')
+        UserProfile.objects.get_or_create(user=user, defaults={
+            'height': 165, 'age': 30, 'current_weight': 72.0, 'target_weight': 64.0,
+            'goal': 'Lose weight', 'activity_level': 'Moderate',
+        })
+        users.append(user)
+        if created:
+            created_pks.append(user.pk)
+    return users, created_pks
+
+
+def delete_bench_users(pks):
+    """Delete the benchmark users created by a run; accounts that already existed are left alone"""
+    return User.objects.filter(pk__in=pks, username__startswith=BENCH_USERNAME_PREFIX).delete()[0]
+
+
+def _send_all(plan, concurrency, offsets=None):
+    """POST each (user, message, data) to OpenAIView; returns [(latency_ms, status_code)] and elapsed seconds.
+
+    With offsets, request i is sent offsets[i] seconds after the start.
+    """
+    view = OpenAIView.as_view()
+    factory = APIRequestFactory()
+
+    def send(item):
+        user, message, data = item
+        request = factory.post('/api/openai/', dict(data, message=message), format='json')
+        force_authenticate(request, user=user)
+        started = time.monotonic()
+        try:
+            response = view(request)
+        finally:
+            close_old_connections()
+        return (time.monotonic() - started) * 1000, response.status_code
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-bench') as pool:
+            if offsets is None:
+                results = list(pool.map(send, plan))
+            else:
+                futures = []
+                for item, offset in zip(plan, offsets):
+                    delay = started + offset - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(pool.submit(send, item))
+                results = [future.result() for future in futures]
+    finally:
+        elapsed = time.monotonic() - started
+    return results, elapsed
+
+
+def _report(results, elapsed, concurrency, upstream_requests):
+    latencies = [latency for latency, _ in results]
+    status_counts = {}
+    for _, status_code in results:
+        status_counts[status_code] = status_counts.get(status_code, 0) + 1
+
+    histograms = metrics.snapshot()['histograms']
+    build_context = histograms.get(f'{STAGE_METRIC}{{stage=build_context}}', {})
+    upstream = histograms.get(f'{STAGE_METRIC}{{stage=upstream}}', {})
+    total_ms = sum(latencies) or 1.0
+
+    errors = sum(count for status_code, count in status_counts.items() if status_code >= 400)
+
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'status_counts': status_counts,
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'upstream_requests': upstream_requests,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95),
+            'p99': _percentile(latencies, 99),
+            'max': round(max(latencies), 2) if latencies else None,
+        },
+        'build_context_ms': {
+            'p50': _round(build_context.get('p50')),
+            'p95': _round(build_context.get('p95')),
+            'total': _round(build_context.get('sum', 0)),
+            'share': round(build_context.get('sum', 0) / total_ms, 3),
+        },
+        'upstream_ms': {
+            'p50': _round(upstream.get('p50')),
+            'p95': _round(upstream.get('p95')),
+            'total': _round(upstream.get('sum', 0)),
+            'share': round(upstream.get('sum', 0) / total_ms, 3),
+        },
+    }
+
+
+def run_benchmark(total_requests=200, concurrency=8, users=4, messages=None, with_caches=False,
+                  latency_ms=200, jitter_ms=50, error_rate=0.0, seed=None, keep_users=False):
+    """Run the benchmark and return a report dict.
+
+    Caches (semantic cache, local fast path, retry of identical submissions)
+    are disabled unless ``with_caches`` is set, so every request goes through
+    build_context and the fake upstream; each request also gets a unique
+    suffix so identical submissions are not coalesced. Benchmark users created
+    by the run are deleted afterwards unless ``keep_users`` is set.
+    """
+    messages = messages or DEFAULT_MESSAGES
+
+    with FakeUpstream(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed) as fake:
+        overrides = {
+            'OPENAI_API_URL': fake.url,
+            'AI_MAX_RETRIES': 0,
+            'AI_HEDGE_PERCENTILE': None,
+            'AI_THROTTLE_ENABLED': False,
+        }
+        if not with_caches:
+            overrides.update(AI_SEMANTIC_CACHE_ENABLED=False, AI_LOCAL_FAST_PATH=False)
+        env = {'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY') or 'sk-benchmark'}
+
+        with override_settings(**overrides), mock.patch.dict(os.environ, env):
+            reset_client()
+            metrics.reset()
+            bench_users, created_pks = get_bench_users(users)
+            plan = [
+                (bench_users[index % len(bench_users)], message if with_caches else f'{message} ({index})', {})
+                for index, message in zip(range(total_requests), itertools.cycle(messages))
+            ]
+            try:
+                results, elapsed = _send_all(plan, concurrency)
+            finally:
+                reset_client()
+                if not keep_users:
+                    delete_bench_users(created_pks)
+        upstream_requests = fake.requests
+
+    return _report(results, elapsed, concurrency, upstream_requests)
+
+
+def _replay_offsets(records, rate, speed):
+    """Send times (seconds from start) for records: fixed rate, recorded spacing / speed, or None for no pacing"""
+    if rate:
+        return [index / rate for index in range(len(records))]
+    if not speed:
+        return None
+    stamps = [datetime.fromisoformat(record['ts']).timestamp() for record in records]
+    first = min(stamps, default=0)
+    return [(stamp - first) / speed for stamp in stamps]
+
+
+def _replayable_data(record):
+    # Replays are answered inline, never as background jobs
+    data = record.get('request_data') or {}
+    return {key: value for key, value in data.items() if key not in ('message', 'async')}
+
+
+def replay_call_log(records, rate=None, speed=1.0, concurrency=8, upstream_url=None,
+                    latency_ms=200, jitter_ms=50, error_rate=0.0, seed=None, keep_users=False):
+    """Replay captured chat calls and return a benchmark-style report.
+
+    Each recorded user is mapped to a benchmark user so real conversations are
+    not touched. Requests go to the fake upstream unless ``upstream_url`` is
+    given ('real' uses OPENAI_API_URL). Rate limiting is off; caches stay as
+    configured so the replay sees the same tiers as production. Benchmark
+    users created by the replay are deleted afterwards unless ``keep_users``.
+    """
+    records = sorted(records, key=lambda record: record['ts'])
+    user_ids = sorted({record['user_id'] for record in records}, key=str)
+    offsets = _replay_offsets(records, rate, speed)
+
+    fake = None
+    if upstream_url is None:
+        fake = FakeUpstream(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed).start()
+        upstream_url = fake.url
+    elif upstream_url == 'real':
+        upstream_url = settings.OPENAI_API_URL
+
+    env = {'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY') or 'sk-benchmark'} if fake else {}
+    try:
+        with override_settings(OPENAI_API_URL=upstream_url, AI_THROTTLE_ENABLED=False), mock.patch.dict(os.environ, env):
+            reset_client()
+            metrics.reset()
+            users, created_pks = get_bench_users(len(user_ids))
+            bench_users = dict(zip(user_ids, users))
+            plan = [
+                (bench_users[record['user_id']], record['message'], _replayable_data(record))
+                for record in records
+            ]
+            try:
+                results, elapsed = _send_all(plan, concurrency, offsets)
+            finally:
+                reset_client()
+                if not keep_users:
+                    delete_bench_users(created_pks)
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    return _report(results, elapsed, concurrency, fake.requests if fake else None)
@@ -0,0 +1,217 @@
+"""Append-only log of AI chat calls, for replay and regression/load testing.
+
+Every AIEngine.generate call queues one record (message, request data,
+context hash, detected flags, route, latency, stage timings, token usage and
+reply). A background thread appends the records as JSON lines to gzip files
+in AI_CALL_LOG_DIR, one file per process at a time, starting a new file once
+AI_CALL_LOG_MAX_BYTES of JSON has been written and keeping the newest
+AI_CALL_LOG_BACKUPS files. Rotation never removes any process's newest file,
+which may still be open for writing. The request path only puts a dict on a bounded
+queue; when the writer falls behind, records are dropped and counted.
+
+``manage.py replay_ai_log`` reads the files back with read_call_log.
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .routing import active_modes
+
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = 'ai-calls-'
+FILE_SUFFIX = '.jsonl.gz'
+
+
+def context_hash(context):
+    return hashlib.sha256((context or '').encode('utf-8')).hexdigest()[:16]
+
+
+def build_record(engine, error=None):
+    """JSON-safe record of one generate call"""
+    route = engine.route or {}
+    usage = engine.usage or {}
+    return {
+        'ts': engine.current_time.isoformat(),
+        'user_id': engine.user.id,
+        'message': engine.user_message,
+        'request_data': json.loads(json.dumps(engine.request_data, default=str)),
+        'context_hash': engine.context_hash,
+        'language': engine.language,
+        'emotion': engine.emotion,
+        'modes': active_modes(engine.state),
+        'tier': engine.tier,
+        'local_intent': engine.local_intent,
+        'model': route.get('model'),
+        'route': route.get('name'),
+        'latency_ms': round(engine.timer.total_ms(), 2),
+        'stages_ms': engine.timer.log_fields(),
+        'input_tokens': usage.get('input_tokens'),
+        'output_tokens': usage.get('output_tokens'),
+        'reply': engine.reply,
+        'error': str(error) if error is not None else None,
+    }
+
+
+class CallLogWriter:
+    """Bounded queue drained by a daemon thread into rotating gzip JSONL files"""
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, backups=20, queue_size=10000, flush_interval=1.0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._written = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, record):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment('ai_call_log_dropped')
+
+    def flush(self, timeout=5.0, close=False):
+        """Block until every queued record is on disk; close also ends the gzip file"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put((done, close), timeout=timeout)
+        done.wait(timeout)
+
+    def close(self):
+        self.flush(close=True)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ai-call-log', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._sync()
+                continue
+            if isinstance(item, tuple):
+                done, close = item
+                self._sync()
+                if close and self._file is not None:
+                    self._file.close()
+                    self._file = None
+                done.set()
+                continue
+            try:
+                self._write(item)
+            except Exception:
+                logger.exception('AI call log write failed')
+                metrics.increment('ai_call_log_errors')
+
+    def _write(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        if self._file is None or self._written + len(line) > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._written += len(line)
+        metrics.increment('ai_call_log_records')
+
+    def _sync(self):
+        # Readers of the active file see every record up to the last sync
+        if self._file is not None:
+            self._file.flush()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(dt_timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        path = self.directory / f'{FILE_PREFIX}{stamp}-{os.getpid()}{FILE_SUFFIX}'
+        self._file = gzip.open(path, 'ab')
+        self._written = 0
+        # Every worker writes here: only files superseded by a newer one of the same pid are closed
+        files = log_files(self.directory)
+        newest = {_file_pid(path): path for path in files}
+        closed = [path for path in files if newest[_file_pid(path)] != path]
+        for old in closed[:max(0, len(files) - max(1, self.backups))]:
+            old.unlink(missing_ok=True)
+
+
+def log_files(directory):
+    """Call log files in directory, oldest first"""
+    return sorted(Path(directory).glob(f'{FILE_PREFIX}*{FILE_SUFFIX}'))
+
+
+def _file_pid(path):
+    return path.name[:-len(FILE_SUFFIX)].rsplit('-', 1)[-1]
+
+
+def read_call_log(paths):
+    """Yield records from call log files or directories, oldest file first.
+
+    A file still being written may end in a partial gzip block; reading stops
+    at the last complete record.
+    """
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(log_files(path) if path.is_dir() else [path])
+    for path in files:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as handle:
+                for line in handle:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            logger.warning('AI call log file ends early path=%s', path)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """This process's writer, or None when AI_CALL_LOG_DIR is unset"""
+    global _writer
+    directory = getattr(settings, 'AI_CALL_LOG_DIR', None)
+    if not directory:
+        return None
+    with _writer_lock:
+        if _writer is None or _writer.directory != Path(directory):
+            _writer = CallLogWriter(
+                directory,
+                max_bytes=getattr(settings, 'AI_CALL_LOG_MAX_BYTES', 50 * 1024 * 1024),
+                backups=getattr(settings, 'AI_CALL_LOG_BACKUPS', 20),
+                queue_size=getattr(settings, 'AI_CALL_LOG_QUEUE_SIZE', 10000),
+            )
+        return _writer
+
+
+def log_call(engine, error=None):
+    """Queue a record of this generate call; never raises into the request"""
+    writer = get_writer()
+    if writer is None:
+        return
+    try:
+        writer.submit(build_record(engine, error))
+    except Exception:
+        logger.exception('AI call log record failed user=%s', engine.user.id)
@@ -0,0 +1,361 @@
+"""AI coach catalog: videos, gym equipment, exercise images and safety alerts.
+
+The catalog lives in the database (CatalogVideo, GymEquipment, ExerciseImage,
+SafetyAlert) and is loaded from prompts.py by ``manage.py load_ai_catalog``.
+Each worker keeps an immutable in-memory snapshot and only reloads it when
+CatalogVersion changes; until the catalog is loaded the prompts.py data is
+served directly. Signal handlers bump the version whenever a catalog row is
+saved or deleted, including admin bulk deletes. QuerySet.update() and
+bulk_create() bypass the signals; code that writes that way
+(load_catalog_from_python) calls CatalogVersion.bump() itself.
+
+Videos are indexed by collection, difficulty, tag, captions, condition and
+trainer as int bitmasks over video ids, and each user's already-recommended
+videos are a bitmask in their behaviour state, so a non-repeating filtered
+pick is a few AND/OR operations instead of a scan of every list.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from ..models import CatalogVersion, CatalogVideo, ExerciseImage, GymEquipment, SafetyAlert
+from . import metrics
+from .prompts import (
+    ADAPTIVE_EXERCISE_IMAGES,
+    ADAPTIVE_VIDEOS,
+    DIASTASIS_SAFETY_ALERTS,
+    DIASTASIS_VIDEOS,
+    EXERCISE_IMAGES,
+    EXERCISE_VIDEOS,
+    GYM_EQUIPMENT,
+    GYM_EQUIPMENT_VIDEOS,
+    POSTPARTUM_SAFETY_ALERTS,
+    POSTPARTUM_VIDEOS,
+    PREGNANCY_SAFETY_ALERTS,
+    PREGNANCY_VIDEOS,
+)
+from .utils import normalize_message
+
+
+USED_VIDEOS_STATE_KEY = 'used_video_bits'
+# Title masks kept per catalog snapshot (keys are free-text dislikes, least recently used evicted)
+TITLE_MASK_CACHE_SIZE = 256
+
+
+def _bits(mask):
+    """Ids of the set bits in mask"""
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+
+class VideoCatalog:
+    """Videos with inverted indexes stored as bitmasks over video ids"""
+
+    def __init__(self, collections):
+        self.videos = []
+        self.by_collection = defaultdict(int)
+        self.by_difficulty = defaultdict(int)
+        self.by_tag = defaultdict(int)
+        self.by_condition = defaultdict(int)
+        self.by_trainer = defaultdict(int)
+        self.captioned = 0
+        self._ids = {}
+        self._titles = []
+        self._title_masks = OrderedDict()
+        self._title_masks_lock = threading.Lock()
+
+        for collection, (videos, default_condition) in collections.items():
+            for video in videos:
+                bit = 1 << len(self.videos)
+                self._ids[id(video)] = len(self.videos)
+                self.videos.append(video)
+                self.by_collection[collection] |= bit
+                self.by_difficulty[(video.get('difficulty') or '').lower()] |= bit
+                self.by_condition[video.get('category') or default_condition] |= bit
+                if video.get('trainer'):
+                    self.by_trainer[video['trainer']] |= bit
+                self._titles.append(normalize_message(video.get('title')))
+                for word in normalize_message(f"{video.get('title', '')} {video.get('description', '')}").split():
+                    self.by_tag[word] |= bit
+                # Catalog entries are curated with captions unless marked otherwise
+                if video.get('captions', True):
+                    self.captioned |= bit
+
+    def mask(self, collection=None, difficulty=None, tag=None, condition=None, trainer=None, captions=False):
+        """AND of the given filters; a filter left as None matches everything"""
+        result = (1 << len(self.videos)) - 1
+        if collection is not None:
+            result &= self.by_collection.get(collection, 0)
+        if difficulty is not None:
+            result &= self.by_difficulty.get(difficulty.lower(), 0)
+        if tag is not None:
+            result &= self.by_tag.get(tag.lower(), 0)
+        if condition is not None:
+            conditions = [condition] if isinstance(condition, str) else condition
+            condition_mask = 0
+            for name in conditions:
+                condition_mask |= self.by_condition.get(name, 0)
+            result &= condition_mask
+        if trainer is not None:
+            result &= self.by_trainer.get(trainer, 0)
+        if captions:
+            result &= self.captioned
+        return result
+
+    def title_mask(self, text):
+        """Videos whose normalized title contains the whole normalized text as a substring"""
+        with self._title_masks_lock:
+            if text in self._title_masks:
+                self._title_masks.move_to_end(text)
+                return self._title_masks[text]
+
+        phrase = normalize_message(text)
+        result = 0
+        for video_id, title in enumerate(self._titles):
+            if phrase in title:
+                result |= 1 << video_id
+
+        with self._title_masks_lock:
+            self._title_masks[text] = result
+            if len(self._title_masks) > TITLE_MASK_CACHE_SIZE:
+                self._title_masks.popitem(last=False)
+        return result
+
+    def videos_in(self, mask):
+        return [self.videos[video_id] for video_id in _bits(mask)]
+
+    def id_of(self, video):
+        """Catalog id of a video dict from prompts.py, or None for an unknown dict"""
+        return self._ids.get(id(video))
+
+    def pick(self, state, candidates, repeat_by_trainer=False):
+        """Random candidate not yet shown to this user; starts over once all were shown.
+
+        The user's shown videos are kept in state[USED_VIDEOS_STATE_KEY] as a bitmask
+        (ids can shift when the catalog reloads, which only resets the rotation).
+        With repeat_by_trainer, every video by the picked trainer counts as shown.
+        """
+        if not candidates:
+            return None
+        used = state.get(USED_VIDEOS_STATE_KEY, 0)
+        available = candidates & ~used
+        if not available:
+            used &= ~candidates
+            available = candidates
+
+        video_id = random.choice(_bits(available))
+        selected = self.videos[video_id]
+        shown = 1 << video_id
+        if repeat_by_trainer and selected.get('trainer'):
+            shown |= self.by_trainer[selected['trainer']] & candidates
+        state[USED_VIDEOS_STATE_KEY] = used | shown
+        return selected
+
+
+# Collection -> condition used when a video has no category of its own
+COLLECTION_CONDITIONS = {
+    'general': 'general',
+    'adaptive': 'general',
+    'equipment': 'equipment',
+    'pregnancy': 'pregnancy',
+    'postpartum': 'postpartum',
+    'diastasis': 'diastasis',
+}
+
+PYTHON_VIDEOS = {
+    'general': EXERCISE_VIDEOS,
+    'adaptive': ADAPTIVE_VIDEOS,
+    'equipment': GYM_EQUIPMENT_VIDEOS,
+    'pregnancy': PREGNANCY_VIDEOS,
+    'postpartum': POSTPARTUM_VIDEOS,
+    'diastasis': DIASTASIS_VIDEOS,
+}
+
+PYTHON_SAFETY_ALERTS = {
+    'pregnancy': PREGNANCY_SAFETY_ALERTS,
+    'postpartum': POSTPARTUM_SAFETY_ALERTS,
+    'diastasis': DIASTASIS_SAFETY_ALERTS,
+}
+
+
+class CatalogSnapshot:
+    """Immutable view of one catalog version, shaped like the prompts.py data"""
+
+    def __init__(self, version, videos, gym_equipment, exercise_images, adaptive_images, safety_alerts):
+        self.version = version
+        self.videos = VideoCatalog({
+            collection: (videos.get(collection, []), condition)
+            for collection, condition in COLLECTION_CONDITIONS.items()
+        })
+        self.gym_equipment = gym_equipment
+        self.exercise_images = exercise_images
+        self.adaptive_images = adaptive_images
+        self.safety_alerts = safety_alerts
+
+
+def python_snapshot():
+    return CatalogSnapshot(
+        version=None,
+        videos=PYTHON_VIDEOS,
+        gym_equipment=GYM_EQUIPMENT,
+        exercise_images=EXERCISE_IMAGES,
+        adaptive_images=ADAPTIVE_EXERCISE_IMAGES,
+        safety_alerts=PYTHON_SAFETY_ALERTS,
+    )
+
+
+def database_snapshot(version):
+    """Read every catalog table once and build a snapshot"""
+    videos = defaultdict(list)
+    for row in CatalogVideo.objects.all():
+        video = {
+            'title': row.title,
+            'duration': row.duration,
+            'difficulty': row.difficulty,
+            'link': row.link,
+            'description': row.description,
+            'captions': row.captions,
+        }
+        if row.trainer:
+            video['trainer'] = row.trainer
+        if row.condition:
+            video['category'] = row.condition
+        videos[row.collection].append(video)
+
+    gym_equipment = {
+        row.key: {'name': row.name, 'name_ar': row.name_ar, 'instructions': row.instructions}
+        for row in GymEquipment.objects.all()
+    }
+
+    images = {'exercise': {}, 'adaptive': {}}
+    for row in ExerciseImage.objects.all():
+        images[row.kind][row.key] = {'name': row.name, 'url': row.url, 'description': row.description}
+
+    safety_alerts = {mode: {} for mode in PYTHON_SAFETY_ALERTS}
+    for row in SafetyAlert.objects.all():
+        safety_alerts[row.mode][row.key] = {
+            'ar': row.keyword_ar,
+            'en': row.keyword_en,
+            'response_ar': row.response_ar,
+            'response_en': row.response_en,
+        }
+
+    return CatalogSnapshot(version, videos, gym_equipment, images['exercise'], images['adaptive'], safety_alerts)
+
+
+_snapshot = None
+_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog():
+    """This worker's catalog snapshot, reloaded only when CatalogVersion changes.
+
+    The version row is checked at most every AI_CATALOG_CHECK_INTERVAL seconds.
+    """
+    global _snapshot, _checked_at
+    interval = getattr(settings, 'AI_CATALOG_CHECK_INTERVAL', 5)
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _checked_at < interval:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _checked_at < interval:
+            return _snapshot
+        version = CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = database_snapshot(version) if version else python_snapshot()
+            metrics.increment('ai_catalog_reloads')
+        _checked_at = time.monotonic()
+        return _snapshot
+
+
+def reset_catalog():
+    """Drop this worker's snapshot so the next call reloads (used by tests)"""
+    global _snapshot, _checked_at
+    with _snapshot_lock:
+        _snapshot = None
+        _checked_at = 0.0
+
+
+CATALOG_MODELS = (CatalogVideo, GymEquipment, ExerciseImage, SafetyAlert)
+
+
+def _bump_version(sender, **kwargs):
+    CatalogVersion.bump()
+
+
+def connect_signals():
+    for model in CATALOG_MODELS:
+        post_save.connect(_bump_version, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+        post_delete.connect(_bump_version, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
+
+
+@transaction.atomic
+def load_catalog_from_python():
+    """Replace the catalog tables with the prompts.py data; returns row counts"""
+    for model in CATALOG_MODELS:
+        model.objects.all().delete()
+
+    videos = CatalogVideo.objects.bulk_create([
+        CatalogVideo(
+            collection=collection,
+            title=video['title'],
+            trainer=video.get('trainer', ''),
+            duration=video.get('duration', ''),
+            difficulty=video.get('difficulty', ''),
+            link=video['link'],
+            description=video.get('description', ''),
+            condition=video.get('category', ''),
+            captions=video.get('captions', True),
+            position=position,
+        )
+        for collection, collection_videos in PYTHON_VIDEOS.items()
+        for position, video in enumerate(collection_videos)
+    ])
+    equipment = GymEquipment.objects.bulk_create([
+        GymEquipment(
+            key=key,
+            name=item['name'],
+            name_ar=item.get('name_ar', ''),
+            instructions=item['instructions'],
+            position=position,
+        )
+        for position, (key, item) in enumerate(GYM_EQUIPMENT.items())
+    ])
+    images = ExerciseImage.objects.bulk_create([
+        ExerciseImage(kind=kind, key=key, name=image['name'], url=image['url'], description=image.get('description', ''))
+        for kind, catalog in (('exercise', EXERCISE_IMAGES), ('adaptive', ADAPTIVE_EXERCISE_IMAGES))
+        for key, image in catalog.items()
+    ])
+    alerts = SafetyAlert.objects.bulk_create([
+        SafetyAlert(
+            mode=mode,
+            key=key,
+            keyword_ar=alert['ar'],
+            keyword_en=alert['en'],
+            response_ar=alert['response_ar'],
+            response_en=alert['response_en'],
+            position=position,
+        )
+        for mode, mode_alerts in PYTHON_SAFETY_ALERTS.items()
+        for position, (key, alert) in enumerate(mode_alerts.items())
+    ])
+
+    CatalogVersion.bump()
+    return {
+        'videos': len(videos),
+        'equipment': len(equipment),
+        'images': len(images),
+        'safety_alerts': len(alerts),
+    }
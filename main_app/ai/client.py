@@ -0,0 +1,291 @@
+"""Resilient HTTP client for the OpenAI Responses API.
+
+Wraps the upstream call with jittered exponential retries, a process-wide
+circuit breaker and optional hedged requests. The breaker sees one outcome per
+logical attempt, however many hedged requests it sent.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+
+from . import metrics
+
+
+DEFAULT_API_URL = "https://api.openai.com/v1/responses"
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+LATENCY_METRIC = 'ai_upstream_latency_ms'
+
+
+class UpstreamError(Exception):
+    """The upstream model API failed or returned an unusable response"""
+
+    def __init__(self, message, status_code=None, retryable=False, upstream_healthy=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        # A non-retryable 4xx: upstream answered, so the breaker counts it as a success
+        self.upstream_healthy = upstream_healthy
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__('AI service is temporarily unavailable. Please try again shortly.')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may go upstream now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until the breaker will let a probe through"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 1
+            remaining = self.reset_timeout - (self.clock() - self.opened_at)
+            return max(1, int(remaining + 0.999))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.increment('ai_circuit_opened')
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self._probe_in_flight = False
+
+
+class OpenAIClient:
+    """POST JSON payloads upstream with retries, circuit breaking and hedging"""
+
+    def __init__(
+        self,
+        url=DEFAULT_API_URL,
+        timeout=30,
+        max_retries=2,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        breaker=None,
+        hedge_percentile=None,
+        hedge_min_samples=20,
+        sleep=time.sleep,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.sleep = sleep
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def post(self, payload, headers):
+        """Return the decoded JSON body of a successful upstream call"""
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                metrics.increment('ai_circuit_rejected')
+                raise CircuitOpenError(self.breaker.retry_after())
+            try:
+                return self._hedged_call(payload, headers)
+            except UpstreamError as exc:
+                if not exc.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, exc)
+                metrics.increment('ai_upstream_retries')
+                attempt += 1
+                self.sleep(delay)
+
+    def _backoff(self, attempt, exc):
+        """Full-jitter exponential backoff, honouring an upstream Retry-After"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        retry_after = getattr(exc, 'retry_after_header', None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _hedge_delay(self):
+        """Seconds to wait before firing a hedge, or None when hedging is off"""
+        if not self.hedge_percentile:
+            return None
+        if metrics.sample_count(LATENCY_METRIC) < self.hedge_min_samples:
+            return None
+        latency_ms = metrics.percentile(LATENCY_METRIC, self.hedge_percentile)
+        if latency_ms is None:
+            return None
+        return latency_ms / 1000
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-hedge')
+            return self._executor
+
+    def _hedged_call(self, payload, headers):
+        """One logical attempt, hedged or not; records a single breaker outcome"""
+        try:
+            completion = self._first_result(payload, headers)
+        except UpstreamError as exc:
+            if exc.upstream_healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return completion
+
+    def _first_result(self, payload, headers):
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return self._call(payload, headers)
+
+        executor = self._get_executor()
+        pending = {executor.submit(self._call, payload, headers)}
+        done, pending = wait(pending, timeout=hedge_delay)
+        # A half-open breaker admits the first request as its only probe: never hedge it
+        if not done and self.breaker.allow_request():
+            metrics.increment('ai_upstream_hedges')
+            pending.add(executor.submit(self._call, payload, headers))
+
+        last_error = None
+        while True:
+            for future in done:
+                try:
+                    return future.result()
+                except UpstreamError as exc:
+                    last_error = exc
+            if not pending:
+                raise last_error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def _call(self, payload, headers):
+        """One upstream request; feeds the latency histogram"""
+        started = time.monotonic()
+        try:
+            response = requests.post(self.url, headers=headers, json=payload, timeout=self.timeout)
+        except requests.RequestException as exc:
+            metrics.increment('ai_upstream_requests', outcome='network_error')
+            raise UpstreamError(f'OpenAI API request failed: {exc}', retryable=True)
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        if response.status_code >= 400:
+            retryable = response.status_code in RETRYABLE_STATUS_CODES
+            metrics.increment('ai_upstream_requests', outcome=str(response.status_code))
+            error = UpstreamError(
+                f'OpenAI API error (Status {response.status_code}): {_error_message(response)[:500]}',
+                status_code=response.status_code,
+                retryable=retryable,
+                # Non-retryable 4xx means upstream is reachable and healthy
+                upstream_healthy=not retryable,
+            )
+            error.retry_after_header = _parse_retry_after(response)
+            raise error
+
+        try:
+            completion = response.json()
+        except ValueError:
+            metrics.increment('ai_upstream_requests', outcome='invalid_json')
+            raise UpstreamError('Invalid response from OpenAI')
+
+        metrics.increment('ai_upstream_requests', outcome='ok')
+        metrics.observe(LATENCY_METRIC, elapsed_ms)
+        return completion
+
+
+def _error_message(response):
+    try:
+        error_data = response.json()
+        if isinstance(error_data, dict):
+            error = error_data.get('error', {})
+            if isinstance(error, dict):
+                return error.get('message', response.text)
+    except ValueError:
+        pass
+    return response.text
+
+
+def _parse_retry_after(response):
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client configured from settings (shares one circuit breaker)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAIClient(
+                url=getattr(settings, 'OPENAI_API_URL', DEFAULT_API_URL),
+                timeout=getattr(settings, 'AI_REQUEST_TIMEOUT', 30),
+                max_retries=getattr(settings, 'AI_MAX_RETRIES', 2),
+                backoff_base=getattr(settings, 'AI_RETRY_BACKOFF', 0.5),
+                backoff_max=getattr(settings, 'AI_RETRY_BACKOFF_MAX', 8.0),
+                breaker=CircuitBreaker(
+                    failure_threshold=getattr(settings, 'AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'AI_CIRCUIT_RESET_TIMEOUT', 30),
+                ),
+                hedge_percentile=getattr(settings, 'AI_HEDGE_PERCENTILE', None),
+                hedge_min_samples=getattr(settings, 'AI_HEDGE_MIN_SAMPLES', 20),
+            )
+        return _client
+
+
+def reset_client():
+    """Drop the cached client so settings changes take effect (used by tests)"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,79 @@
+"""Single-flight coalescing of identical in-flight AI requests."""
+
+import hashlib
+import json
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its outcome.
+
+    Results accepted by ``cache_if`` are also kept for ``result_ttl`` seconds so
+    client retries arriving just after completion reuse them.
+    """
+
+    def __init__(self, result_ttl=10, clock=time.monotonic):
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._results = {}
+
+    def do(self, key, fn, cache_if=None):
+        """Return ``(result, shared)`` where ``shared`` is True if another call produced it"""
+        with self._lock:
+            self._evict_expired()
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached[1], True
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if call.error is None and self.result_ttl > 0 and (cache_if is None or cache_if(call.result)):
+                    self._results[key] = (self.clock() + self.result_ttl, call.result)
+            call.done.set()
+        return call.result, False
+
+    def _evict_expired(self):
+        now = self.clock()
+        expired = [key for key, (expires_at, _) in self._results.items() if expires_at <= now]
+        for key in expired:
+            del self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+def request_key(user_id, message, request_data):
+    """Identity of a chat submission: user plus a hash of the message and its flags"""
+    extras = {key: value for key, value in (request_data or {}).items() if key != 'message'}
+    digest = hashlib.sha256()
+    digest.update(message.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(extras, sort_keys=True, default=str).encode('utf-8'))
+    return user_id, digest.hexdigest()
@@ -1,11 +1,10 @@
 import random
 import re
 
+from .catalog import get_catalog
 from .prompts import (
     ACCESSIBILITY_ACTIVATION_MESSAGES,
     ACCESSIBILITY_ACTIVATION_MESSAGES_EN,
-    ADAPTIVE_EXERCISE_IMAGES,
-    ADAPTIVE_VIDEOS,
     BALANCE_FRIENDLY_EXERCISES,
     DEAF_MODE_ACTIVATION_MESSAGES,
     DEAF_MODE_ACTIVATION_MESSAGES_EN,
@@ -195,10 +194,6 @@ def get_dangerous_exercises_to_avoid(disability_info):
 
 def get_adaptive_video_recommendation(state, disability_info, language):
     """Get adaptive video recommendation based on disability"""
-    used_videos = state.get('used_videos', [])
-    
-    # Filter videos by category
-    available_videos = []
     if disability_info.get('wheelchair_use') or disability_info.get('difficulty_standing'):
         category = 'wheelchair'
     elif disability_info.get('joint_pain'):
@@ -208,35 +203,22 @@ def get_adaptive_video_recommendation(state, disability_info, language):
     else:
         category = 'general'
     
-    for video in ADAPTIVE_VIDEOS:
-        if video['category'] == category or video['category'] == 'general':
-            if video['title'] not in used_videos:
-                available_videos.append(video)
-    
-    # If all used, reset
-    if not available_videos:
-        available_videos = [v for v in ADAPTIVE_VIDEOS if v['category'] == category or v['category'] == 'general']
-        used_videos = [v for v in used_videos if v not in [av['title'] for av in available_videos]]
-    
-    if available_videos:
-        selected = random.choice(available_videos)
-        used_videos.append(selected['title'])
-        state['used_videos'] = used_videos
-        return selected
-    
-    return None
+    videos = get_catalog().videos
+    candidates = videos.mask(collection='adaptive', condition=(category, 'general'))
+    return videos.pick(state, candidates)
 
 
 def get_adaptive_exercise_image(disability_info):
     """Get adaptive exercise image based on disability"""
+    adaptive_images = get_catalog().adaptive_images
     if disability_info.get('wheelchair_use') or disability_info.get('difficulty_standing'):
-        return ADAPTIVE_EXERCISE_IMAGES.get('seated_arm_raise')
+        return adaptive_images.get('seated_arm_raise')
     elif disability_info.get('joint_pain'):
-        return ADAPTIVE_EXERCISE_IMAGES.get('wall_squat')
+        return adaptive_images.get('wall_squat')
     elif disability_info.get('balance_issues'):
-        return ADAPTIVE_EXERCISE_IMAGES.get('chair_balance')
+        return adaptive_images.get('chair_balance')
     else:
-        return ADAPTIVE_EXERCISE_IMAGES.get('gentle_stretch')
+        return adaptive_images.get('gentle_stretch')
 
 
 def build_disability_adaptive_context(disability_info, profile_data, metrics, language):
@@ -543,11 +525,13 @@ def build_deaf_mode_context(deaf_mode, profile_data, language):
 
 def filter_videos_with_captions(videos):
     """Filter videos to only include those with captions (CC)"""
-    # In a real implementation, this would check video metadata
-    # For now, we'll add a note that videos should have captions
+    catalog = get_catalog().videos
     filtered = []
     for video in videos:
-        # Add caption note to description
+        video_id = catalog.id_of(video)
+        # Videos outside the catalog have no caption metadata; keep them as before
+        if video_id is not None and not catalog.captioned >> video_id & 1:
+            continue
         video_copy = video.copy()
         if 'description' not in video_copy:
             video_copy['description'] = ''
@@ -0,0 +1,154 @@
+"""Local stand-in for the OpenAI Responses API (POST /v1/responses).
+
+Used by the benchmark harness and for offline development: point
+OPENAI_API_URL at ``FakeUpstream.url``. Latency, jitter and error rate are
+configurable, and ``"stream": true`` requests get server-sent events in the
+Responses API shape.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .utils import estimate_tokens
+
+
+ARABIC_REPLY = 'ممتاز! خلنا نبدأ بتمرين خفيف ١٥ دقيقة، وركزي على التنفس والحركة البطيئة.'
+ENGLISH_REPLY = 'Great question! Start with a light 15 minute session and focus on slow, controlled reps.'
+ARABIC_CHARS = re.compile(r'[\u0600-\u06FF]')
+
+
+def _last_user_text(payload):
+    for message in reversed(payload.get('input') or []):
+        if isinstance(message, dict) and message.get('role') == 'user':
+            return str(message.get('content', ''))
+    return ''
+
+
+def _completion(payload, text):
+    prompt_text = json.dumps(payload.get('input') or [], ensure_ascii=False)
+    return {
+        'id': f'resp_fake_{random.getrandbits(48):012x}',
+        'object': 'response',
+        'model': payload.get('model', 'fake'),
+        'status': 'completed',
+        'output': [{
+            'type': 'message',
+            'role': 'assistant',
+            'content': [{'type': 'output_text', 'text': text}],
+        }],
+        'usage': {
+            'input_tokens': estimate_tokens(prompt_text),
+            'output_tokens': estimate_tokens(text),
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+
+        fake.record_request()
+        time.sleep(fake.sample_latency())
+        if fake.should_fail():
+            return self._send_json(fake.error_status, {'error': {'message': 'Simulated upstream failure'}})
+
+        text = ARABIC_REPLY if ARABIC_CHARS.search(_last_user_text(payload)) else ENGLISH_REPLY
+        if payload.get('stream'):
+            return self._send_stream(payload, text)
+        return self._send_json(200, _completion(payload, text))
+
+    def _send_json(self, status_code, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, payload, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for word in text.split(' '):
+            self._send_event('response.output_text.delta', {'delta': word + ' '})
+            time.sleep(self.server.fake.stream_delay)
+        self._send_event('response.completed', {'response': _completion(payload, text)})
+        self.close_connection = True
+
+    def _send_event(self, event, data):
+        data = dict(data, type=event)
+        self.wfile.write(f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeUpstream:
+    """Threaded fake /v1/responses server; usable as a context manager"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=200, jitter_ms=50, error_rate=0.0,
+                 error_status=503, stream_delay_ms=10, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_delay = stream_delay_ms / 1000
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1/responses'
+
+    def sample_latency(self):
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
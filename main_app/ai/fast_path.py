@@ -0,0 +1,86 @@
+"""Deterministic local answers that skip the upstream model call.
+
+Each rule returns the reply text for a message it can answer on its own
+(safety alerts, gym equipment how-tos, plain video requests) or None.
+"""
+
+from .pregnancy import (
+    check_diastasis_safety_alerts,
+    check_postpartum_safety_alerts,
+    check_pregnancy_safety_alerts,
+)
+from .videos import format_video_info
+from .workouts import format_equipment_instructions
+
+
+HOW_TO_KEYWORDS = [
+    'how to', 'how do', 'how should', 'how can', 'instructions', 'use the', 'using the',
+    'كيف', 'طريقة', 'استخدم', 'أستخدم', 'شرح',
+]
+
+VIDEO_KEYWORDS = [
+    'فيديو', 'video', 'يوتيوب', 'youtube',
+]
+
+# Longer messages usually carry a question the model should answer alongside the video
+VIDEO_ONLY_MAX_WORDS = 12
+
+
+def safety_alert_rule(engine):
+    """Canned medical-stop response when an active pregnancy/postpartum/diastasis mode hits an alert keyword"""
+    checks = [
+        ('pregnancy_mode', check_pregnancy_safety_alerts),
+        ('postpartum_mode', check_postpartum_safety_alerts),
+        ('diastasis_mode', check_diastasis_safety_alerts),
+    ]
+    for mode_key, check in checks:
+        if engine.state.get(mode_key, {}).get('enabled', False):
+            alert = check(engine.user_message, engine.language)
+            if alert:
+                return alert
+    return None
+
+
+def equipment_rule(engine):
+    """Step-by-step instructions for a recognised machine when the user asks how to use it"""
+    equipment_key = getattr(engine, 'equipment_key', None)
+    if not equipment_key:
+        return None
+    lowered = engine.user_message.lower()
+    if not any(keyword in lowered for keyword in HOW_TO_KEYWORDS):
+        return None
+    return format_equipment_instructions(equipment_key, engine.language)
+
+
+def video_rule(engine):
+    """The video build_context already picked, for short messages that only ask for a video"""
+    video = getattr(engine, 'video_recommendation', None)
+    if not video:
+        return None
+    lowered = engine.user_message.lower()
+    if not any(keyword in lowered for keyword in VIDEO_KEYWORDS):
+        return None
+    if len(engine.user_message.split()) > VIDEO_ONLY_MAX_WORDS:
+        return None
+    video_info = format_video_info(video, engine.language)
+    if not video_info:
+        return None
+    intro = "Here's a video for you:" if engine.language == 'english' else 'هذا فيديو يناسبك:'
+    return f"{intro}\n{video_info}"
+
+
+# Checked in order; safety always wins
+RULES = [
+    ('safety_alert', safety_alert_rule),
+    ('equipment', equipment_rule),
+    ('video', video_rule),
+]
+
+
+def answer_locally(engine):
+    """Return (intent, reply) from the first matching rule, or None to go upstream"""
+    for intent, rule in RULES:
+        reply = rule(engine)
+        if reply:
+            return intent, reply
+    return None
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.db import transaction
+
+from ..models import ChatMessage, ConversationSummary
+from .utils import estimate_tokens
+
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 1200
+SUMMARY_BUDGET_RATIO = 0.25
+SUMMARY_LINE_CHARS = 160
+
+
+def get_history_budget():
+    """Total token budget for stored history (summary + verbatim turns)"""
+    return getattr(settings, 'AI_HISTORY_TOKEN_BUDGET', DEFAULT_HISTORY_TOKEN_BUDGET)
+
+
+def record_exchange(user, user_message, assistant_message):
+    """Append one user/assistant turn pair to the conversation log"""
+    ChatMessage.objects.bulk_create([
+        ChatMessage(
+            user=user,
+            role='user',
+            content=user_message,
+            token_estimate=estimate_tokens(user_message),
+        ),
+        ChatMessage(
+            user=user,
+            role='assistant',
+            content=assistant_message,
+            token_estimate=estimate_tokens(assistant_message),
+        ),
+    ])
+
+
+def _summary_line(message):
+    """Collapse one turn into a single short line"""
+    text = ' '.join(message.content.split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS].rstrip() + '…'
+    speaker = 'User' if message.role == 'user' else 'Coach'
+    return f"{speaker}: {text}"
+
+
+def fold_into_summary(summary_text, messages, budget):
+    """Append collapsed turns to the rolling summary, dropping the oldest lines over budget"""
+    lines = [line for line in (summary_text or '').split('\n') if line.strip()]
+    lines.extend(_summary_line(message) for message in messages)
+
+    total = sum(estimate_tokens(line) for line in lines)
+    while lines and total > budget:
+        total -= estimate_tokens(lines.pop(0))
+
+    return '\n'.join(lines)
+
+
+def _fold_up_to(user, boundary, summary_budget):
+    """Fold every unfolded turn with id <= boundary into the stored summary and return it.
+
+    The summary row is locked while folding, so concurrent requests of the same
+    user neither fold a turn twice nor overwrite each other's summary.
+    """
+    with transaction.atomic():
+        summary, _ = ConversationSummary.objects.select_for_update().get_or_create(user=user)
+        if summary.last_message_id >= boundary:
+            return summary
+
+        # Every summary line costs at least one token, so older turns would be dropped anyway
+        turns = list(
+            ChatMessage.objects.filter(user=user, id__gt=summary.last_message_id, id__lte=boundary)
+            .only('id', 'role', 'content')
+            .order_by('-id')[:max(summary_budget, 1)]
+        )
+        turns.reverse()
+        summary.summary = fold_into_summary(summary.summary, turns, summary_budget)
+        summary.last_message_id = boundary
+        summary.save()
+    return summary
+
+
+def pack_history(user, budget=None):
+    """Return prior turns as API messages that fit inside the token budget.
+
+    The newest turns are kept verbatim. Turns that fall out of the window are
+    folded into a per-user rolling summary, which is stored so each turn is only
+    collapsed once.
+    """
+    budget = get_history_budget() if budget is None else budget
+    if budget <= 0:
+        return []
+
+    summary_budget = int(budget * SUMMARY_BUDGET_RATIO)
+    verbatim_budget = budget - summary_budget
+
+    summary = ConversationSummary.objects.filter(user=user).first()
+    last_folded_id = summary.last_message_id if summary else 0
+
+    # Each turn costs at least one token, so the budget also caps how many rows to fetch
+    recent = list(
+        ChatMessage.objects.filter(user=user, id__gt=last_folded_id)
+        .only('id', 'role', 'content', 'token_estimate')
+        .order_by('-id')[:verbatim_budget + 1]
+    )
+
+    kept = []
+    used = 0
+    for message in recent:
+        cost = message.token_estimate or estimate_tokens(message.content)
+        if used + cost > verbatim_budget:
+            break
+        kept.append(message)
+        used += cost
+
+    if len(kept) < len(recent):
+        summary = _fold_up_to(user, recent[len(kept)].id, summary_budget)
+
+    messages = []
+    if summary and summary.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of earlier conversation:\n{summary.summary}",
+        })
+    for message in reversed(kept):
+        messages.append({"role": message.role, "content": message.content})
+
+    return messages
@@ -0,0 +1,145 @@
+"""Background AI chat jobs run on a bounded in-process worker pool.
+
+The pool lives in the web process, so a restart loses the jobs it held;
+expire_stale_jobs fails any job left queued or running past AI_JOB_TIMEOUT
+and prune_jobs deletes finished jobs after AI_JOB_RETENTION_DAYS.
+"""
+
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ..models import AIJob
+from . import metrics
+from .ai_generator import coalesced_ai_request
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at AI_JOB_QUEUE_LIMIT"""
+
+    def __init__(self, retry_after=5):
+        super().__init__('AI service is busy. Please try again shortly.')
+        self.retry_after = retry_after
+
+
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'AI_JOB_WORKERS', 4),
+            thread_name_prefix='ai-job',
+        )
+    return _executor
+
+
+def queue_depth():
+    """Jobs submitted to this process that have not finished yet"""
+    with _lock:
+        return _pending
+
+
+def expire_stale_jobs(job_id=None):
+    """Fail queued/running jobs older than AI_JOB_TIMEOUT (all, or just job_id); returns the count"""
+    now = timezone.now()
+    stale = AIJob.objects.filter(
+        status__in=('queued', 'running'),
+        created_at__lt=now - timedelta(seconds=getattr(settings, 'AI_JOB_TIMEOUT', 300)),
+    )
+    if job_id is not None:
+        stale = stale.filter(id=job_id)
+    expired = stale.update(
+        status='failed',
+        result={'error': 'AI job timed out. Please send your message again.'},
+        status_code=504,
+        finished_at=now,
+    )
+    if expired:
+        metrics.increment('ai_jobs_expired', expired)
+    return expired
+
+
+def prune_jobs(days=None):
+    """Delete jobs finished more than days (default AI_JOB_RETENTION_DAYS) ago; returns the count"""
+    if days is None:
+        days = getattr(settings, 'AI_JOB_RETENTION_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = AIJob.objects.filter(status__in=('done', 'failed'), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def _json_safe(data):
+    """Keep only plain request flags (drops uploaded files and the async switch)"""
+    # QueryDict.dict() gives the last value per key; dict() would give lists
+    data = data.dict() if hasattr(data, 'dict') else dict(data or {})
+    return {
+        key: value
+        for key, value in data.items()
+        if key not in ('message', 'async') and (isinstance(value, (str, int, float, bool)) or value is None)
+    }
+
+
+def submit_job(user, user_message, data):
+    """Create an AIJob and queue it, or raise QueueFullError under backpressure"""
+    global _pending
+    limit = getattr(settings, 'AI_JOB_QUEUE_LIMIT', 32)
+    with _lock:
+        if _pending >= limit:
+            metrics.increment('ai_jobs_rejected')
+            raise QueueFullError()
+        _pending += 1
+
+    try:
+        job = AIJob.objects.create(user=user, message=user_message, request_data=_json_safe(data))
+        with _lock:
+            executor = _get_executor()
+        executor.submit(_run_job, job.id)
+    except Exception:
+        with _lock:
+            _pending -= 1
+        raise
+
+    metrics.increment('ai_jobs_submitted')
+    metrics.observe('ai_job_queue_depth', queue_depth())
+    return job
+
+
+def _run_job(job_id):
+    global _pending
+    close_old_connections()
+    try:
+        # A job that waited past AI_JOB_TIMEOUT may already have been failed by a poll
+        started_at = timezone.now()
+        if not AIJob.objects.filter(id=job_id, status='queued').update(status='running', started_at=started_at):
+            return
+        job = AIJob.objects.select_related('user').get(id=job_id)
+
+        data = dict(job.request_data)
+        data['message'] = job.message
+        response_data, status_code, _ = coalesced_ai_request(job.user, job.message, data)
+
+        job.result = response_data
+        job.status_code = status_code
+        job.status = 'done' if status_code < 400 else 'failed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['result', 'status_code', 'status', 'finished_at'])
+        metrics.observe('ai_job_run_ms', (job.finished_at - job.started_at).total_seconds() * 1000)
+    except Exception as exc:
+        AIJob.objects.filter(id=job_id).update(
+            status='failed',
+            result={'error': str(exc)},
+            status_code=500,
+            finished_at=timezone.now(),
+        )
+    finally:
+        with _lock:
+            _pending -= 1
+        close_old_connections()
@@ -0,0 +1,96 @@
+"""In-process counters and latency/size histograms for the AI pipeline."""
+
+import threading
+from collections import defaultdict, deque
+
+
+HISTOGRAM_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+
+
+class _Histogram:
+    """Total count/sum plus a bounded window of recent samples for percentiles"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=HISTOGRAM_WINDOW)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(key):
+    name, labels = key
+    if not labels:
+        return name
+    label_text = ','.join(f'{label}={value}' for label, value in labels)
+    return f'{name}{{{label_text}}}'
+
+
+def increment(name, value=1, **labels):
+    """Add to a counter"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name, value, **labels):
+    """Record one sample in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.add(value)
+
+
+def percentile(name, q, **labels):
+    """Percentile of recent samples, or None when nothing was recorded"""
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        return histogram.percentile(q) if histogram else None
+
+
+def sample_count(name, **labels):
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        return histogram.count if histogram else 0
+
+
+def snapshot():
+    """Plain-dict view of every counter and histogram"""
+    with _lock:
+        counters = {_format_key(key): value for key, value in _counters.items()}
+        histograms = {}
+        for key, histogram in _histograms.items():
+            histograms[_format_key(key)] = {
+                'count': histogram.count,
+                'sum': round(histogram.total, 3),
+                'p50': histogram.percentile(50),
+                'p95': histogram.percentile(95),
+                'p99': histogram.percentile(99),
+            }
+    return {'counters': counters, 'histograms': histograms}
+
+
+def reset():
+    """Clear all metrics (used by tests)"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
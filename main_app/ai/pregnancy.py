@@ -1,25 +1,19 @@
-import random
 import re
 
+from .catalog import get_catalog
 from .prompts import (
     DIASTASIS_EXERCISES_STAGE_1,
     DIASTASIS_EXERCISES_STAGE_2,
     DIASTASIS_EXERCISES_STAGE_3,
     DIASTASIS_EXERCISES_STAGE_4,
     DIASTASIS_FORBIDDEN_EXERCISES,
-    DIASTASIS_SAFETY_ALERTS,
-    DIASTASIS_VIDEOS,
     PREGNANCY_EXERCISES_TRIMESTER_1,
     PREGNANCY_EXERCISES_TRIMESTER_2,
     PREGNANCY_EXERCISES_TRIMESTER_3,
-    PREGNANCY_SAFETY_ALERTS,
-    PREGNANCY_VIDEOS,
     POSTPARTUM_EXERCISES_PHASE_1,
     POSTPARTUM_EXERCISES_PHASE_2,
     POSTPARTUM_EXERCISES_PHASE_3,
     POSTPARTUM_EXERCISES_PHASE_4,
-    POSTPARTUM_SAFETY_ALERTS,
-    POSTPARTUM_VIDEOS,
 )
 
 
@@ -93,7 +87,7 @@ def check_pregnancy_safety_alerts(user_message, language):
     
     lowered = user_message.lower()
     
-    for alert_key, alert_data in PREGNANCY_SAFETY_ALERTS.items():
+    for alert_key, alert_data in get_catalog().safety_alerts['pregnancy'].items():
         ar_keyword = alert_data['ar']
         en_keyword = alert_data['en']
         
@@ -159,20 +153,8 @@ def build_pregnancy_mode_context(pregnancy_mode, profile_data, metrics, language
 
 def get_pregnancy_video_recommendation(state, language):
     """Get non-repeating pregnancy video recommendation"""
-    used_videos = state.get('pregnancy_mode', {}).get('used_pregnancy_videos', [])
-    
-    available = [v for v in PREGNANCY_VIDEOS if v['trainer'] not in used_videos]
-    if not available:
-        available = PREGNANCY_VIDEOS
-        used_videos = []
-    
-    selected = random.choice(available)
-    used_videos.append(selected['trainer'])
-    if 'pregnancy_mode' not in state:
-        state['pregnancy_mode'] = {}
-    state['pregnancy_mode']['used_pregnancy_videos'] = used_videos
-    
-    return selected
+    videos = get_catalog().videos
+    return videos.pick(state, videos.mask(collection='pregnancy'), repeat_by_trainer=True)
 
 
 def detect_postpartum_mode(user_message, request_data=None):
@@ -310,7 +292,7 @@ def check_postpartum_safety_alerts(user_message, language):
     
     lowered = user_message.lower()
     
-    for alert_key, alert_data in POSTPARTUM_SAFETY_ALERTS.items():
+    for alert_key, alert_data in get_catalog().safety_alerts['postpartum'].items():
         ar_keyword = alert_data['ar']
         en_keyword = alert_data['en']
         
@@ -429,20 +411,8 @@ def build_postpartum_mode_context(postpartum_mode, profile_data, metrics, langua
 
 def get_postpartum_video_recommendation(state, language):
     """Get non-repeating postpartum video recommendation"""
-    used_videos = state.get('postpartum_mode', {}).get('used_postpartum_videos', [])
-    
-    available = [v for v in POSTPARTUM_VIDEOS if v['trainer'] not in used_videos]
-    if not available:
-        available = POSTPARTUM_VIDEOS
-        used_videos = []
-    
-    selected = random.choice(available)
-    used_videos.append(selected['trainer'])
-    if 'postpartum_mode' not in state:
-        state['postpartum_mode'] = {}
-    state['postpartum_mode']['used_postpartum_videos'] = used_videos
-    
-    return selected
+    videos = get_catalog().videos
+    return videos.pick(state, videos.mask(collection='postpartum'), repeat_by_trainer=True)
 
 
 def detect_diastasis_mode(user_message, request_data=None):
@@ -568,7 +538,7 @@ def check_diastasis_safety_alerts(user_message, language):
     
     lowered = user_message.lower()
     
-    for alert_key, alert_data in DIASTASIS_SAFETY_ALERTS.items():
+    for alert_key, alert_data in get_catalog().safety_alerts['diastasis'].items():
         ar_keyword = alert_data['ar']
         en_keyword = alert_data['en']
         
@@ -641,7 +611,8 @@ def build_diastasis_mode_context(diastasis_mode, profile_data, metrics, language
     
     context += "IMPORTANT CHECK:\n"
     context += "AI must always ask: 'هل تحسين بانتفاخ أو بروز في البطن خلال التمرين؟' (Do you feel bulging or coning in your abdomen during the exercise?)\n"
-    context += "If YES → stop and switch to easier exercise immediately.\n\n"
+    context += "If YES → stop and switch to easier exercise immediately.\n"
+    context += "If user reports new pain → respond: 'هذا عرض يحتاج توقفين فورًا. الأفضل تراجعين طبيبة.'\n\n"
     
     context += "WORKOUT PLAN FORMAT (REQUIRED):\n"
     context += "ALWAYS present diastasis recti workouts in table structure:\n"
@@ -654,8 +625,7 @@ def build_diastasis_mode_context(diastasis_mode, profile_data, metrics, language
     context += "Use this table format for ALL diastasis recti workout plans.\n\n"
     
     context += "PROGRESS MONITORING:\n"
-    context += "Track: Separation size, Pain levels, Coning/bulging, Belly pressure, Improvements in stability.\n"
-    context += "If user reports new pain → respond: 'هذا عرض يحتاج توقفين فورًا. الأفضل تراجعين طبيبة.'\n\n"
+    context += "Track: Separation size, Pain levels, Coning/bulging, Belly pressure, Improvements in stability.\n\n"
     
     context += f"User Profile:\n"
     context += f"- Age: {profile_data.get('age', 'N/A')}\n"
@@ -669,19 +639,7 @@ def build_diastasis_mode_context(diastasis_mode, profile_data, metrics, language
 
 def get_diastasis_video_recommendation(state, language):
     """Get non-repeating diastasis recti video recommendation"""
-    used_videos = state.get('diastasis_mode', {}).get('used_diastasis_videos', [])
-    
-    available = [v for v in DIASTASIS_VIDEOS if v['trainer'] not in used_videos]
-    if not available:
-        available = DIASTASIS_VIDEOS
-        used_videos = []
-    
-    selected = random.choice(available)
-    used_videos.append(selected['trainer'])
-    if 'diastasis_mode' not in state:
-        state['diastasis_mode'] = {}
-    state['diastasis_mode']['used_diastasis_videos'] = used_videos
-    
-    return selected
+    videos = get_catalog().videos
+    return videos.pick(state, videos.mask(collection='diastasis'), repeat_by_trainer=True)
 
 
@@ -0,0 +1,184 @@
+"""Keyword retrieval so prompts only carry the guidance relevant to the message.
+
+The gym equipment instructions are indexed once per catalog version; the
+optional sections of the pregnancy/postpartum/diastasis and disability
+contexts are ranked per call against the same topic vocabulary.
+Safety rules and safe-exercise lists are never dropped, nor is any optional
+section that carries a stop rule ("If ... → stop / see a doctor").
+"""
+
+import math
+import re
+from collections import defaultdict
+
+from django.conf import settings
+
+from .catalog import get_catalog
+from .utils import normalize_message
+
+
+STOPWORDS = {
+    'a', 'an', 'and', 'the', 'to', 'of', 'on', 'in', 'for', 'is', 'it', 'i', 'me', 'my',
+    'do', 'how', 'what', 'can', 'should', 'with', 'this', 'that', 'be', 'you',
+    'use', 'using', 'machine', 'equipment', 'gym',
+    'في', 'من', 'على', 'عن', 'الى', 'كيف', 'وش', 'ايش', 'هل', 'انا', 'هذا', 'هذي',
+    'جهاز', 'استخدم', 'اللعب', 'النادي',
+}
+
+# Extra words (en + ar) that should match each equipment instruction field
+EQUIPMENT_FIELD_KEYWORDS = {
+    'seat_adjustment': ['seat', 'adjust', 'setup', 'set', 'height', 'مقعد', 'اضبط', 'ضبط', 'كرسي'],
+    'handle_height': ['handle', 'handles', 'bar', 'pulley', 'height', 'مقبض', 'مقابض', 'ارتفاع'],
+    'foot_placement': ['feet', 'foot', 'stance', 'stand', 'قدم', 'اقدام', 'رجل', 'رجولي', 'وقفه'],
+    'grip': ['grip', 'hold', 'hands', 'hand', 'wide', 'narrow', 'مسك', 'امسك', 'يد', 'قبضه'],
+    'range_of_motion': ['range', 'deep', 'depth', 'far', 'down', 'lower', 'knees', 'مدى', 'نزول', 'انزل', 'ركب'],
+    'breathing': ['breathe', 'breath', 'breathing', 'exhale', 'inhale', 'تنفس', 'اتنفس', 'نفس', 'زفير', 'شهيق'],
+    'safety': ['safe', 'safety', 'injury', 'hurt', 'pain', 'danger', 'امان', 'اصابه', 'الم', 'خطر'],
+    'common_mistakes': ['mistake', 'mistakes', 'wrong', 'error', 'form', 'غلط', 'اخطاء', 'خطا'],
+    'beginner_weight': ['weight', 'heavy', 'light', 'beginner', 'start', 'kg', 'lbs', 'وزن', 'مبتدئ', 'ثقيل', 'خفيف'],
+}
+
+# Optional context sections, keyed by heading prefix. Any other section is always kept.
+GUIDANCE_TOPIC_KEYWORDS = {
+    'LABOR PREPARATION': ['labor', 'labour', 'birth', 'delivery', 'contractions', 'ولاده', 'طلق'],
+    'PREGNANCY NUTRITION': ['eat', 'food', 'meal', 'diet', 'calories', 'protein', 'nausea', 'hungry', 'water', 'اكل', 'وجبه', 'وجبات', 'سعرات', 'غثيان', 'بروتين', 'جوعانه', 'ماي'],
+    'POSTPARTUM NUTRITION': ['eat', 'food', 'meal', 'diet', 'calories', 'protein', 'breastfeeding', 'milk', 'hungry', 'water', 'اكل', 'وجبه', 'وجبات', 'سعرات', 'رضاعه', 'حليب', 'بروتين', 'ماي'],
+    'NUTRITION ADAPTATION': ['eat', 'food', 'meal', 'diet', 'calories', 'protein', 'water', 'اكل', 'وجبه', 'سعرات', 'بروتين'],
+    'WORKOUT PLAN FORMAT': ['plan', 'week', 'weekly', 'schedule', 'table', 'program', 'routine', 'workout', 'workouts', 'exercises',
+                            'خطة', 'جدول', 'برنامج', 'اسبوع', 'تمرين', 'تمارين'],
+    'PROGRESS MONITORING': ['progress', 'improve', 'improving', 'better', 'track', 'gap', 'pain', 'hurt',
+                            'تحسن', 'تقدم', 'متابعه', 'فجوه', 'ألم', 'وجع'],
+    'User Profile': ['calories', 'tdee', 'age', 'energy', 'سعرات', 'طاقه', 'عمري'],
+}
+
+
+def tokenize(text):
+    """Normalized word tokens with light English/Arabic stemming"""
+    tokens = []
+    for word in normalize_message(text).split():
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if word.startswith('ال') and len(word) > 4:
+            word = word[2:]
+        elif word.isascii() and word.endswith('s') and len(word) > 3:
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class InvertedIndex:
+    """Token -> document postings with IDF-weighted overlap scoring"""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.postings = defaultdict(set)
+        for doc_id, document in enumerate(self.documents):
+            for token in set(tokenize(document['text'])):
+                self.postings[token].add(doc_id)
+        total = max(len(self.documents), 1)
+        self.idf = {token: math.log(1 + total / len(ids)) for token, ids in self.postings.items()}
+
+    def search(self, query, k=None, where=None):
+        """Return [(score, document)] with a positive score, best first"""
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            for doc_id in self.postings.get(token, ()):
+                scores[doc_id] += self.idf[token]
+        ranked = [
+            (score, self.documents[doc_id])
+            for doc_id, score in scores.items()
+            if where is None or where(self.documents[doc_id])
+        ]
+        ranked.sort(key=lambda item: -item[0])
+        return ranked[:k] if k else ranked
+
+
+def _equipment_documents(gym_equipment):
+    for equipment_key, equipment in gym_equipment.items():
+        for field, instruction in equipment['instructions'].items():
+            keywords = ' '.join(EQUIPMENT_FIELD_KEYWORDS.get(field, []))
+            yield {
+                'equipment': equipment_key,
+                'field': field,
+                'text': f"{field.replace('_', ' ')} {instruction} {keywords}",
+            }
+
+
+_equipment_index = (None, None)
+
+
+def get_equipment_index(catalog):
+    """Inverted index over the catalog's equipment instructions, rebuilt when the catalog changes"""
+    global _equipment_index
+    indexed_catalog, index = _equipment_index
+    if indexed_catalog is not catalog:
+        index = InvertedIndex(_equipment_documents(catalog.gym_equipment))
+        _equipment_index = (catalog, index)
+    return index
+
+
+def get_top_k():
+    return getattr(settings, 'AI_RETRIEVAL_TOP_K', 3)
+
+
+def retrieval_enabled():
+    return getattr(settings, 'AI_RETRIEVAL_ENABLED', True)
+
+
+def relevant_equipment_fields(equipment_key, query, k=None):
+    """Instruction fields of one machine that match the question, or None for a general question"""
+    if not retrieval_enabled():
+        return None
+    catalog = get_catalog()
+    # The machine's own name says nothing about which instruction is wanted
+    equipment = catalog.gym_equipment[equipment_key]
+    name_tokens = set(tokenize(f"{equipment['name']} {equipment.get('name_ar', '')} {equipment_key.replace('_', ' ')}"))
+    query = ' '.join(token for token in tokenize(query) if token not in name_tokens)
+    matches = get_equipment_index(catalog).search(
+        query, k=k or get_top_k(), where=lambda document: document['equipment'] == equipment_key
+    )
+    if not matches:
+        return None
+    fields = {document['field'] for _, document in matches}
+    # Safety notes always travel with the instructions
+    fields.add('safety')
+    return fields
+
+
+# A conditional stop/refer rule; a section holding one is kept whatever the question
+STOP_RULE = re.compile(r'^\s*(if|إذا|اذا)\b.*(\bstop\b|\bdoctor\b|توقف|طبيب)', re.IGNORECASE | re.MULTILINE)
+
+
+def _section_topic(section):
+    heading = section.lstrip().split('\n', 1)[0]
+    for prefix in GUIDANCE_TOPIC_KEYWORDS:
+        if heading.startswith(prefix):
+            return prefix
+    return None
+
+
+def select_relevant_guidance(context, query, k=None):
+    """Drop optional sections of a mode context that do not match the question.
+
+    Sections are separated by blank lines; those whose heading is not in
+    GUIDANCE_TOPIC_KEYWORDS (safety rules, safe exercises, tone), or that
+    contain a stop rule, are always kept.
+    """
+    if not context or not retrieval_enabled():
+        return context
+
+    sections = context.split('\n\n')
+    optional = []
+    for position, section in enumerate(sections):
+        topic = _section_topic(section)
+        if topic and not STOP_RULE.search(section):
+            optional.append({
+                'position': position,
+                'text': f"{section} {' '.join(GUIDANCE_TOPIC_KEYWORDS[topic])}",
+            })
+    if not optional:
+        return context
+
+    keep = {document['position'] for _, document in InvertedIndex(optional).search(query, k=k or get_top_k())}
+    dropped = {document['position'] for document in optional} - keep
+    return '\n\n'.join(section for position, section in enumerate(sections) if position not in dropped)
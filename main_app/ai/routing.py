@@ -0,0 +1,59 @@
+"""Pick the upstream model and output budget for a chat turn."""
+
+from django.conf import settings
+
+from .utils import determine_detail_level
+
+
+# Keyed by utils.determine_detail_level
+DEFAULT_MODEL_ROUTES = {
+    'micro': {'model': 'gpt-4.1-mini', 'max_output_tokens': 150},
+    'brief': {'model': 'gpt-4.1-mini', 'max_output_tokens': 250},
+    'moderate': {'model': 'gpt-4.1', 'max_output_tokens': 400},
+    'detailed': {'model': 'gpt-4.1', 'max_output_tokens': 700},
+}
+
+# Sensitive modes always use the large model and get at least this budget
+DEFAULT_MODE_ROUTES = {
+    'pregnancy': {'model': 'gpt-4.1', 'min_output_tokens': 300},
+    'postpartum': {'model': 'gpt-4.1', 'min_output_tokens': 300},
+    'diastasis': {'model': 'gpt-4.1', 'min_output_tokens': 300},
+    'accessibility': {'model': 'gpt-4.1', 'min_output_tokens': 250},
+}
+
+MODE_STATE_KEYS = {
+    'pregnancy': 'pregnancy_mode',
+    'postpartum': 'postpartum_mode',
+    'diastasis': 'diastasis_mode',
+    'accessibility': 'accessibility_mode',
+}
+
+
+def active_modes(state):
+    """Names of the special modes currently enabled in the user's state"""
+    return [
+        mode for mode, state_key in MODE_STATE_KEYS.items()
+        if state.get(state_key, {}).get('enabled', False)
+    ]
+
+
+def select_route(user_message, state):
+    """Return {'name', 'model', 'max_output_tokens'} for this message and state"""
+    routes = getattr(settings, 'AI_MODEL_ROUTES', None) or DEFAULT_MODEL_ROUTES
+    mode_routes = getattr(settings, 'AI_MODE_ROUTES', None) or DEFAULT_MODE_ROUTES
+
+    detail_level = determine_detail_level(user_message)
+    route = dict(routes.get(detail_level) or DEFAULT_MODEL_ROUTES[detail_level])
+    name_parts = [detail_level]
+
+    for mode in active_modes(state):
+        override = mode_routes.get(mode)
+        if not override:
+            continue
+        name_parts.append(mode)
+        if override.get('model'):
+            route['model'] = override['model']
+        route['max_output_tokens'] = max(route['max_output_tokens'], override.get('min_output_tokens', 0))
+
+    route['name'] = '+'.join(name_parts)
+    return route
@@ -0,0 +1,216 @@
+"""Response cache keyed by local hashed n-gram embeddings of the message.
+
+Near-identical coaching questions ("how do I use the leg press?") reuse a
+recent model reply instead of making another upstream call. Everything runs
+in-process with NumPy; no embedding API is involved.
+
+A cacheable turn is answered from a shared prompt that carries only the
+coarse fields the bucket is keyed on (language, goal group, BMI category,
+reminders), never the user's name, numbers or conversation history, so the
+reply fits everyone in the bucket. Follow-ups that depend on the
+conversation ("and the second one?") are not cacheable. Buckets are
+allocated as they fill and the least recently used ones are evicted past
+max_buckets.
+"""
+
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .routing import active_modes
+from .utils import normalize_message
+
+
+NAME_PLACEHOLDER = '{{user_name}}'
+
+# Messages that reference the user's own numbers or progress need a personal answer
+PERSONAL_KEYWORDS = [
+    'my weight', 'my progress', 'my plan', 'my goal', 'my bmi', 'my calories',
+    'وزني', 'تقدمي', 'خطتي', 'هدفي', 'سعراتي',
+]
+
+# Phrases that point back at earlier turns; such a message cannot be answered without the history
+FOLLOW_UP_MARKERS = [
+    'the first one', 'the second one', 'the third one', 'the last one', 'the other one', 'that one', 'this one',
+    'what about', 'how about', 'you said', 'you mentioned', 'as above', 'same thing', 'instead', 'again',
+    'another one', 'more of', 'those', 'them',
+    'الأول', 'الثاني', 'الثالث', 'الأخير', 'هذا', 'هذي', 'هذه', 'ذلك', 'ذيك', 'قلت', 'ذكرت',
+    'وش عن', 'ماذا عن', 'كمان', 'مرة ثانية', 'بدال',
+]
+FOLLOW_UP_PREFIXES = ('and ', 'but ', 'also ', 'then ', 'so ')
+# Shorter messages ("why?", "and legs?") lean on the previous turn
+MIN_STANDALONE_WORDS = 3
+
+
+class HashedNgramVectorizer:
+    """Signed feature hashing of character n-grams into a fixed-size unit vector"""
+
+    def __init__(self, dim=1024, ngram_range=(3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def transform(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        normalized = normalize_message(text)
+        if not normalized:
+            return vector
+        padded = f' {normalized} '
+        low, high = self.ngram_range
+        for size in range(low, high + 1):
+            for start in range(len(padded) - size + 1):
+                # crc32 is stable across processes, unlike hash()
+                digest = zlib.crc32(padded[start:start + size].encode('utf-8'))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vector[digest % self.dim] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class _Bucket:
+    """Ring of up to capacity unit vectors with their cached replies, grown as it fills"""
+
+    INITIAL_ROWS = 8
+
+    def __init__(self, capacity, dim):
+        self.capacity = capacity
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.entries = []
+        self.next_slot = 0
+        self.size = 0
+
+    def add(self, vector, entry):
+        slot = self.next_slot
+        if slot == len(self.entries):
+            self._grow()
+        self.vectors[slot] = vector
+        self.entries[slot] = entry
+        self.next_slot = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _grow(self):
+        rows = min(self.capacity, max(self.INITIAL_ROWS, 2 * len(self.entries)))
+        vectors = np.zeros((rows, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self.entries)] = self.vectors
+        self.vectors = vectors
+        self.entries.extend([None] * (rows - len(self.entries)))
+
+    def best_match(self, vector, now):
+        if not self.size:
+            return None, 0.0
+        scores = self.vectors[:self.size] @ vector
+        for slot in np.argsort(scores)[::-1]:
+            expires_at, reply = self.entries[slot]
+            if expires_at > now:
+                return reply, float(scores[slot])
+        return None, 0.0
+
+
+class SemanticCache:
+    """Brute-force cosine-similarity lookup per profile bucket, least recently used buckets evicted"""
+
+    def __init__(self, threshold=0.92, ttl=3600, capacity=512, dim=1024, max_buckets=64, clock=time.monotonic):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.max_buckets = max_buckets
+        self.vectorizer = HashedNgramVectorizer(dim=dim)
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, bucket, message):
+        """Return (reply, similarity) for the closest fresh entry above threshold, else (None, score)"""
+        vector = self.vectorizer.transform(message)
+        with self._lock:
+            entries = self._buckets.get(bucket)
+            if entries is None:
+                return None, 0.0
+            self._buckets.move_to_end(bucket)
+            reply, score = entries.best_match(vector, self.clock())
+        if reply is None or score < self.threshold:
+            return None, score
+        return reply, score
+
+    def store(self, bucket, message, reply):
+        vector = self.vectorizer.transform(message)
+        with self._lock:
+            entries = self._buckets.get(bucket)
+            if entries is None:
+                entries = self._buckets[bucket] = _Bucket(self.capacity, self.vectorizer.dim)
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(bucket)
+            entries.add(vector, (self.clock() + self.ttl, reply))
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def goal_group(goal):
+    """Coarse goal shared by a bucket: 'cut', 'bulk' or 'general'"""
+    goal = (goal or '').lower()
+    if any(word in goal for word in ('lose', 'loss', 'cut')):
+        return 'cut'
+    if any(word in goal for word in ('gain', 'bulk', 'muscle')):
+        return 'bulk'
+    return 'general'
+
+
+def profile_bucket(engine):
+    """Coarse profile key so cached replies only cross between similar users"""
+    # Behavioural reminders (check-in, praise) shape the reply, so they split buckets too
+    reminders = hashlib.sha1('|'.join(sorted(engine.notifications)).encode('utf-8')).hexdigest()[:8]
+    goal = goal_group(engine.profile_data.get('goal'))
+    return f"{engine.language}|{goal}|{engine.metrics.get('bmi_category') or 'unknown'}|{reminders}"
+
+
+def is_follow_up(message):
+    """Whether message refers back to the conversation rather than standing alone"""
+    lowered = normalize_message(message)
+    if len(lowered.split()) < MIN_STANDALONE_WORDS or lowered.startswith(FOLLOW_UP_PREFIXES):
+        return True
+    padded = f' {lowered} '
+    return any(f' {normalize_message(marker)} ' in padded for marker in FOLLOW_UP_MARKERS)
+
+
+def is_cacheable(engine):
+    """Skip the cache for personalised, emotional, follow-up or safety-sensitive turns"""
+    if active_modes(engine.state) or engine.state.get('deaf_mode', {}).get('enabled', False):
+        return False
+    if engine.personalised_context:
+        return False
+    if engine.emotion and engine.emotion != 'neutral':
+        return False
+    lowered = engine.user_message.lower()
+    if any(char.isdigit() for char in lowered):
+        return False
+    if any(keyword in lowered for keyword in PERSONAL_KEYWORDS):
+        return False
+    return not is_follow_up(engine.user_message)
+
+
+def anonymize_reply(reply, user_name):
+    """Swap the user's name for a placeholder before sharing the reply"""
+    if user_name and len(user_name) > 1:
+        return reply.replace(user_name, NAME_PLACEHOLDER)
+    return reply
+
+
+def personalize_reply(reply, user_name):
+    return reply.replace(NAME_PLACEHOLDER, user_name or '')
+
+
+RESPONSE_CACHE = SemanticCache(
+    threshold=getattr(settings, 'AI_SEMANTIC_CACHE_THRESHOLD', 0.92),
+    ttl=getattr(settings, 'AI_SEMANTIC_CACHE_TTL', 3600),
+    capacity=getattr(settings, 'AI_SEMANTIC_CACHE_CAPACITY', 512),
+    max_buckets=getattr(settings, 'AI_SEMANTIC_CACHE_MAX_BUCKETS', 64),
+)
@@ -0,0 +1,150 @@
+"""Token-bucket rate limits for the AI chat endpoint.
+
+Buckets live in the Django cache named by AI_THROTTLE_CACHE so every worker
+sees the same tokens when that cache is shared (Redis, Memcached, database).
+Each bucket is read-modified-written under a short lock taken with
+``cache.add``, which is atomic on all of Django's backends. A request that
+cannot get the lock within LOCK_WAIT is throttled (fail closed); only a lock
+held for longer than LOCK_TIMEOUT, left by a crashed worker on a backend
+that has not expired it yet, lets requests through unmetered.
+
+A request needs one token from the user's bucket and one from the global
+bucket. A user in a special mode (pregnancy, postpartum, ...) is limited by
+that mode's own bucket instead of the default per-user one.
+"""
+
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .routing import active_modes
+
+
+DEFAULT_USER_LIMIT = {'rate': '20/min', 'burst': 10}
+DEFAULT_GLOBAL_LIMIT = {'rate': '600/min', 'burst': 100}
+
+# Sensitive modes get more headroom: follow-up questions there are expected
+DEFAULT_MODE_LIMITS = {
+    'pregnancy': {'rate': '30/min', 'burst': 15},
+    'postpartum': {'rate': '30/min', 'burst': 15},
+    'diastasis': {'rate': '30/min', 'burst': 15},
+    'accessibility': {'rate': '30/min', 'burst': 15},
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+LOCK_TIMEOUT = 2
+LOCK_WAIT = 0.05
+
+
+def parse_rate(rate):
+    """'20/min' -> tokens per second"""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period.strip()[0]]
+
+
+class TokenBucket:
+    """One bucket in a Django cache: {'tokens', 'updated'} under key"""
+
+    def __init__(self, cache, key, rate, burst, clock=time.time):
+        self.cache = cache
+        self.key = key
+        self.rate = parse_rate(rate)
+        self.burst = burst
+        self.clock = clock
+
+    def take(self, tokens=1):
+        """Take tokens if available; returns 0 on success, else seconds until they are"""
+        return self._update(-tokens)
+
+    def give_back(self, tokens=1):
+        self._update(tokens)
+
+    def _update(self, delta):
+        lock_key = f'{self.key}:lock'
+        deadline = time.monotonic() + LOCK_WAIT
+        # The value records when the lock was taken, so a stuck holder can be told apart
+        while not self.cache.add(lock_key, time.time(), LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return self._lock_unavailable(lock_key, delta)
+            time.sleep(0.002)
+
+        try:
+            now = self.clock()
+            bucket = self.cache.get(self.key) or {'tokens': self.burst, 'updated': now}
+            tokens = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * self.rate)
+            if tokens + delta < 0:
+                self.cache.set(self.key, {'tokens': tokens, 'updated': now}, self._ttl())
+                return (-delta - tokens) / self.rate
+            self.cache.set(self.key, {'tokens': min(self.burst, tokens + delta), 'updated': now}, self._ttl())
+            return 0
+        finally:
+            self.cache.delete(lock_key)
+
+    def _lock_unavailable(self, lock_key, delta):
+        held_since = self.cache.get(lock_key)
+        if held_since is not None and time.time() - held_since > LOCK_TIMEOUT:
+            # Fail open: a stuck lock must not take the chat endpoint down
+            metrics.increment('ai_throttle_lock_timeouts', holder='stuck')
+            return 0
+        # Contended: make the caller retry shortly rather than skip the limit.
+        # A give_back that cannot get the lock just drops the refund.
+        metrics.increment('ai_throttle_lock_timeouts', holder='busy')
+        return LOCK_WAIT if delta < 0 else 0
+
+    def _ttl(self):
+        # A bucket untouched for this long is full again, so it can expire
+        return math.ceil(self.burst / self.rate) + 1
+
+
+def _limit(name, default):
+    return getattr(settings, name, None) or default
+
+
+def user_limit(state):
+    """(scope, limit) for a user given their behaviour state"""
+    mode_limits = _limit('AI_THROTTLE_MODE_LIMITS', DEFAULT_MODE_LIMITS)
+    limits = [(mode, mode_limits[mode]) for mode in active_modes(state) if mode in mode_limits]
+    if not limits:
+        return 'user', _limit('AI_THROTTLE_USER_LIMIT', DEFAULT_USER_LIMIT)
+    # Several modes at once: the most generous one applies
+    return max(limits, key=lambda item: parse_rate(item[1]['rate']))
+
+
+class AIChatThrottle(BaseThrottle):
+    """Per-user (or per-mode) and global token buckets for OpenAIView"""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not getattr(settings, 'AI_THROTTLE_ENABLED', True) or not request.user.is_authenticated:
+            return True
+
+        from .ai_generator import USER_BEHAVIOR_STATE
+
+        cache = caches[getattr(settings, 'AI_THROTTLE_CACHE', 'default')]
+        scope, limit = user_limit(USER_BEHAVIOR_STATE.get(request.user.id, {}))
+        user_bucket = TokenBucket(cache, f'ai_throttle:{scope}:{request.user.id}', limit['rate'], limit['burst'])
+        wait = user_bucket.take()
+        if wait:
+            return self._throttled(scope, wait)
+
+        global_limit = _limit('AI_THROTTLE_GLOBAL_LIMIT', DEFAULT_GLOBAL_LIMIT)
+        global_bucket = TokenBucket(cache, 'ai_throttle:global', global_limit['rate'], global_limit['burst'])
+        wait = global_bucket.take()
+        if wait:
+            # The request is rejected, so the user's token is not spent
+            user_bucket.give_back()
+            return self._throttled('global', wait)
+        return True
+
+    def _throttled(self, scope, wait):
+        metrics.increment('ai_throttled', scope=scope)
+        self.retry_after = max(1, math.ceil(wait))
+        return False
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,49 @@
+"""Per-stage timing of an AI chat request."""
+
+import time
+from contextlib import contextmanager
+
+from . import metrics
+
+
+STAGE_METRIC = 'ai_stage_ms'
+
+
+class StageTimer:
+    """Collects named stage durations for one request.
+
+    Every span also feeds the ``ai_stage_ms{stage=...}`` histogram; repeated
+    stage names are summed in the per-request view.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.created = clock()
+        self.stages = {}
+
+    @contextmanager
+    def span(self, name):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, (self.clock() - started) * 1000)
+
+    def record(self, name, elapsed_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+        metrics.observe(STAGE_METRIC, elapsed_ms, stage=name)
+
+    def total_ms(self):
+        return (self.clock() - self.created) * 1000
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. ``build_context;dur=3.1, upstream;dur=412.0``"""
+        parts = [f'{name};dur={elapsed:.1f}' for name, elapsed in self.stages.items()]
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+    def log_fields(self):
+        """Stage durations rounded for structured logging"""
+        fields = {name: round(elapsed, 2) for name, elapsed in self.stages.items()}
+        fields['total'] = round(self.total_ms(), 2)
+        return fields
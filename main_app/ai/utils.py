@@ -1,6 +1,10 @@
 import re
 
 
+ARABIC_DIACRITICS = re.compile(r'[\u064B-\u0652\u0640]')
+NON_WORD = re.compile(r'[^\w\s]')
+
+
 def detect_language(text):
     if not text:
         return 'english'
@@ -14,6 +18,15 @@ def detect_language(text):
     return 'english'
 
 
+def normalize_message(text):
+    """Lowercase, strip punctuation/diacritics and unify common Arabic letter variants"""
+    text = (text or '').lower()
+    text = ARABIC_DIACRITICS.sub('', text)
+    text = text.translate(str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ة': 'ه', 'ى': 'ي'}))
+    text = NON_WORD.sub(' ', text)
+    return ' '.join(text.split())
+
+
 def detect_emotion(text):
     if not text:
         return 'neutral'
@@ -49,6 +62,15 @@ def determine_detail_level(user_message):
     return 'detailed'
 
 
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 chars per token for Latin text, ~2 for Arabic"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    ascii_count = len(text) - non_ascii
+    return max(1, (ascii_count + 3) // 4 + (non_ascii + 1) // 2)
+
+
 def extract_response_text(completion):
     """Extract assistant text from OpenAI Responses API payload"""
     if not isinstance(completion, dict):
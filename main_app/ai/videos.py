@@ -1,6 +1,4 @@
-import random
-
-from .prompts import EXERCISE_VIDEOS
+from .catalog import get_catalog
 
 
 def format_clickable_video_url(url: str) -> str:
@@ -37,39 +35,20 @@ def should_suggest_video(user_message, state, emotion):
 def get_video_recommendation(state, profile_data, language):
     """Get a non-repeating video recommendation"""
     preferences = state.get('preferences', {})
-    injuries = preferences.get('injuries', [])
     workout_dislikes = preferences.get('workout_dislikes', [])
-    used_videos = state.get('used_videos', [])
     
-    # Filter videos based on injuries and dislikes
-    available_videos = []
-    for video in EXERCISE_VIDEOS:
-        # Skip if video title contains disliked exercise
-        skip = False
-        for dislike in workout_dislikes:
-            if dislike.lower() in video['title'].lower():
-                skip = True
-                break
-        if skip:
-            continue
-        
-        # Skip if already used
-        if video['title'] in used_videos:
-            continue
-        
-        available_videos.append(video)
+    videos = get_catalog().videos
     
-    # If all videos used, reset and start over
-    if not available_videos:
-        available_videos = EXERCISE_VIDEOS
-        used_videos = []
+    # Skip videos whose title contains a disliked exercise
+    candidates = videos.mask(collection='general')
+    for dislike in workout_dislikes:
+        candidates &= ~videos.title_mask(dislike)
     
-    # Select random video
-    selected = random.choice(available_videos)
-    used_videos.append(selected['title'])
-    state['used_videos'] = used_videos
+    # If every video is disliked, fall back to the whole list
+    if not candidates:
+        candidates = videos.mask(collection='general')
     
-    return selected
+    return videos.pick(state, candidates)
 
 
 def format_video_info(video, language=None):
@@ -2,10 +2,8 @@ import random
 from datetime import timedelta
 
 from ..models import Post
+from .catalog import get_catalog
 from .prompts import (
-    EXERCISE_IMAGES,
-    GYM_EQUIPMENT,
-    GYM_EQUIPMENT_VIDEOS,
     WORKOUT_MESSAGES_14_PLUS_DAYS,
     WORKOUT_MESSAGES_14_PLUS_DAYS_EN,
     WORKOUT_MESSAGES_2_3_DAYS,
@@ -15,6 +13,7 @@ from .prompts import (
     WORKOUT_MESSAGES_7_13_DAYS,
     WORKOUT_MESSAGES_7_13_DAYS_EN,
 )
+from .retrieval import relevant_equipment_fields
 
 
 def detect_workout_completion(user_message):
@@ -106,8 +105,9 @@ def get_exercise_image(user_message, state):
     # Find matching exercise
     for keyword, exercise_key in exercise_map.items():
         if keyword in lowered:
-            if exercise_key in EXERCISE_IMAGES:
-                image_info = EXERCISE_IMAGES[exercise_key]
+            exercise_images = get_catalog().exercise_images
+            if exercise_key in exercise_images:
+                image_info = exercise_images[exercise_key]
                 # Mark as used
                 if exercise_key not in used_images:
                     used_images.append(exercise_key)
@@ -398,13 +398,18 @@ def recognize_equipment_from_text(user_message):
     return None
 
 
-def build_equipment_instructions_context(equipment_key, language):
-    """Build context for equipment usage instructions"""
-    if equipment_key not in GYM_EQUIPMENT:
+def build_equipment_instructions_context(equipment_key, language, user_message=None):
+    """Build context for equipment usage instructions, limited to the fields the question is about"""
+    gym_equipment = get_catalog().gym_equipment
+    if equipment_key not in gym_equipment:
         return None
     
-    equipment = GYM_EQUIPMENT[equipment_key]
-    instructions = equipment['instructions']
+    equipment = gym_equipment[equipment_key]
+    fields = relevant_equipment_fields(equipment_key, user_message) if user_message else None
+    instructions = {
+        field: text for field, text in equipment['instructions'].items()
+        if fields is None or field in fields
+    }
     name = equipment.get('name_ar' if language != 'english' else 'name', equipment['name'])
     
     context = f"GYM EQUIPMENT RECOGNITION - {equipment['name'].upper()}:\n\n"
@@ -436,20 +441,43 @@ def build_equipment_instructions_context(equipment_key, language):
     return context
 
 
-def get_equipment_video_recommendation(state, language):
-    """Get non-repeating equipment video recommendation"""
-    used_videos = state.get('gym_equipment', {}).get('used_equipment_videos', [])
+EQUIPMENT_INSTRUCTION_LABELS = [
+    ('seat_adjustment', 'Seat adjustment', 'ضبط المقعد'),
+    ('handle_height', 'Handle height', 'ارتفاع المقابض'),
+    ('foot_placement', 'Foot placement', 'وضع القدمين'),
+    ('grip', 'Grip', 'طريقة المسك'),
+    ('range_of_motion', 'Range of motion', 'مدى الحركة'),
+    ('breathing', 'Breathing', 'التنفس'),
+    ('safety', 'Safety', 'السلامة'),
+    ('common_mistakes', 'Common mistakes', 'أخطاء شائعة'),
+    ('beginner_weight', 'Beginner weight', 'الوزن للمبتدئين'),
+]
+
+
+def format_equipment_instructions(equipment_key, language):
+    """User-facing step-by-step instructions for a piece of gym equipment"""
+    gym_equipment = get_catalog().gym_equipment
+    if equipment_key not in gym_equipment:
+        return None
     
-    available = [v for v in GYM_EQUIPMENT_VIDEOS if v['trainer'] not in used_videos]
-    if not available:
-        available = GYM_EQUIPMENT_VIDEOS
-        used_videos = []
+    equipment = gym_equipment[equipment_key]
+    instructions = equipment['instructions']
+    is_english = language == 'english'
+    
+    if is_english:
+        lines = [f"How to use the {equipment['name']}:"]
+    else:
+        lines = [f"طريقة استخدام {equipment.get('name_ar', equipment['name'])}:"]
     
-    selected = random.choice(available)
-    used_videos.append(selected['trainer'])
-    if 'gym_equipment' not in state:
-        state['gym_equipment'] = {}
-    state['gym_equipment']['used_equipment_videos'] = used_videos
+    for key, label_en, label_ar in EQUIPMENT_INSTRUCTION_LABELS:
+        if key in instructions:
+            lines.append(f"- {label_en if is_english else label_ar}: {instructions[key]}")
     
-    return selected
+    return "\n".join(lines)
+
+
+def get_equipment_video_recommendation(state, language):
+    """Get non-repeating equipment video recommendation"""
+    videos = get_catalog().videos
+    return videos.pick(state, videos.mask(collection='equipment'), repeat_by_trainer=True)
 
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        from . import plan_cache
+        from .ai import catalog
+        from .media import ingest, refs
+
+        catalog.connect_signals()
+        plan_cache.connect_signals()
+        refs.connect_signals()
+        ingest.connect_signals()
@@ -0,0 +1,19 @@
+from main_app.media.bulk import BulkMediaCommand
+from main_app.media.encoding import describe_file
+from main_app.media.ingest import PLACEHOLDER_KEYS, placeholder_values
+
+
+class Command(BulkMediaCommand):
+    help = 'Compute width, height, dominant colour and BlurHash for images stored before they were recorded'
+    worker = staticmethod(describe_file)
+
+    def queryset(self, model, field_name):
+        # Width and height may already be known from the upload header; the BlurHash only comes from a full decode
+        return super().queryset(model, field_name).filter(**{f'{field_name}_blurhash': ''})
+
+    def update_fields(self, field_name):
+        return [f'{field_name}_{key}' for key in PLACEHOLDER_KEYS]
+
+    def apply(self, row, field_name, result):
+        for field, value in placeholder_values(field_name, result).items():
+            setattr(row, field, value)
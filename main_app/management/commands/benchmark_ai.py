@@ -0,0 +1,71 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.ai.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark POST /api/openai/ offline against a local fake of the OpenAI Responses API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Total chat requests to send')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+        parser.add_argument('--users', type=int, default=4, help='Benchmark users to spread requests over')
+        parser.add_argument('--latency-ms', type=float, default=200, help='Fake upstream base latency')
+        parser.add_argument('--jitter-ms', type=float, default=50, help='Fake upstream latency jitter (+/-)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of upstream calls that fail')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for latency and errors')
+        parser.add_argument('--with-caches', action='store_true', help='Keep the semantic cache, local fast path and coalescing on')
+        parser.add_argument('--keep-users', action='store_true', help='Do not delete the benchmark users afterwards')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--max-p95-ms', type=float, default=None, help='Exit non-zero when p95 latency exceeds this')
+        parser.add_argument('--max-error-rate', type=float, default=None,
+                            help='Exit non-zero when the fraction of 4xx/5xx responses exceeds this')
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            total_requests=options['requests'],
+            concurrency=options['concurrency'],
+            users=options['users'],
+            with_caches=options['with_caches'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+            keep_users=options['keep_users'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+        self.check_thresholds(report, options)
+
+    def print_report(self, report):
+        latency = report['latency_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['requests']} requests, concurrency {report['concurrency']}: "
+            f"{report['throughput_rps']} req/s in {report['elapsed_s']}s"
+        ))
+        self.stdout.write(
+            f"Status codes: {report['status_counts']} (error rate {report['error_rate']}, "
+            f"upstream calls: {report['upstream_requests']})"
+        )
+        self.stdout.write(f"Latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+        for label, key in (('build_context', 'build_context_ms'), ('upstream', 'upstream_ms')):
+            stage = report[key]
+            self.stdout.write(
+                f"{label}: p50={stage['p50']} p95={stage['p95']} total={stage['total']}ms "
+                f"({stage['share'] * 100:.1f}% of request time)"
+            )
+
+    def check_thresholds(self, report, options):
+        failures = []
+        p95 = report['latency_ms']['p95']
+        if options['max_p95_ms'] is not None and p95 is not None and p95 > options['max_p95_ms']:
+            failures.append(f"p95 latency {p95}ms exceeds {options['max_p95_ms']}ms")
+        if options['max_error_rate'] is not None and report['error_rate'] > options['max_error_rate']:
+            failures.append(f"error rate {report['error_rate']} exceeds {options['max_error_rate']}")
+        if failures:
+            raise CommandError('Benchmark failed: ' + '; '.join(failures))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from main_app.ai.fake_upstream import FakeUpstream
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake of the OpenAI Responses API (set OPENAI_API_URL to the printed URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=200, help='Base response latency')
+        parser.add_argument('--jitter-ms', type=float, default=50, help='Latency jitter (+/-)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+        parser.add_argument('--error-status', type=int, default=503, help='Status code for simulated failures')
+        parser.add_argument('--stream-delay-ms', type=float, default=10, help='Delay between streamed deltas')
+
+    def handle(self, *args, **options):
+        fake = FakeUpstream(
+            host=options['host'],
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            stream_delay_ms=options['stream_delay_ms'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake OpenAI Responses API listening on {fake.url}'))
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.stop()
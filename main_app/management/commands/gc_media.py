@@ -0,0 +1,44 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.media.gc import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete (or quarantine) media files no post, profile or pending upload references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+        parser.add_argument('--quarantine', default=None, help='Move unreferenced files to this directory instead of deleting them')
+        parser.add_argument('--grace-hours', type=float, default=None,
+                            help='Keep files modified or orphaned more recently than this (default: MEDIA_GC_GRACE_HOURS)')
+        parser.add_argument('--workers', type=int, default=8, help='Threads removing files in parallel')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        grace = timedelta(hours=options['grace_hours']) if options['grace_hours'] is not None else None
+
+        report = collect_garbage(
+            dry_run=options['dry_run'],
+            quarantine=options['quarantine'],
+            grace=grace,
+            workers=options['workers'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        verb = 'Would remove' if report['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['removed']} files, {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB "
+            f"({report['reclaimed_bytes']} bytes) in {report['elapsed_s']}s"
+        ))
+        self.stdout.write(
+            f"Scanned {report['scanned']} files: {report['referenced']} referenced, "
+            f"{report['recent']} within the grace period, {report['errors']} errors"
+        )
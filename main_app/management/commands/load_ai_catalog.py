@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main_app.ai.catalog import load_catalog_from_python
+
+
+class Command(BaseCommand):
+    help = 'Load the AI coach catalog (videos, gym equipment, images, safety alerts) from main_app/ai/prompts.py'
+
+    def handle(self, *args, **options):
+        counts = load_catalog_from_python()
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Loaded {videos} videos, {equipment} machines, {images} images and {safety_alerts} safety alerts'.format(**counts)
+            )
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.ai.jobs import expire_stale_jobs, prune_jobs
+
+
+class Command(BaseCommand):
+    help = 'Fail background AI jobs abandoned by a restart and delete finished jobs past their retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help='Delete finished jobs older than this (default: AI_JOB_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+
+        expired = expire_stale_jobs()
+        deleted = prune_jobs(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} stale jobs, deleted {deleted} finished jobs'))
@@ -0,0 +1,61 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.ai.benchmark import replay_call_log
+from main_app.ai.call_log import read_call_log
+
+
+class Command(BaseCommand):
+    help = 'Replay captured AI chat calls (AI_CALL_LOG_DIR) through POST /api/openai/ to reproduce production load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Call log files or directories (default: AI_CALL_LOG_DIR)')
+        parser.add_argument('--rate', type=float, default=None, help='Requests per second (default: recorded spacing)')
+        parser.add_argument('--speed', type=float, default=1.0, help='Speed-up of the recorded spacing; 0 sends as fast as possible')
+        parser.add_argument('--limit', type=int, default=None, help='Replay at most this many calls')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+        parser.add_argument('--upstream', default=None,
+                            help="Upstream URL, or 'real' for OPENAI_API_URL (default: local fake upstream)")
+        parser.add_argument('--latency-ms', type=float, default=200, help='Fake upstream base latency')
+        parser.add_argument('--jitter-ms', type=float, default=50, help='Fake upstream latency jitter (+/-)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake upstream calls that fail')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for fake latency and errors')
+        parser.add_argument('--keep-users', action='store_true', help='Do not delete the benchmark users afterwards')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [getattr(settings, 'AI_CALL_LOG_DIR', None)]
+        if not all(paths):
+            raise CommandError('No call log given and AI_CALL_LOG_DIR is not set')
+
+        records = list(islice(read_call_log(paths), options['limit']))
+        if not records:
+            raise CommandError('No calls found in the call log')
+
+        report = replay_call_log(
+            records,
+            rate=options['rate'],
+            speed=options['speed'],
+            concurrency=options['concurrency'],
+            upstream_url=options['upstream'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+            keep_users=options['keep_users'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        latency = report['latency_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {report['requests']} calls, concurrency {report['concurrency']}: "
+            f"{report['throughput_rps']} req/s in {report['elapsed_s']}s"
+        ))
+        self.stdout.write(f"Status codes: {report['status_counts']} (upstream calls: {report['upstream_requests']})")
+        self.stdout.write(f"Latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
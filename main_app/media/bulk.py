@@ -0,0 +1,188 @@
+"""Base class for management commands that reprocess stored images in bulk.
+
+A subclass names a picklable ``worker(path, *worker_args)`` (pure Pillow code
+such as encoding.describe_file, so spawned processes need no Django) and
+says how its result is written back. BulkMediaCommand then:
+
+- walks Post.image and UserProfile.profile_picture rows in primary-key
+  batches (``pk > last`` with LIMIT), so no query scans or locks the table
+  and memory stays at one batch;
+- fans each batch out to a spawn ProcessPoolExecutor, reading the files in
+  the workers (only paths cross the process boundary);
+- writes results in one conditional UPDATE per batch (like bulk_update, but
+  a row is only written while its image field still holds the name that
+  was processed, so a concurrent ingest or replacement is never
+  overwritten), with an optional pause between batches to throttle writes;
+- records the last finished pk per model in a JSON checkpoint after every
+  batch, so an interrupted run resumes where it stopped;
+- reports throughput as it goes.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Case, F, Q, Value, When
+
+from ..models import Post, UserProfile
+from .encoding import WorkerCall
+
+
+class BulkMediaCommand(BaseCommand):
+    # (model, image field name) pairs to process, in order
+    fields = ((Post, 'image'), (UserProfile, 'profile_picture'))
+    # staticmethod(worker): worker(path, *worker_args) -> result, or None when the file cannot be processed
+    worker = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows read, processed and written per batch')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: CPU count; 0 processes inline)')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches to throttle writes')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: MEDIA_BULK_CHECKPOINT_DIR/<command>.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first row')
+
+    # Subclass hooks
+
+    def queryset(self, model, field_name):
+        """Rows to process; the default is every row with an image"""
+        return model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None})
+
+    def worker_args(self, options):
+        """Extra picklable arguments passed to worker after the path"""
+        return ()
+
+    def update_fields(self, field_name):
+        """Model fields written by apply()"""
+        raise NotImplementedError
+
+    def apply(self, row, field_name, result):
+        """Set result on row; return False to skip writing it"""
+        raise NotImplementedError
+
+    # Driver
+
+    def handle(self, *args, **options):
+        if self.worker is None:
+            raise CommandError(f'{type(self).__name__} does not define a worker')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        self.options = options
+        self.checkpoint_path = options['checkpoint'] or self.default_checkpoint()
+        self.checkpoint = {} if options['restart'] else self.load_checkpoint(self.checkpoint_path)
+        if self.checkpoint:
+            self.stdout.write(f'Resuming from {self.checkpoint_path}: {self.checkpoint}')
+
+        worker = WorkerCall(self.worker, self.worker_args(options))
+        pool = None
+        if options['processes'] != 0:
+            pool = ProcessPoolExecutor(max_workers=options['processes'], mp_context=multiprocessing.get_context('spawn'))
+        self.started = time.monotonic()
+        self.totals = {'rows': 0, 'written': 0, 'failed': 0}
+        try:
+            for model, field_name in self.fields:
+                self.process_field(model, field_name, worker, pool)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f'Interrupted; run again to resume from {self.checkpoint_path}'))
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if os.path.exists(self.checkpoint_path):
+            os.unlink(self.checkpoint_path)
+        totals, elapsed = self.totals, time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {totals['rows']} images in {elapsed:.1f}s ({self.rate(totals['rows'], elapsed)} images/s): "
+            f"{totals['written']} updated, {totals['failed']} unreadable"
+        ))
+
+    def process_field(self, model, field_name, worker, pool):
+        key = f'{model._meta.label}.{field_name}'
+        storage = model._meta.get_field(field_name).storage
+        rows_query = self.queryset(model, field_name).order_by('pk').only('pk', field_name)
+        last_pk = self.checkpoint.get(key, 0)
+        totals = self.totals
+
+        while True:
+            rows = list(rows_query.filter(pk__gt=last_pk)[:self.options['batch_size']])
+            if not rows:
+                break
+            names = {row.pk: getattr(row, field_name).name for row in rows}
+            paths = [storage.path(name) for name in names.values()]
+            results = pool.map(worker, paths, chunksize=max(1, len(paths) // 32)) if pool else map(worker, paths)
+
+            updated = []
+            for row, result in zip(rows, results):
+                if result is None:
+                    totals['failed'] += 1
+                elif self.apply(row, field_name, result) is not False:
+                    updated.append(row)
+            written = self.write_rows(model, field_name, names, updated) if updated else 0
+
+            last_pk = rows[-1].pk
+            self.checkpoint[key] = last_pk
+            self.save_checkpoint(self.checkpoint_path, self.checkpoint)
+            totals['rows'] += len(rows)
+            totals['written'] += written
+            elapsed = time.monotonic() - self.started
+            self.stdout.write(
+                f"{key}: up to pk {last_pk}, {totals['rows']} images ({self.rate(totals['rows'], elapsed)}/s), "
+                f"{totals['failed']} unreadable"
+            )
+            if self.options['pause']:
+                time.sleep(self.options['pause'])
+
+    def write_rows(self, model, field_name, names, rows):
+        """Save update_fields of rows still pointing at names[pk]; returns the number written"""
+        fields = [model._meta.get_field(name) for name in self.update_fields(field_name)]
+        connection = connections[router.db_for_write(model)]
+        batch_size = max(1, connection.ops.bulk_batch_size(['pk', 'pk', field_name] + fields, rows))
+        written = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            unchanged = Q()
+            for row in batch:
+                unchanged |= Q(pk=row.pk, **{field_name: names[row.pk]})
+            values = {
+                field.attname: Case(
+                    *(When(pk=row.pk, then=Value(getattr(row, field.attname), output_field=field)) for row in batch),
+                    default=F(field.attname), output_field=field,
+                )
+                for field in fields
+            }
+            written += model.objects.filter(unchanged).update(**values)
+        return written
+
+    def default_checkpoint(self):
+        name = type(self).__module__.rsplit('.', 1)[-1]
+        directory = getattr(settings, 'MEDIA_BULK_CHECKPOINT_DIR', None) or os.path.join(settings.BASE_DIR, 'checkpoints')
+        return os.path.join(directory, f'{name}.json')
+
+    @staticmethod
+    def load_checkpoint(path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            raise CommandError(f'Checkpoint {path} is not valid JSON; use --restart to ignore it')
+
+    @staticmethod
+    def save_checkpoint(path, checkpoint):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump(checkpoint, handle)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def rate(count, elapsed):
+        return round(count / elapsed, 1) if elapsed else count
@@ -0,0 +1,129 @@
+"""Pure Pillow encoders run in the media process pool.
+
+Only Pillow is imported here so spawned worker processes start without
+loading Django.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+from . import blurhash
+
+
+EXTENSIONS = {'WEBP': '.webp', 'AVIF': '.avif', 'JPEG': '.jpg', 'PNG': '.png'}
+# EXIF orientation -> transpose that displays the image upright (as ImageOps.exif_transpose)
+ORIENTATIONS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+TRANSPOSED = {5, 6, 7, 8}
+PLACEHOLDER_SIZE = 64
+
+
+def reencode(data, image_format='WEBP', quality=80, max_side=2560):
+    """Re-encode image bytes: apply EXIF orientation, cap the longest side, drop metadata.
+
+    Only the ICC colour profile is kept. Returns the new bytes, or None for
+    animated images, which are stored as uploaded.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, 'is_animated', False):
+            return None
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        out = io.BytesIO()
+        options = {'quality': quality}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        if image_format == 'WEBP':
+            options['method'] = 6
+        image.save(out, image_format, **options)
+        return out.getvalue()
+
+
+def render(data, size, crop, image_format, quality=82):
+    """Encode one resized rendition: bounded to size, or a size x size square when crop"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+
+        out = io.BytesIO()
+        image.save(out, image_format, quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def describe(data):
+    """Layout metadata of image bytes: width, height, dominant colour and BlurHash"""
+    with Image.open(io.BytesIO(data)) as image:
+        return _describe(image)
+
+
+def describe_file(path):
+    """describe() reading straight from a file (no bytes shipped to the worker); None if unreadable"""
+    try:
+        with Image.open(path) as image:
+            return _describe(image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _describe(image):
+    width, height = image.size
+    orientation = image.getexif().get(0x0112)
+    if orientation in TRANSPOSED:
+        width, height = height, width
+
+    # JPEG decodes at 1/2..1/8 scale here; everything below works on a thumbnail
+    image.draft('RGB', (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    small = image.convert('RGB')
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+    if orientation in ORIENTATIONS:
+        small = small.transpose(ORIENTATIONS[orientation])
+
+    palette_image = small.quantize(colors=5)
+    _, index = max(palette_image.getcolors())
+    r, g, b = palette_image.getpalette()[index * 3:index * 3 + 3]
+    return {
+        'width': width,
+        'height': height,
+        'color': f'#{r:02x}{g:02x}{b:02x}',
+        'blurhash': blurhash.encode(small),
+    }
+
+
+class WorkerCall:
+    """Picklable ``worker(path, *args)`` for pool.map, which passes only the path.
+
+    Defined here rather than in bulk so unpickling it in a spawned worker does
+    not import Django.
+    """
+
+    def __init__(self, worker, args):
+        self.worker = worker
+        self.args = tuple(args)
+
+    def __call__(self, path):
+        return self.worker(path, *self.args)
@@ -0,0 +1,172 @@
+"""Garbage collection of unreferenced media files (``manage.py gc_media``).
+
+The referenced set is built once from the database: every image name on
+posts and profiles, every blob still counted by MediaBlob, completed chunked
+uploads waiting to be attached, plus the renditions of all of those and the
+part files of uploads in progress. MEDIA_ROOT is then streamed with
+os.scandir and every file outside that set, and older than the grace period,
+is deleted (or moved to a quarantine directory) by a thread pool.
+
+The grace period protects files written by a request that has not committed
+its row yet. ContentAddressedStorage touches a blob when an identical upload
+arrives, and each file is re-checked just before removal, so a blob that is
+re-uploaded during the run is kept.
+"""
+
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import MediaBlob, MediaUpload, Post, UserProfile
+from .renditions import RENDITIONS, rendition_name
+from .storage import INCOMING_DIR
+from .uploads import UPLOADS_DIR
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def referenced_names(cutoff):
+    """Every media name that must be kept, relative to MEDIA_ROOT"""
+    names = set()
+    names.update(Post.objects.exclude(image='').exclude(image=None).values_list('image', flat=True).iterator())
+    names.update(
+        UserProfile.objects.exclude(profile_picture='').exclude(profile_picture=None)
+        .values_list('profile_picture', flat=True).iterator()
+    )
+    names.update(MediaBlob.objects.filter(refcount__gt=0).values_list('name', flat=True).iterator())
+    # Orphaned recently: a row may still be about to reference it again
+    names.update(MediaBlob.objects.filter(orphaned_at__gt=cutoff).values_list('name', flat=True).iterator())
+    names.update(MediaUpload.objects.exclude(name='').values_list('name', flat=True).iterator())
+    names.update([rendition_name(name, rendition) for name in list(names) for rendition in RENDITIONS])
+
+    names.update(
+        f'{UPLOADS_DIR}/{upload_id}.part'
+        for upload_id in MediaUpload.objects.filter(status='uploading', updated_at__gt=cutoff)
+        .values_list('id', flat=True).iterator()
+    )
+    return names
+
+
+def scan(root):
+    """Yield (relative name, path, stat) for every regular file below root"""
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative_dir))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.path, entry.stat(follow_symlinks=False)
+
+
+def collect_garbage(dry_run=False, quarantine=None, grace=None, workers=8, root=None):
+    """Delete (or quarantine) unreferenced media files; returns a report dict"""
+    started = time.monotonic()
+    root = str(root or settings.MEDIA_ROOT)
+    if grace is None:
+        grace = timedelta(hours=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24))
+    cutoff = timezone.now() - grace
+    cutoff_ts = cutoff.timestamp()
+    quarantine = os.path.abspath(quarantine) if quarantine else None
+
+    keep = referenced_names(cutoff)
+    report = {
+        'dry_run': dry_run,
+        'scanned': 0,
+        'referenced': 0,
+        'recent': 0,
+        'removed': 0,
+        'reclaimed_bytes': 0,
+        'errors': 0,
+    }
+
+    def candidates():
+        for name, path, stat_result in scan(root):
+            if quarantine and path.startswith(quarantine + os.sep):
+                continue
+            report['scanned'] += 1
+            if name in keep:
+                report['referenced'] += 1
+            elif stat_result.st_mtime > cutoff_ts:
+                report['recent'] += 1
+            else:
+                yield name, path, stat_result.st_size
+
+    def remove(batch):
+        removed, errors = [], 0
+        for name, path, size in batch:
+            try:
+                # Re-check: an identical upload since the scan touches the blob
+                if os.stat(path).st_mtime > cutoff_ts:
+                    continue
+                if quarantine:
+                    target = os.path.join(quarantine, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(path, target)
+                else:
+                    os.unlink(path)
+                removed.append((name, size))
+            except FileNotFoundError:
+                continue
+            except OSError:
+                logger.exception('Media gc could not remove name=%s', name)
+                errors += 1
+        return removed, errors
+
+    def tally(removed, errors):
+        report['removed'] += len(removed)
+        report['reclaimed_bytes'] += sum(size for _, size in removed)
+        report['errors'] += errors
+        if removed and not dry_run:
+            _forget(removed)
+
+    files = candidates()
+    batches = iter(lambda: list(islice(files, BATCH_SIZE)), [])
+    if dry_run:
+        for batch in batches:
+            tally([(name, size) for name, _, size in batch], 0)
+    else:
+        # Bounded number of batches in flight, so the scan stays streaming
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-gc') as executor:
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append(executor.submit(remove, batch))
+                if len(in_flight) >= workers * 2:
+                    tally(*in_flight.popleft().result())
+            while in_flight:
+                tally(*in_flight.popleft().result())
+
+    if not dry_run:
+        # Abandoned chunked uploads: their part files are gone with the rest
+        MediaUpload.objects.filter(status='uploading', updated_at__lte=cutoff).delete()
+
+    report['elapsed_s'] = round(time.monotonic() - started, 2)
+    logger.info(
+        'Media gc dry_run=%s scanned=%s removed=%s reclaimed_bytes=%s errors=%s',
+        dry_run, report['scanned'], report['removed'], report['reclaimed_bytes'], report['errors'],
+    )
+    return report
+
+
+def _forget(removed):
+    """Drop the MediaBlob rows of removed blobs that are still unreferenced"""
+    names = [name for name, _ in removed if not name.startswith((INCOMING_DIR + '/', UPLOADS_DIR + '/'))]
+    if names:
+        MediaBlob.objects.filter(name__in=names, refcount=0).delete()
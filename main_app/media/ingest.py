@@ -0,0 +1,127 @@
+"""Post-upload ingestion of post images and profile pictures.
+
+After the row is committed, a media task re-encodes the original to
+MEDIA_IMAGE_FORMAT (orientation applied, metadata stripped, longest side
+capped at MEDIA_IMAGE_MAX_SIDE), points the row at the new blob, stores its
+width, height, dominant colour and BlurHash next to it and writes the
+renditions. The uploaded blob is released, not deleted: another row may
+share it (refs.py).
+
+Until then the placeholders must not describe a previous image: whenever a
+save changes or clears the stored name, a pre_save handler resets them and
+fills width and height from the new file's header.
+"""
+
+import logging
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.signals import pre_save
+
+from .encoding import EXTENSIONS, describe, reencode
+from .refs import MEDIA_FIELDS, release, retain
+from .storage import ADDRESSED_NAME
+from .renditions import field_renditions, generate_renditions
+from .tasks import run_in_process, submit_on_commit
+from .validation import InvalidImage, inspect_image
+
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_KEYS = ('width', 'height', 'color', 'blurhash')
+
+
+def schedule_ingest(field_file):
+    """Queue ingestion of a just-saved image field"""
+    if field_file:
+        instance = field_file.instance
+        submit_on_commit(
+            f'ingest:{field_file.name}',
+            ingest_image, instance._meta.label, instance.pk, field_file.field.name, field_file.name,
+        )
+
+
+def ingest_image(model_label, pk, field_name, name):
+    """Re-encode the stored upload and generate its renditions; returns the final name"""
+    model = apps.get_model(model_label)
+    storage = model._meta.get_field(field_name).storage
+    renditions = field_renditions(model, field_name)
+    if not storage.exists(name):
+        return None
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+
+    image_format = getattr(settings, 'MEDIA_IMAGE_FORMAT', 'WEBP')
+    encoded = run_in_process(
+        reencode, data, image_format,
+        getattr(settings, 'MEDIA_IMAGE_QUALITY', 80),
+        getattr(settings, 'MEDIA_IMAGE_MAX_SIDE', 2560),
+    )
+
+    values = placeholder_values(field_name, run_in_process(describe, data if encoded is None else encoded))
+    final_name = name
+    if encoded is not None:
+        final_name = storage.save(_encoded_name(name, image_format), ContentFile(encoded))
+        values[field_name] = final_name
+    # Only update if the row still points at this upload (it may have been replaced meanwhile)
+    if not model.objects.filter(pk=pk, **{field_name: name}).update(**values):
+        return None
+    if encoded is not None:
+        retain(final_name, storage)
+        release(name)
+        logger.info(
+            'Media ingested name=%s format=%s bytes_in=%s bytes_out=%s',
+            final_name, image_format, len(data), len(encoded),
+        )
+
+    generate_renditions(storage, final_name, renditions)
+    return final_name
+
+
+def placeholder_values(field_name, metadata):
+    """describe() output as model field values: image -> image_width, image_height, ..."""
+    return {f'{field_name}_{key}': metadata[key] for key in PLACEHOLDER_KEYS}
+
+
+def header_placeholders(field_file):
+    """Placeholder values known before ingestion: width and height from the header, nothing else"""
+    metadata = {'width': None, 'height': None, 'color': '', 'blurhash': ''}
+    if not field_file:
+        return metadata
+    try:
+        if field_file._committed:
+            with field_file.storage.open(field_file.name, 'rb') as stored:
+                _, metadata['width'], metadata['height'] = inspect_image(stored)
+        else:
+            _, metadata['width'], metadata['height'] = inspect_image(field_file.file)
+    except (InvalidImage, OSError):
+        pass
+    return metadata
+
+
+def _on_pre_save(sender, instance, **kwargs):
+    # refs.py snapshots the stored names on load and after every save
+    previous = getattr(instance, '_media_names', {})
+    for field_name in MEDIA_FIELDS[sender]:
+        field_file = getattr(instance, field_name)
+        if instance._state.adding or (field_file.name or '') != previous.get(field_name, ''):
+            for attname, value in placeholder_values(field_name, header_placeholders(field_file)).items():
+                setattr(instance, attname, value)
+
+
+def connect_signals():
+    for model in MEDIA_FIELDS:
+        pre_save.connect(_on_pre_save, sender=model, dispatch_uid=f'media_placeholders_{model.__name__}')
+
+
+def _encoded_name(name, image_format):
+    """Upload name for the re-encoded blob: same directory, new extension.
+
+    A content-addressed name is reduced to its upload directory first so the
+    storage does not nest a second digest path under the old one.
+    """
+    directory = ADDRESSED_NAME.sub('', name) if ADDRESSED_NAME.search(name) else os.path.dirname(name)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return '/'.join(part for part in (directory, stem + EXTENSIONS[image_format]) if part)
@@ -0,0 +1,78 @@
+"""Reference counts of stored media blobs.
+
+Post.image and UserProfile.profile_picture hold names of shared,
+content-addressed blobs (storage.py). Signal handlers keep one MediaBlob row
+per name with the number of fields pointing at it: saving a row with a new
+image retains the new name and releases the old one, deleting a row (also by
+cascade) releases its names. A blob whose count drops to zero gets
+``orphaned_at`` set and is left for ``manage.py gc_media``.
+
+QuerySet.update() bypasses the signals; code that swaps names that way
+(ingest.py) calls retain/release itself.
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from ..models import MediaBlob, Post, UserProfile
+
+
+MEDIA_FIELDS = {
+    Post: ('image',),
+    UserProfile: ('profile_picture',),
+}
+
+
+def retain(name, storage=None):
+    if not name:
+        return
+    blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'refcount': 1, 'size': _size(storage, name)})
+    if not created:
+        MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, orphaned_at=None)
+
+
+def release(name):
+    if not name:
+        return
+    MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+    MediaBlob.objects.filter(name=name, refcount=0, orphaned_at=None).update(orphaned_at=timezone.now())
+
+
+def _size(storage, name):
+    try:
+        return storage.size(name) if storage is not None else 0
+    except OSError:
+        return 0
+
+
+def _snapshot(instance, fields):
+    instance._media_names = {field: getattr(instance, field).name or '' for field in fields}
+
+
+def _on_init(sender, instance, **kwargs):
+    _snapshot(instance, MEDIA_FIELDS[sender])
+
+
+def _on_save(sender, instance, created=False, **kwargs):
+    # A new row's constructor arguments are in the snapshot already
+    previous = {} if created else getattr(instance, '_media_names', {})
+    for field in MEDIA_FIELDS[sender]:
+        field_file = getattr(instance, field)
+        name = field_file.name or ''
+        if name != previous.get(field, ''):
+            retain(name, field_file.storage)
+            release(previous.get(field, ''))
+    _snapshot(instance, MEDIA_FIELDS[sender])
+
+
+def _on_delete(sender, instance, **kwargs):
+    for name in getattr(instance, '_media_names', {}).values():
+        release(name)
+
+
+def connect_signals():
+    for model in MEDIA_FIELDS:
+        post_init.connect(_on_init, sender=model, dispatch_uid=f'media_refs_init_{model.__name__}')
+        post_save.connect(_on_save, sender=model, dispatch_uid=f'media_refs_save_{model.__name__}')
+        post_delete.connect(_on_delete, sender=model, dispatch_uid=f'media_refs_delete_{model.__name__}')
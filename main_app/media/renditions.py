@@ -0,0 +1,131 @@
+"""Resized renditions of post images and profile pictures.
+
+Each original ``post_images/run.jpg`` gets renditions stored next to it as
+``post_images/run.card.jpg``, ``post_images/run.detail.jpg`` and so on. They
+are generated in the background after upload (ingest.schedule_ingest); a
+serializer asking for a rendition that does not exist yet gets the original
+URL and queues its generation.
+"""
+
+import os
+import threading
+
+from django.core.files.base import ContentFile
+
+from .encoding import render
+from .tasks import run_in_process, submit
+
+
+# name -> longest-side bound; crop renditions are cut to a square first
+RENDITIONS = {
+    'card': {'size': 640, 'crop': False},
+    'detail': {'size': 1280, 'crop': False},
+    'avatar': {'size': 160, 'crop': True},
+}
+
+# '<model_name>.<field name>' -> renditions generated for that field
+FIELD_RENDITIONS = {
+    'post.image': ('card', 'detail'),
+    'userprofile.profile_picture': ('avatar',),
+}
+
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP', '.avif': 'AVIF'}
+QUALITY = 82
+
+# Renditions already seen in storage, so serializers skip the exists() call
+_known = set()
+_known_lock = threading.Lock()
+KNOWN_LIMIT = 50000
+
+
+def renditions_for(field_file):
+    return field_renditions(field_file.instance, field_file.field.name)
+
+
+def field_renditions(model, field_name):
+    """Renditions of a model (class or instance) image field"""
+    return FIELD_RENDITIONS.get(f'{model._meta.model_name}.{field_name}', ())
+
+
+def rendition_name(name, rendition):
+    """post_images/run.jpg -> post_images/run.card.jpg (unknown formats become .jpg)"""
+    root, ext = os.path.splitext(name)
+    ext = ext.lower() if ext.lower() in FORMATS else '.jpg'
+    return f'{root}.{rendition}{ext}'
+
+
+def generate_renditions(storage, name, renditions):
+    """Write every missing rendition of storage file name"""
+    missing = [rendition for rendition in renditions if not storage.exists(rendition_name(name, rendition))]
+    if not missing or not storage.exists(name):
+        return []
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+
+    written = []
+    for rendition in missing:
+        target = rendition_name(name, rendition)
+        spec = RENDITIONS[rendition]
+        image_format = FORMATS[os.path.splitext(target)[1]]
+        encoded = run_in_process(render, data, spec['size'], spec['crop'], image_format, QUALITY)
+        if hasattr(storage, 'save_derived'):
+            storage.save_derived(target, ContentFile(encoded))
+        else:
+            saved = storage.save(target, ContentFile(encoded))
+            if saved != target:
+                # Another worker wrote it first; keep theirs
+                storage.delete(saved)
+        _remember(target)
+        written.append(target)
+    return written
+
+
+def delete_renditions(storage, name, renditions):
+    for rendition in renditions:
+        target = rendition_name(name, rendition)
+        storage.delete(target)
+        with _known_lock:
+            _known.discard(target)
+
+
+def rendition_url(field_file, rendition):
+    """URL of a rendition, or of the original (queuing the rendition) until it exists"""
+    if not field_file:
+        return None
+    target = rendition_name(field_file.name, rendition)
+    if _is_known(target) or field_file.storage.exists(target):
+        _remember(target)
+        return field_file.storage.url(target)
+    submit(
+        f'renditions:{field_file.name}',
+        generate_renditions, field_file.storage, field_file.name, renditions_for(field_file),
+    )
+    return field_file.url
+
+
+def rendition_urls(field_file):
+    """{'original': url, '<rendition>': url, ...} for an image field"""
+    if not field_file:
+        return None
+    urls = {'original': field_file.url}
+    for rendition in renditions_for(field_file):
+        urls[rendition] = rendition_url(field_file, rendition)
+    return urls
+
+
+def _is_known(name):
+    with _known_lock:
+        return name in _known
+
+
+def _remember(name):
+    with _known_lock:
+        if len(_known) >= KNOWN_LIMIT:
+            _known.clear()
+        _known.add(name)
+
+
+def forget_known():
+    """Clear the existence cache (tests)"""
+    with _known_lock:
+        _known.clear()
@@ -0,0 +1,173 @@
+"""Serving uploaded media.
+
+Content-addressed names (storage.py) never change content, so they are sent
+with a year-long ``immutable`` Cache-Control and their file name as ETag;
+other names get MEDIA_CACHE_MAX_AGE. Conditional requests get 304 and a
+single byte range gets 206, so clients and CDNs revalidate and resume
+without refetching.
+
+The bytes themselves never pass through Python when it can be avoided:
+- MEDIA_SENDFILE = 'x-accel-redirect' hands the file to nginx (an
+  ``internal`` location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT);
+- MEDIA_SENDFILE = 'x-sendfile' does the same for Apache/lighttpd;
+- otherwise a FileResponse of the open file is returned, which WSGI servers
+  with ``wsgi.file_wrapper`` (gunicorn, uWSGI) send with sendfile(2). Ranges
+  are served from a file positioned at the range start with Content-Length
+  set to the range length, so that path stays zero-copy too.
+"""
+
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from .storage import addressed_digest
+
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class _RangeFile:
+    """File positioned at a range start that reads at most length bytes"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+@require_safe
+def serve_media(request, path):
+    """GET/HEAD one file below MEDIA_ROOT"""
+    # Dot directories hold in-progress writes (.incoming, .uploads)
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('Not found')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('Not found')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Not found')
+
+    size = stat_result.st_size
+    etag = _etag(path, stat_result)
+    headers = {
+        'Cache-Control': cache_control(path),
+        'ETag': etag,
+        'Last-Modified': http_date(stat_result.st_mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return HttpResponseNotModified(headers=headers)
+
+    offload = getattr(settings, 'MEDIA_SENDFILE', '')
+    if offload:
+        # The proxy handles Range and streams the file itself
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if offload == 'x-accel-redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (not if_range or if_range in (etag, headers['Last-Modified'])):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            headers['Content-Range'] = f'bytes */{size}'
+            return HttpResponse(status=416, headers=headers)
+
+    if request.method == 'HEAD':
+        headers['Content-Length'] = size
+        return HttpResponse(content_type=content_type, headers=headers)
+    if byte_range is None:
+        return FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(
+        _RangeFile(open(full_path, 'rb'), start, length),
+        status=206, content_type=content_type, headers=headers,
+    )
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def cache_control(path):
+    if addressed_digest(path):
+        return IMMUTABLE
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    """(start, end) of a single 'bytes=' range, or None to send the whole file.
+
+    Malformed and multi-range headers are ignored (the whole file is a valid
+    answer to both); a range starting past the end raises RangeNotSatisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash or not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+        return None
+
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(int(last) if last else size - 1, size - 1)
+
+
+def _not_modified(request, etag, mtime):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.1.3)
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+    if_modified_since = request.headers.get('If-Modified-Since')
+    return bool(if_modified_since) and not was_modified_since(if_modified_since, mtime)
+
+
+def _etag(path, stat_result):
+    if addressed_digest(path):
+        return f'"{os.path.basename(path)}"'
+    return f'"{int(stat_result.st_mtime)}-{stat_result.st_size}"'
@@ -0,0 +1,91 @@
+"""Content-addressed file storage for uploaded media.
+
+An upload to ``post_images/run.jpg`` is streamed to a temporary file while
+it is hashed and stored as ``post_images/3f/a9/3fa9...e1.jpg`` (its SHA-256).
+If that blob already exists the write is skipped, so a re-posted photo costs
+no space and shares its URL (and every cache entry) with the first copy.
+Names never change content, which makes them safe to cache forever.
+
+Blobs are shared between rows, so they are never deleted when a row lets go
+of them: MediaBlob reference counts (refs.py) mark unreferenced blobs and
+``manage.py gc_media`` removes them.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+ADDRESSED_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(?:\.[^/]*)?$')
+INCOMING_DIR = '.incoming'
+
+
+def addressed_digest(name):
+    """SHA-256 hex digest of a content-addressed name, or None for any other name"""
+    match = ADDRESSED_NAME.search(name or '')
+    return match.group(3) if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is the digest, chosen in _save; identical content maps to one name
+        return name
+
+    def _save(self, name, content):
+        temp_path, digest = self._stream_to_temp(content)
+        final_name = self._addressed_name(name, digest)
+        self._commit(temp_path, final_name)
+        return final_name
+
+    def save_derived(self, name, content):
+        """Store a file under exactly this name (renditions named after their blob)"""
+        temp_path, _ = self._stream_to_temp(content)
+        self._commit(temp_path, name)
+        return name
+
+    def adopt(self, path, name, digest):
+        """Move an already hashed local file (a finished chunked upload) into place without copying"""
+        final_name = self._addressed_name(name, digest)
+        self._commit(path, final_name)
+        return final_name
+
+    def _addressed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return '/'.join(part for part in (directory, digest[:2], digest[2:4], digest + ext) if part)
+
+    def _stream_to_temp(self, content):
+        incoming = os.path.join(self.location, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, digest.hexdigest()
+
+    def _commit(self, temp_path, name):
+        path = self.path(name)
+        if os.path.exists(path):
+            # Duplicate upload: the blob is already stored. Touch it so the
+            # garbage collector's grace period restarts.
+            os.unlink(temp_path)
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_path, self.file_permissions_mode)
+        os.replace(temp_path, path)
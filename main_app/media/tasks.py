@@ -0,0 +1,94 @@
+"""Background media processing.
+
+Tasks (storage reads and writes, database updates) run on a bounded thread
+pool; the CPU-heavy Pillow encoding inside them is sent to a process pool
+with run_in_process so it does not compete with request threads for the GIL.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'MEDIA_WORKERS', 2),
+            thread_name_prefix='media',
+        )
+    return _executor
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn: forking a process that runs request and media threads can deadlock
+        _process_pool = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'MEDIA_PROCESSES', 2),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _process_pool
+
+
+def run_in_process(fn, *args):
+    """fn(*args) in the media process pool (inline with MEDIA_PROCESSES = 0); fn must be picklable"""
+    if getattr(settings, 'MEDIA_PROCESSES', 2) == 0:
+        return fn(*args)
+    with _lock:
+        pool = _get_process_pool()
+    return pool.submit(fn, *args).result()
+
+
+def submit(key, fn, *args):
+    """Run fn(*args) on the media pool unless a task with the same key is already queued.
+
+    With MEDIA_WORKERS = 0 the task runs inline (tests, management commands).
+    Returns False when the task was deduplicated.
+    """
+    with _lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+
+    if getattr(settings, 'MEDIA_WORKERS', 2) == 0:
+        _run(key, fn, args)
+        return True
+    with _lock:
+        executor = _get_executor()
+    executor.submit(_run, key, fn, args)
+    return True
+
+
+def submit_on_commit(key, fn, *args):
+    """submit() once the current transaction commits, so workers see the saved row"""
+    transaction.on_commit(lambda: submit(key, fn, *args))
+
+
+def _run(key, fn, args):
+    close_old_connections()
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception('Media task failed key=%s', key)
+    finally:
+        with _lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
@@ -0,0 +1,215 @@
+"""Resumable chunked image uploads.
+
+A client creates a MediaUpload (filename, total size, kind), then PUTs the
+bytes in chunks, each tagged with the offset it starts at. Chunks are
+streamed from the request into ``MEDIA_ROOT/.uploads/<id>.part`` at that
+offset, so a retried chunk simply rewrites the same bytes and memory per
+request stays at one read buffer. After a dropped connection the client
+asks for the current offset and continues from there.
+
+The SHA-256 is updated chunk by chunk in the worker that received them. If a
+chunk lands on another worker, or the server restarted, the part file is
+re-hashed once. Completion claims the upload (status 'verifying') before
+checking it, so of two concurrent completes only one verifies it. The part
+file is then moved into the content-addressed storage without copying, and
+the upload can be attached to a post or profile by id.
+"""
+
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from ..models import MediaUpload
+from .validation import InvalidImage, inspect_image
+
+
+UPLOADS_DIR = '.uploads'
+READ_SIZE = 64 * 1024
+
+UPLOAD_TO = {
+    'post_image': 'post_images/',
+    'profile_picture': 'profile_pics/',
+}
+
+
+class UploadError(Exception):
+    """Invalid upload request; the message is safe to show to the client"""
+
+
+class UploadBusyError(UploadError):
+    """Another request is completing this upload right now"""
+
+
+class OffsetMismatchError(UploadError):
+    """Chunk does not start at the upload's current offset"""
+
+    def __init__(self, offset):
+        super().__init__(f'Chunk must start at offset {offset}')
+        self.offset = offset
+
+
+# upload id -> (offset, hasher) for uploads whose chunks arrived in this process
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def part_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, UPLOADS_DIR, f'{upload.id}.part')
+
+
+def max_upload_size():
+    return getattr(settings, 'MEDIA_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+def create_upload(user, kind, filename, size, sha256=''):
+    if kind not in UPLOAD_TO:
+        raise UploadError(f"kind must be one of: {', '.join(UPLOAD_TO)}")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be the total file size in bytes')
+    if size <= 0:
+        raise UploadError('size must be the total file size in bytes')
+    if size > max_upload_size():
+        raise UploadError(f'File too large. Maximum size is {max_upload_size() // (1024 * 1024)}MB.')
+    filename = os.path.basename(filename or '') or 'upload'
+
+    upload = MediaUpload.objects.create(
+        user=user, kind=kind, filename=filename[:255], size=size, sha256=(sha256 or '').lower(),
+    )
+    os.makedirs(os.path.dirname(part_path(upload)), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """Write length bytes from stream at offset; returns the new offset"""
+    if upload.status != 'uploading':
+        raise UploadError('Upload is already complete')
+    if offset != upload.received:
+        raise OffsetMismatchError(upload.received)
+    max_chunk = getattr(settings, 'MEDIA_UPLOAD_MAX_CHUNK', 8 * 1024 * 1024)
+    if length <= 0 or length > max_chunk:
+        raise UploadError(f'Chunk size must be between 1 and {max_chunk} bytes')
+    if offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared upload size')
+
+    hasher = _hasher_at(upload, offset)
+    written = 0
+    with open(part_path(upload), 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            hasher.update(data)
+            written += len(data)
+    if written != length:
+        raise UploadError('Connection closed before the whole chunk arrived')
+
+    # Only one concurrent writer of this chunk advances the offset, and only
+    # its hasher (a private copy) is published for the next chunk
+    if not MediaUpload.objects.filter(id=upload.id, received=offset).update(received=offset + length):
+        upload.refresh_from_db()
+        raise OffsetMismatchError(upload.received)
+    with _hashers_lock:
+        _hashers[upload.id] = (offset + length, hasher)
+    upload.received = offset + length
+    return upload.received
+
+
+def complete_upload(upload):
+    """Verify the assembled file and move it into media storage"""
+    if upload.status == 'verifying':
+        raise UploadBusyError('Upload is being completed by another request')
+    if upload.status != 'uploading':
+        return upload
+    if upload.received != upload.size:
+        raise OffsetMismatchError(upload.received)
+    # Claim the upload so a concurrent complete does not verify and move it twice
+    if not MediaUpload.objects.filter(id=upload.id, status='uploading', received=upload.size).update(status='verifying'):
+        upload.refresh_from_db()
+        if upload.status == 'verifying':
+            raise UploadBusyError('Upload is being completed by another request')
+        if upload.status == 'uploading':
+            raise OffsetMismatchError(upload.received)
+        return upload
+
+    try:
+        _store_upload(upload)
+    except Exception:
+        MediaUpload.objects.filter(id=upload.id, status='verifying').update(status='uploading')
+        raise
+    return upload
+
+
+def _store_upload(upload):
+    path = part_path(upload)
+    digest = _hasher_at(upload, upload.size).hexdigest()
+    _drop_hasher(upload)
+    if upload.sha256 and upload.sha256 != digest:
+        raise UploadError('Checksum mismatch: the uploaded bytes differ from the declared sha256')
+    try:
+        inspect_image(path)
+    except InvalidImage as exc:
+        raise UploadError(str(exc))
+
+    target = UPLOAD_TO[upload.kind] + upload.filename
+    if hasattr(default_storage, 'adopt'):
+        upload.name = default_storage.adopt(path, target, digest)
+    else:
+        with open(path, 'rb') as part:
+            upload.name = default_storage.save(target, File(part))
+        os.unlink(path)
+    upload.sha256 = digest
+    upload.status = 'complete'
+    upload.save(update_fields=['name', 'sha256', 'status', 'updated_at'])
+
+
+def take_completed_upload(user, upload_id, kind):
+    """Completed upload of this user and kind, marked attached.
+
+    Raises UploadError when there is no such upload and UploadBusyError while
+    it is still receiving chunks or being verified (it has no stored file yet).
+    """
+    try:
+        upload = MediaUpload.objects.get(id=upload_id, user=user, kind=kind)
+    except (MediaUpload.DoesNotExist, ValidationError, ValueError):
+        raise UploadError('Upload not found')
+    if upload.status not in ('complete', 'attached'):
+        raise UploadBusyError('Upload is not complete')
+    if upload.status == 'complete':
+        upload.status = 'attached'
+        upload.save(update_fields=['status', 'updated_at'])
+    return upload
+
+
+def _hasher_at(upload, offset):
+    """Private SHA-256 state covering the first offset bytes of the part file"""
+    with _hashers_lock:
+        cached = _hashers.get(upload.id)
+        if cached and cached[0] == offset:
+            # Concurrent retries of a chunk each update their own copy
+            return cached[1].copy()
+
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(part_path(upload), 'rb') as part:
+        while remaining:
+            data = part.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def _drop_hasher(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
@@ -0,0 +1,57 @@
+"""Request-path image validation that reads only the header.
+
+Image.open parses the header (format, mode, size) without decoding pixel
+data, which is enough to reject non-images, unsupported formats and
+decompression bombs before anything is stored. The full decode happens once,
+in the background ingest (ingest.py), where a corrupt body fails the task
+instead of a request.
+"""
+
+import warnings
+
+from django.conf import settings
+from PIL import Image
+
+from .encoding import TRANSPOSED
+
+
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF', 'AVIF', 'HEIF'}
+DEFAULT_MAX_PIXELS = 50_000_000
+EXIF_ORIENTATION = 0x0112
+
+
+class InvalidImage(ValueError):
+    """Upload is not an acceptable image; the message is safe to show to the client"""
+
+
+def max_image_pixels():
+    return getattr(settings, 'MEDIA_MAX_IMAGE_PIXELS', DEFAULT_MAX_PIXELS)
+
+
+def inspect_image(file):
+    """(format, width, height) from the image header of a path or file object; raises InvalidImage.
+
+    Width and height are as displayed, with the EXIF orientation applied.
+    """
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        with warnings.catch_warnings():
+            # Over Image.MAX_IMAGE_PIXELS Pillow only warns; the limit is checked below
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+                if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED:
+                    width, height = height, width
+    except Image.DecompressionBombError:
+        raise InvalidImage('Image dimensions are too large.')
+    except Exception:
+        raise InvalidImage('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+    finally:
+        if position is not None:
+            file.seek(position)
+
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidImage(f'Unsupported image format: {image_format}')
+    if width * height > max_image_pixels():
+        raise InvalidImage(f'Image dimensions are too large ({width}x{height}).')
+    return image_format, width, height
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_aijob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GymEquipment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField(unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('name_ar', models.CharField(blank=True, max_length=100)),
+                ('instructions', models.JSONField(blank=True, default=dict)),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(choices=[('general', 'General'), ('adaptive', 'Adaptive'), ('equipment', 'Gym equipment'), ('pregnancy', 'Pregnancy'), ('postpartum', 'Postpartum'), ('diastasis', 'Diastasis recti')], max_length=20)),
+                ('title', models.CharField(max_length=200)),
+                ('trainer', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('duration', models.CharField(blank=True, max_length=50)),
+                ('difficulty', models.CharField(blank=True, max_length=30)),
+                ('link', models.URLField(max_length=500)),
+                ('description', models.TextField(blank=True)),
+                ('condition', models.CharField(blank=True, help_text='Adaptive category (wheelchair, joint, balance, general)', max_length=30)),
+                ('captions', models.BooleanField(default=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['collection', 'position'],
+                'indexes': [models.Index(fields=['collection', 'difficulty'], name='main_app_ca_collect_488884_idx'), models.Index(fields=['collection', 'condition'], name='main_app_ca_collect_1a0392_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExerciseImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('exercise', 'Exercise'), ('adaptive', 'Adaptive')], default='exercise', max_length=10)),
+                ('key', models.SlugField()),
+                ('name', models.CharField(max_length=100)),
+                ('url', models.URLField(max_length=500)),
+                ('description', models.TextField(blank=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SafetyAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('pregnancy', 'Pregnancy'), ('postpartum', 'Postpartum'), ('diastasis', 'Diastasis recti')], max_length=20)),
+                ('key', models.SlugField()),
+                ('keyword_ar', models.CharField(max_length=100)),
+                ('keyword_en', models.CharField(max_length=100)),
+                ('response_ar', models.TextField()),
+                ('response_en', models.TextField()),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['mode', 'position'],
+                'unique_together': {('mode', 'key')},
+            },
+        ),
+    ]
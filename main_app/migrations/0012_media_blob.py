@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:44
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_existing_references(apps, schema_editor):
+    """One MediaBlob per image name already referenced by posts and profiles"""
+    Post = apps.get_model('main_app', 'Post')
+    UserProfile = apps.get_model('main_app', 'UserProfile')
+    MediaBlob = apps.get_model('main_app', 'MediaBlob')
+
+    counts = Counter(Post.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+    counts.update(UserProfile.objects.exclude(profile_picture='').exclude(profile_picture=None)
+                  .values_list('profile_picture', flat=True))
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, refcount=refcount) for name, refcount in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_ai_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('orphaned_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(count_existing_references, migrations.RunPython.noop),
+    ]
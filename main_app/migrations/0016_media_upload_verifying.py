@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_workout_plan_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediaupload',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('verifying', 'Verifying'), ('complete', 'Complete'), ('attached', 'Attached')], default='uploading', max_length=10),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -20,6 +22,22 @@ class WorkoutPlan(models.Model):
     def __str__(self):
         return self.title
 
+
+class WorkoutPlanVersion(models.Model):
+    """Single-row counter bumped whenever a global (user=None) workout plan changes (plan_cache.py signals)"""
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=1).update(version=models.F('version') + 1)
+        if not updated:
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+    def __str__(self):
+        return f"Workout plan version {self.version}"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     height = models.IntegerField(null=True, blank=True, help_text="Height in cm")
@@ -29,6 +47,11 @@ class UserProfile(models.Model):
     goal = models.CharField(max_length=100, blank=True)  
     activity_level = models.CharField(max_length=100, blank=True) 
     profile_picture = models.ImageField(upload_to="profile_pics/", null=True, blank=True)
+    # Layout placeholders, filled in by media ingestion (main_app/media/ingest.py)
+    profile_picture_width = models.PositiveIntegerField(null=True, blank=True)
+    profile_picture_height = models.PositiveIntegerField(null=True, blank=True)
+    profile_picture_color = models.CharField(max_length=7, blank=True, help_text="Dominant colour, #rrggbb")
+    profile_picture_blurhash = models.CharField(max_length=64, blank=True)
     bio = models.TextField(blank=True)
     followers_count = models.PositiveIntegerField(default=0)
     following_count = models.PositiveIntegerField(default=0)
@@ -46,6 +69,11 @@ class Post(models.Model):
     workout_plan = models.OneToOneField(WorkoutPlan, on_delete=models.SET_NULL, null=True, blank=True, related_name="post")
     content = models.TextField()
     image = models.ImageField(upload_to="post_images/", null=True, blank=True)
+    # Layout placeholders, filled in by media ingestion (main_app/media/ingest.py)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_color = models.CharField(max_length=7, blank=True, help_text="Dominant colour, #rrggbb")
+    image_blurhash = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -102,3 +130,211 @@ class Follow(models.Model):
         following_profile, _ = UserProfile.objects.get_or_create(user=self.following)
         following_profile.followers_count = Follow.objects.filter(following=self.following).count()
         following_profile.save()
+
+
+class ChatMessage(models.Model):
+    """Stored AI coach conversation turns (one row per message)"""
+    ROLE_CHOICES = [
+        ('user', 'User'),
+        ('assistant', 'Assistant'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_messages")
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    token_estimate = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['user', 'id'])]
+
+    def __str__(self):
+        return f"{self.role} message by {self.user.username} - {self.created_at}"
+
+
+class ConversationSummary(models.Model):
+    """Rolling summary of chat turns that no longer fit the history token budget"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="conversation_summary")
+    summary = models.TextField(blank=True)
+    last_message_id = models.PositiveBigIntegerField(default=0, help_text="Turns up to this ChatMessage id are folded into the summary")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Conversation summary for {self.user.username}"
+
+
+class AIJob(models.Model):
+    """Chat request processed in the background and polled by the client"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ai_jobs")
+    message = models.TextField()
+    request_data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"AI job {self.id} ({self.status}) for {self.user.username}"
+
+
+class CatalogVersion(models.Model):
+    """Single-row counter bumped whenever the AI coach catalog changes"""
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=1).update(version=models.F('version') + 1)
+        if not updated:
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+class CatalogEntry(models.Model):
+    """Base for AI coach catalog rows; edits bump CatalogVersion (ai/catalog.py signals) so workers reload"""
+
+    class Meta:
+        abstract = True
+
+
+class CatalogVideo(CatalogEntry):
+    """Workout video recommended by the AI coach"""
+    COLLECTION_CHOICES = [
+        ('general', 'General'),
+        ('adaptive', 'Adaptive'),
+        ('equipment', 'Gym equipment'),
+        ('pregnancy', 'Pregnancy'),
+        ('postpartum', 'Postpartum'),
+        ('diastasis', 'Diastasis recti'),
+    ]
+    collection = models.CharField(max_length=20, choices=COLLECTION_CHOICES)
+    title = models.CharField(max_length=200)
+    trainer = models.CharField(max_length=100, blank=True, db_index=True)
+    duration = models.CharField(max_length=50, blank=True)
+    difficulty = models.CharField(max_length=30, blank=True)
+    link = models.URLField(max_length=500)
+    description = models.TextField(blank=True)
+    condition = models.CharField(max_length=30, blank=True, help_text="Adaptive category (wheelchair, joint, balance, general)")
+    captions = models.BooleanField(default=True)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['collection', 'position']
+        indexes = [
+            models.Index(fields=['collection', 'difficulty']),
+            models.Index(fields=['collection', 'condition']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.collection})"
+
+
+class GymEquipment(CatalogEntry):
+    """Gym machine with step-by-step usage instructions"""
+    key = models.SlugField(max_length=50, unique=True)
+    name = models.CharField(max_length=100)
+    name_ar = models.CharField(max_length=100, blank=True)
+    instructions = models.JSONField(default=dict, blank=True)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return self.name
+
+
+class ExerciseImage(CatalogEntry):
+    """Exercise form image, either general or adaptive"""
+    KIND_CHOICES = [
+        ('exercise', 'Exercise'),
+        ('adaptive', 'Adaptive'),
+    ]
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='exercise')
+    key = models.SlugField(max_length=50)
+    name = models.CharField(max_length=100)
+    url = models.URLField(max_length=500)
+    description = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('kind', 'key')
+
+    def __str__(self):
+        return f"{self.name} ({self.kind})"
+
+
+class SafetyAlert(CatalogEntry):
+    """Symptom keyword that stops a pregnancy/postpartum/diastasis workout"""
+    MODE_CHOICES = [
+        ('pregnancy', 'Pregnancy'),
+        ('postpartum', 'Postpartum'),
+        ('diastasis', 'Diastasis recti'),
+    ]
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    key = models.SlugField(max_length=50)
+    keyword_ar = models.CharField(max_length=100)
+    keyword_en = models.CharField(max_length=100)
+    response_ar = models.TextField()
+    response_en = models.TextField()
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['mode', 'position']
+        unique_together = ('mode', 'key')
+
+    def __str__(self):
+        return f"{self.mode}: {self.keyword_en}"
+
+
+class MediaBlob(models.Model):
+    """Stored media file and the number of Post/UserProfile image fields pointing at it"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    orphaned_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class MediaUpload(models.Model):
+    """Resumable chunked upload of an image, attached to a post or profile once complete"""
+    KIND_CHOICES = [
+        ('post_image', 'Post image'),
+        ('profile_picture', 'Profile picture'),
+    ]
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('verifying', 'Verifying'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="media_uploads")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    name = models.CharField(max_length=255, blank=True, help_text="Stored file name once complete")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size}) - {self.status}"
@@ -0,0 +1,93 @@
+"""Per-worker cache of the serialized global (user=None) workout plans.
+
+The seeded plans are the same for every user and rarely change, yet the list
+endpoint re-queried and re-serialized them on every request. Each worker now
+keeps them serialized in memory and reloads only when WorkoutPlanVersion
+changes, checking the version row at most every WORKOUT_PLAN_CHECK_INTERVAL
+seconds. Signal handlers bump the version whenever a plan that is, or was
+when loaded, global is saved or deleted, including queryset and admin bulk
+deletes; QuerySet.update() on global plans must bump it itself. A request only queries the user's
+own plans, joined to their user, and merges the two lists by created_at.
+
+The cached dicts are shared between requests and must not be mutated.
+"""
+
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+
+from .models import WorkoutPlan, WorkoutPlanVersion
+from .serializers import WorkoutPlanSerializer
+
+
+_snapshot = None  # (version, [(created_at, goal_type, data), ...] newest first)
+_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def global_plans():
+    """This worker's serialized global plans, reloaded only when WorkoutPlanVersion changes"""
+    global _snapshot, _checked_at
+    interval = getattr(settings, 'WORKOUT_PLAN_CHECK_INTERVAL', 5)
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _checked_at < interval:
+        return snapshot[1]
+
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _checked_at < interval:
+            return _snapshot[1]
+        version = WorkoutPlanVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+        if _snapshot is None or _snapshot[0] != version:
+            plans = list(WorkoutPlan.objects.filter(user=None).order_by('-created_at'))
+            data = WorkoutPlanSerializer(plans, many=True).data
+            _snapshot = (version, [(plan.created_at, plan.goal_type, item) for plan, item in zip(plans, data)])
+        _checked_at = time.monotonic()
+        return _snapshot[1]
+
+
+def list_workout_plans(user, goal_type=None):
+    """Serialized global and personal plans of user, newest first"""
+    personal = WorkoutPlan.objects.filter(user=user).select_related('user').order_by('-created_at')
+    if goal_type:
+        personal = personal.filter(goal_type=goal_type)
+    personal = list(personal)
+    own = [(plan.created_at, plan.goal_type, item)
+           for plan, item in zip(personal, WorkoutPlanSerializer(personal, many=True).data)]
+    shared = [entry for entry in global_plans() if not goal_type or entry[1] == goal_type]
+
+    merged = heapq.merge(own, shared, key=lambda entry: entry[0], reverse=True)
+    return [item for _, _, item in merged]
+
+
+def reset_plan_cache():
+    """Drop this worker's cached plans so the next call reloads (used by tests)"""
+    global _snapshot, _checked_at
+    with _snapshot_lock:
+        _snapshot = None
+        _checked_at = 0.0
+
+
+def _on_init(sender, instance, **kwargs):
+    # Whether the row is a global plan as loaded; a deferred user_id counts as personal
+    instance._loaded_global = instance.__dict__.get('user_id', 0) is None
+
+
+def _on_save(sender, instance, **kwargs):
+    # A plan entering or leaving the global set changes it too
+    if instance.user_id is None or instance._loaded_global:
+        WorkoutPlanVersion.bump()
+    instance._loaded_global = instance.user_id is None
+
+
+def _on_delete(sender, instance, **kwargs):
+    if instance.user_id is None or instance._loaded_global:
+        WorkoutPlanVersion.bump()
+
+
+def connect_signals():
+    post_init.connect(_on_init, sender=WorkoutPlan, dispatch_uid='plan_cache_init')
+    post_save.connect(_on_save, sender=WorkoutPlan, dispatch_uid='plan_cache_save')
+    post_delete.connect(_on_delete, sender=WorkoutPlan, dispatch_uid='plan_cache_delete')
@@ -1,6 +1,29 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from .models import UserProfile, WorkoutPlan, Post, Comment
+from .media.renditions import rendition_url, rendition_urls
+from .media.uploads import max_upload_size
+from .media.validation import InvalidImage, inspect_image
+
+
+class HeaderImageField(serializers.FileField):
+    """Image upload checked from its header only (format, dimensions, pixel count).
+
+    Replaces serializers.ImageField, which has Pillow verify the whole file
+    in the request; the full decode happens once, in background ingestion.
+    """
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        if file.size > max_upload_size():
+            raise serializers.ValidationError(
+                f'Image file too large. Maximum size is {max_upload_size() // (1024 * 1024)}MB.')
+        try:
+            inspect_image(file)
+        except InvalidImage as exc:
+            raise serializers.ValidationError(str(exc))
+        return file
+
 
 class UserSerializer(serializers.ModelSerializer):
     
@@ -35,6 +58,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
     user_id = serializers.IntegerField(source='user.id', read_only=True)
     selected_workout_plan_detail = WorkoutPlanSerializer(source='selected_workout_plan', read_only=True)
+    profile_picture = HeaderImageField(required=False, allow_null=True, max_length=None)
+    profile_picture_renditions = serializers.SerializerMethodField()
+    
+    def get_profile_picture_renditions(self, obj):
+        return rendition_urls(obj.profile_picture)
     
     def to_representation(self, instance):
         """Override to filter age/height based on privacy settings"""
@@ -57,10 +85,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ('id', 'user_id', 'username', 'email', 'height', 'age', 'current_weight', 'target_weight', 
-                  'goal', 'activity_level', 'profile_picture', 'bio', 'followers_count', 
+                  'goal', 'activity_level', 'profile_picture', 'profile_picture_renditions', 'profile_picture_width',
+                  'profile_picture_height', 'profile_picture_color', 'profile_picture_blurhash', 'bio', 'followers_count', 
                   'following_count', 'selected_workout_plan', 'selected_workout_plan_detail',
                   'show_age_public', 'show_height_public', 'show_fitness_info_public')
-        read_only_fields = ('followers_count', 'following_count', 'username', 'email', 'user_id', 'selected_workout_plan_detail')
+        read_only_fields = ('followers_count', 'following_count', 'username', 'email', 'user_id', 'selected_workout_plan_detail',
+                            'profile_picture_renditions', 'profile_picture_width', 'profile_picture_height',
+                            'profile_picture_color', 'profile_picture_blurhash')
         extra_kwargs = {
             'age': {'required': False, 'allow_null': True},
             'height': {'required': False, 'allow_null': True},
@@ -83,26 +114,31 @@ class PostSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     user_profile_picture = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    image_renditions = serializers.SerializerMethodField()
     comments = CommentSerializer(many=True, read_only=True)
     comments_count = serializers.IntegerField(source='comments.count', read_only=True)
-    image = serializers.ImageField(required=False, allow_null=True, max_length=None)
+    image = HeaderImageField(required=False, allow_null=True, max_length=None)
     
     def get_user_profile_picture(self, obj):
         try:
             profile = obj.user.profile
             if profile and profile.profile_picture:
-                return profile.profile_picture.url
+                return rendition_url(profile.profile_picture, 'avatar')
         except Exception:
             pass
         return None
     
     def get_image_url(self, obj):
-        if obj.image:
-            return obj.image.url
-        return None
+        # Feed lists get the card rendition, PostDetailView asks for 'detail'
+        return rendition_url(obj.image, self.context.get('image_rendition', 'card'))
+    
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj.image)
     
     class Meta:
         model = Post
         fields = ('id', 'user', 'user_username', 'user_profile_picture', 'workout_plan', 'content', 'image', 'image_url',
-                  'created_at', 'comments', 'comments_count')
-        read_only_fields = ('created_at', 'user_username', 'user_profile_picture', 'image_url', 'comments_count')
\ No newline at end of file
+                  'image_renditions', 'image_width', 'image_height', 'image_color', 'image_blurhash', 'created_at',
+                  'comments', 'comments_count')
+        read_only_fields = ('created_at', 'user_username', 'user_profile_picture', 'image_url', 'image_renditions',
+                            'image_width', 'image_height', 'image_color', 'image_blurhash', 'comments_count')
\ No newline at end of file
@@ -0,0 +1,1007 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..ai import metrics
+from ..ai.ai_generator import IN_FLIGHT_REQUESTS, USER_BEHAVIOR_STATE, AIEngine, generate_ai_response, run_ai_request
+from ..ai.benchmark import replay_call_log, run_benchmark
+from ..ai.call_log import CallLogWriter, get_writer, log_files, read_call_log
+from ..ai.client import CircuitBreaker, CircuitOpenError, OpenAIClient, UpstreamError, reset_client
+from ..ai.catalog import get_catalog, load_catalog_from_python, reset_catalog
+from ..ai.fake_upstream import FakeUpstream
+from ..ai.coalesce import SingleFlight, request_key
+from ..ai.history import pack_history, record_exchange
+from ..ai.disabilities import get_adaptive_video_recommendation
+from ..ai.pregnancy import build_diastasis_mode_context, get_pregnancy_video_recommendation
+from ..ai.retrieval import relevant_equipment_fields, select_relevant_guidance
+from ..ai.routing import select_route
+from ..ai.semantic_cache import RESPONSE_CACHE, HashedNgramVectorizer, SemanticCache, is_follow_up
+from ..ai.throttling import TokenBucket
+from ..ai.prompts import SYSTEM_PROMPT
+from ..ai.utils import estimate_tokens
+from ..ai.videos import get_video_recommendation
+from ..ai import jobs
+from ..models import AIJob, CatalogVersion, CatalogVideo, ChatMessage, ConversationSummary, GymEquipment, UserProfile
+
+
+def fake_completion(text='Keep going!', status_code=200):
+    """Build a mocked requests.Response carrying a Responses API payload"""
+    response = mock.Mock()
+    response.status_code = status_code
+    response.json.return_value = {
+        'output': [{'type': 'message', 'content': [{'type': 'output_text', 'text': text}]}],
+    }
+    response.text = text
+    return response
+
+
+class ScriptedUpstream:
+    """Local HTTP server that answers POSTs from a list of (status, delay) steps"""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.calls = 0
+        self.lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with upstream.lock:
+                    index = min(upstream.calls, len(upstream.steps) - 1)
+                    upstream.calls += 1
+                status_code, delay = upstream.steps[index]
+                time.sleep(delay)
+                body = json.dumps({
+                    'output': [{'type': 'message', 'content': [{'type': 'output_text', 'text': f'reply {index}'}]}],
+                    'error': {'message': 'upstream failure'},
+                }).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1/responses'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AIEngineTestCase(TestCase):
+    """Base test case with a profiled user and a fake OpenAI key"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='coachuser', password='testpass123', first_name='Sara')
+        self.profile = UserProfile.objects.create(
+            user=self.user,
+            height=165,
+            age=30,
+            current_weight=70.0,
+            target_weight=62.0,
+            goal='Lose weight',
+            activity_level='Moderate',
+        )
+        USER_BEHAVIOR_STATE.clear()
+        IN_FLIGHT_REQUESTS.clear()
+        RESPONSE_CACHE.clear()
+        cache.clear()
+        reset_catalog()
+        metrics.reset()
+        reset_client()
+        env = mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test'})
+        env.start()
+        self.addCleanup(env.stop)
+
+
+class ConversationHistoryTestCase(TestCase):
+    """Test the token-budgeted conversation history packer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatuser', password='testpass123')
+
+    def test_estimate_tokens(self):
+        """Test token estimates for empty, English and Arabic text"""
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('abcd' * 10), 10)
+        self.assertGreater(estimate_tokens('مرحبا بك'), estimate_tokens('hi there'))
+
+    def test_empty_history(self):
+        """Test a user without stored turns gets no history"""
+        self.assertEqual(pack_history(self.user), [])
+
+    def test_recent_turns_kept_verbatim(self):
+        """Test short histories are returned in order without a summary"""
+        record_exchange(self.user, 'hello', 'hi! how can I help?')
+        record_exchange(self.user, 'leg day ideas?', 'try squats and lunges')
+
+        messages = pack_history(self.user, budget=1000)
+
+        self.assertEqual([m['role'] for m in messages], ['user', 'assistant', 'user', 'assistant'])
+        self.assertEqual(messages[0]['content'], 'hello')
+        self.assertEqual(messages[-1]['content'], 'try squats and lunges')
+        self.assertFalse(ConversationSummary.objects.filter(user=self.user).exists())
+
+    def test_old_turns_folded_into_summary(self):
+        """Test turns over budget are collapsed into a stored rolling summary"""
+        for i in range(20):
+            record_exchange(self.user, f'question number {i} ' + 'x' * 80, f'answer number {i} ' + 'y' * 80)
+
+        budget = 200
+        messages = pack_history(self.user, budget=budget)
+
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('Summary of earlier conversation', messages[0]['content'])
+        self.assertEqual(messages[-1]['content'], 'answer number 19 ' + 'y' * 80)
+        total = sum(estimate_tokens(m['content']) for m in messages)
+        self.assertLessEqual(total, budget + 10)
+
+        summary = ConversationSummary.objects.get(user=self.user)
+        verbatim_count = len(messages) - 1
+        oldest_verbatim = ChatMessage.objects.filter(user=self.user).order_by('-id')[verbatim_count - 1]
+        self.assertLess(summary.last_message_id, oldest_verbatim.id)
+
+    def test_turns_older_than_the_window_are_folded(self):
+        """Test unfolded turns older than the fetched window reach the summary instead of being skipped"""
+        for i in range(20):
+            record_exchange(self.user, f'q{i}', f'a{i}')
+
+        # 30 one-token turns stay verbatim; a4 overflows the fetch, q0..q4 are older still
+        messages = pack_history(self.user, budget=40)
+
+        self.assertEqual(messages[1]['content'], 'q5')
+        self.assertEqual(messages[0]['content'].split('\n')[1:], ['User: q3', 'Coach: a3', 'User: q4', 'Coach: a4'])
+        summary = ConversationSummary.objects.get(user=self.user)
+        self.assertEqual(summary.last_message_id, ChatMessage.objects.get(user=self.user, content='a4').id)
+
+    def test_summary_is_reused(self):
+        """Test a second pack without new turns does not rewrite the summary"""
+        for i in range(20):
+            record_exchange(self.user, f'question {i} ' + 'x' * 80, f'answer {i} ' + 'y' * 80)
+
+        first = pack_history(self.user, budget=200)
+        updated_at = ConversationSummary.objects.get(user=self.user).updated_at
+        second = pack_history(self.user, budget=200)
+
+        self.assertEqual(first, second)
+        self.assertEqual(ConversationSummary.objects.get(user=self.user).updated_at, updated_at)
+
+
+class PromptAssemblyTestCase(AIEngineTestCase):
+    """Test the static prompt prefix and prompt size accounting"""
+
+    def test_system_prompt_is_static_prefix(self):
+        """Test the first message is the unmodified system prompt for every user"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            AIEngine(self.user, 'hello coach', {}).generate()
+
+        messages = post.call_args.kwargs['json']['input']
+        self.assertEqual(messages[0], {'role': 'system', 'content': SYSTEM_PROMPT})
+        self.assertIn('User name: Sara', messages[-1]['content'])
+
+    def test_prompt_sizes_recorded(self):
+        """Test per-section character and token counts are tracked"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()):
+            engine = AIEngine(self.user, 'hello coach', {})
+            engine.generate()
+
+        self.assertEqual(engine.prompt_sizes['system']['chars'], len(SYSTEM_PROMPT))
+        self.assertGreater(engine.prompt_sizes['profile']['tokens'], 0)
+        self.assertEqual(engine.prompt_sizes['pregnancy']['chars'], 0)
+        snapshot = metrics.snapshot()
+        self.assertIn('ai_prompt_tokens{section=profile}', snapshot['histograms'])
+
+
+class ResilientClientTestCase(TestCase):
+    """Test retries, circuit breaking and hedging against a local upstream"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def start_upstream(self, steps):
+        upstream = ScriptedUpstream(steps)
+        self.addCleanup(upstream.close)
+        return upstream
+
+    def test_retries_retryable_status(self):
+        """Test a 503 followed by a 200 succeeds after one retry"""
+        upstream = self.start_upstream([(503, 0), (200, 0)])
+        client = OpenAIClient(url=upstream.url, max_retries=2, sleep=lambda s: None)
+
+        completion = client.post({}, {})
+
+        self.assertEqual(completion['output'][0]['content'][0]['text'], 'reply 1')
+        self.assertEqual(upstream.calls, 2)
+
+    def test_non_retryable_status_fails_fast(self):
+        """Test a 400 is not retried"""
+        upstream = self.start_upstream([(400, 0), (200, 0)])
+        client = OpenAIClient(url=upstream.url, max_retries=2, sleep=lambda s: None)
+
+        with self.assertRaises(UpstreamError) as ctx:
+            client.post({}, {})
+
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(upstream.calls, 1)
+
+    def test_circuit_opens_and_recovers(self):
+        """Test the breaker rejects calls while open and closes after a good probe"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        upstream = self.start_upstream([(500, 0), (500, 0), (200, 0)])
+        client = OpenAIClient(url=upstream.url, max_retries=1, breaker=breaker, sleep=lambda s: None)
+
+        with self.assertRaises(UpstreamError):
+            client.post({}, {})
+        with self.assertRaises(CircuitOpenError) as ctx:
+            client.post({}, {})
+        self.assertEqual(upstream.calls, 2)
+        self.assertEqual(ctx.exception.retry_after, 10)
+
+        now[0] = 11.0
+        client.post({}, {})
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_hedged_request_beats_slow_first_call(self):
+        """Test a hedge is fired once the first call exceeds the latency percentile"""
+        for _ in range(5):
+            metrics.observe('ai_upstream_latency_ms', 50)
+        upstream = self.start_upstream([(200, 1.0), (200, 0)])
+        client = OpenAIClient(url=upstream.url, hedge_percentile=95, hedge_min_samples=5)
+
+        started = time.monotonic()
+        completion = client.post({}, {})
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(completion['output'][0]['content'][0]['text'], 'reply 1')
+        self.assertEqual(metrics.snapshot()['counters']['ai_upstream_hedges'], 1)
+
+    def test_half_open_probe_is_not_hedged(self):
+        """Test the single half-open probe is not joined by a hedge"""
+        for _ in range(5):
+            metrics.observe('ai_upstream_latency_ms', 50)
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 11.0
+        upstream = self.start_upstream([(200, 0.3)])
+        client = OpenAIClient(url=upstream.url, breaker=breaker, hedge_percentile=95, hedge_min_samples=5)
+
+        client.post({}, {})
+
+        self.assertEqual(upstream.calls, 1)
+        self.assertNotIn('ai_upstream_hedges', metrics.snapshot()['counters'])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_hedged_attempt_counts_one_failure(self):
+        """Test a failed attempt and its failed hedge feed the breaker a single failure"""
+        for _ in range(5):
+            metrics.observe('ai_upstream_latency_ms', 50)
+        breaker = CircuitBreaker(failure_threshold=2)
+        upstream = self.start_upstream([(500, 0.3), (500, 0)])
+        client = OpenAIClient(url=upstream.url, max_retries=0, breaker=breaker, hedge_percentile=95, hedge_min_samples=5)
+
+        with self.assertRaises(UpstreamError):
+            client.post({}, {})
+
+        self.assertEqual(upstream.calls, 2)
+        self.assertEqual((breaker.failures, breaker.state), (1, CircuitBreaker.CLOSED))
+
+    def test_open_circuit_returns_503(self):
+        """Test the chat handler maps an open circuit to 503 with Retry-After"""
+        user = User.objects.create_user(username='breakeruser', password='testpass123')
+        UserProfile.objects.create(user=user)
+        with mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test'}), \
+                mock.patch('main_app.ai.ai_generator.get_client') as get_client:
+            get_client.return_value.post.side_effect = CircuitOpenError(7)
+            response = generate_ai_response(user, 'hello', {})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+
+class RequestCoalescingTestCase(AIEngineTestCase):
+    """Test single-flight coalescing of duplicate chat submissions"""
+
+    def test_concurrent_calls_share_one_run(self):
+        """Test concurrent callers with the same key run the function once"""
+        flight = SingleFlight(result_ttl=0)
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            return 'reply'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True])
+        self.assertTrue(all(result == 'reply' for result, _ in results))
+
+    def test_request_key_depends_on_message_and_flags(self):
+        """Test keys differ per user, message and request flags"""
+        base = request_key(1, 'hi', {'message': 'hi'})
+        self.assertEqual(base, request_key(1, 'hi', {}))
+        self.assertNotEqual(base, request_key(2, 'hi', {}))
+        self.assertNotEqual(base, request_key(1, 'hello', {}))
+        self.assertNotEqual(base, request_key(1, 'hi', {'pregnancy_mode': True}))
+
+    def test_retry_reuses_cached_reply(self):
+        """Test a resubmitted workout message neither calls upstream nor recounts the workout"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            first = generate_ai_response(self.user, 'I finished workout today', {})
+            count_after_first = USER_BEHAVIOR_STATE[self.user.id]['workout_count_this_week']
+            second = generate_ai_response(self.user, 'I finished workout today', {})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(USER_BEHAVIOR_STATE[self.user.id]['workout_count_this_week'], count_after_first)
+
+    def test_errors_are_not_cached(self):
+        """Test a failed call is retried on resubmission"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion(status_code=400)) as post:
+            generate_ai_response(self.user, 'hello', {})
+            generate_ai_response(self.user, 'hello', {})
+
+        self.assertEqual(post.call_count, 2)
+
+
+class BackgroundJobTestCase(TransactionTestCase):
+    """Test async job mode for the chat endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobuser', password='testpass123')
+        UserProfile.objects.create(user=self.user, current_weight=70.0, target_weight=65.0)
+        USER_BEHAVIOR_STATE.clear()
+        IN_FLIGHT_REQUESTS.clear()
+        RESPONSE_CACHE.clear()
+        cache.clear()
+        reset_client()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        env = mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def wait_for_job(self, poll_url):
+        for _ in range(100):
+            response = self.client.get(poll_url)
+            if response.data['status'] in ('done', 'failed'):
+                return response
+            time.sleep(0.05)
+        self.fail('job did not finish')
+
+    def test_async_request_returns_job_and_result(self):
+        """Test async mode answers 202 with a job id, then the poll returns the reply"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion('Background reply')):
+            response = self.client.post(reverse('openai-chat'), {'message': 'hello', 'async': True}, format='json')
+            self.assertEqual(response.status_code, 202)
+            result = self.wait_for_job(response.data['poll_url'])
+
+        self.assertEqual(result.data['status'], 'done')
+        self.assertEqual(result.data['result']['message'], 'Background reply')
+        self.assertEqual(AIJob.objects.get(id=response.data['job_id']).request_data, {})
+
+    def test_other_users_cannot_poll_job(self):
+        """Test a job is only visible to its owner"""
+        job = AIJob.objects.create(user=self.user, message='hi')
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.force_authenticate(other)
+
+        response = self.client.get(reverse('openai-job', args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_form_request_flags_are_kept(self):
+        """Test multipart/form flags survive into the job (QueryDict values are lists)"""
+        data = QueryDict(mutable=True)
+        data.update({'message': 'hello', 'async': 'true', 'detail_level': 'brief'})
+
+        self.assertEqual(jobs._json_safe(data), {'detail_level': 'brief'})
+
+    def test_abandoned_job_fails_on_poll(self):
+        """Test a job left queued by a restart is reported failed once it passes AI_JOB_TIMEOUT"""
+        job = AIJob.objects.create(user=self.user, message='hi')
+        recent = AIJob.objects.create(user=self.user, message='hi again')
+        AIJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(minutes=10))
+
+        response = self.client.get(reverse('openai-job', args=[job.id]))
+        self.assertEqual((response.data['status'], response.data['status_code']), ('failed', 504))
+        self.assertEqual(self.client.get(reverse('openai-job', args=[recent.id])).data['status'], 'queued')
+
+        # A worker that finally reaches the expired job leaves it alone
+        with mock.patch.object(jobs, '_pending', 1):
+            jobs._run_job(job.id)
+        self.assertEqual(AIJob.objects.get(id=job.id).status_code, 504)
+
+    def test_prune_command_removes_old_jobs(self):
+        """Test prune_ai_jobs fails stale jobs and deletes finished ones past the retention period"""
+        old = timezone.now() - timedelta(days=10)
+        done = AIJob.objects.create(user=self.user, message='old', status='done', finished_at=old)
+        stale = AIJob.objects.create(user=self.user, message='stuck', status='running')
+        fresh = AIJob.objects.create(user=self.user, message='new', status='done', finished_at=timezone.now())
+        AIJob.objects.filter(id__in=[done.id, stale.id]).update(created_at=old)
+
+        call_command('prune_ai_jobs', stdout=StringIO())
+
+        self.assertEqual(set(AIJob.objects.values_list('id', flat=True)), {stale.id, fresh.id})
+        self.assertEqual(AIJob.objects.get(id=stale.id).status, 'failed')
+
+    @override_settings(AI_JOB_QUEUE_LIMIT=0)
+    def test_queue_limit_applies_backpressure(self):
+        """Test a full queue rejects new jobs with 503 and Retry-After"""
+        response = self.client.post(reverse('openai-chat'), {'message': 'hello', 'async': True}, format='json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(jobs.queue_depth(), 0)
+
+
+class LocalFastPathTestCase(AIEngineTestCase):
+    """Test deterministic answers that skip the upstream call"""
+
+    def chat(self, message):
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion('model reply')) as post:
+            response = generate_ai_response(self.user, message, {})
+        return response, post
+
+    def test_pregnancy_safety_alert_answered_locally(self):
+        """Test an alert keyword in pregnancy mode gets the canned stop message"""
+        response, post = self.chat('I am pregnant month 5 and I have bleeding')
+
+        self.assertEqual(post.call_count, 0)
+        self.assertEqual(response.data['tier'], 'local')
+        self.assertEqual(response.data['local_intent'], 'safety_alert')
+        self.assertIn('see a doctor immediately', response.data['message'])
+
+    def test_equipment_how_to_answered_locally(self):
+        """Test a how-to question about known equipment returns its instructions"""
+        response, post = self.chat('how to use the leg press machine?')
+
+        self.assertEqual(post.call_count, 0)
+        self.assertEqual(response.data['local_intent'], 'equipment')
+        self.assertIn('Leg Press Machine', response.data['message'])
+        self.assertIn('Never lock knees at top', response.data['message'])
+
+    def test_video_request_answered_locally(self):
+        """Test a short video request returns a catalog video"""
+        response, post = self.chat('give me a video')
+
+        self.assertEqual(post.call_count, 0)
+        self.assertEqual(response.data['local_intent'], 'video')
+        self.assertIn('youtube.com', response.data['message'])
+
+    def test_other_messages_go_upstream(self):
+        """Test ordinary chat is still answered by the model"""
+        response, post = self.chat('what should I eat after training?')
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(response.data['tier'], 'llm')
+        self.assertEqual(response.data['message'], 'model reply')
+        self.assertNotIn('local_intent', response.data)
+
+
+class ModelRoutingTestCase(AIEngineTestCase):
+    """Test detail-level and mode aware model routing"""
+
+    def test_greeting_uses_small_model(self):
+        """Test short messages go to the cheap model with a small budget"""
+        route = select_route('hi coach', {})
+
+        self.assertEqual(route['name'], 'micro')
+        self.assertEqual(route['model'], 'gpt-4.1-mini')
+        self.assertEqual(route['max_output_tokens'], 150)
+
+    def test_plan_request_uses_large_model(self):
+        """Test plan requests keep the large model and a larger budget"""
+        route = select_route('can you build me a full meal plan for this week', {})
+
+        self.assertEqual(route['name'], 'detailed')
+        self.assertEqual(route['model'], 'gpt-4.1')
+        self.assertEqual(route['max_output_tokens'], 700)
+
+    def test_sensitive_mode_upgrades_route(self):
+        """Test pregnancy mode forces the large model and a minimum budget"""
+        route = select_route('hi coach', {'pregnancy_mode': {'enabled': True}})
+
+        self.assertEqual(route['name'], 'micro+pregnancy')
+        self.assertEqual(route['model'], 'gpt-4.1')
+        self.assertEqual(route['max_output_tokens'], 300)
+
+    def test_route_applied_to_payload(self):
+        """Test the routed model is sent upstream and latency is recorded per route"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            AIEngine(self.user, 'hello', {}).generate()
+
+        payload = post.call_args.kwargs['json']
+        self.assertEqual(payload['model'], 'gpt-4.1-mini')
+        self.assertEqual(payload['max_output_tokens'], 150)
+        self.assertIn('ai_route_latency_ms{route=micro}', metrics.snapshot()['histograms'])
+
+
+class SemanticCacheTestCase(AIEngineTestCase):
+    """Test the embedding-keyed response cache"""
+
+    def test_vectorizer_matches_paraphrases(self):
+        """Test near-identical wording scores higher than an unrelated question"""
+        vectorizer = HashedNgramVectorizer()
+        base = vectorizer.transform('How do I use the leg press?')
+        close = vectorizer.transform('how do i use the leg press')
+        far = vectorizer.transform('what should I eat before bed')
+
+        self.assertAlmostEqual(float(base @ close), 1.0, places=5)
+        self.assertGreater(float(base @ close), float(base @ far) + 0.5)
+
+    def test_entries_expire(self):
+        """Test lookups ignore entries older than the TTL"""
+        now = [0.0]
+        cache = SemanticCache(threshold=0.9, ttl=60, capacity=4, clock=lambda: now[0])
+        cache.store('en|cut|normal', 'how many rest days per week', 'Two rest days.')
+
+        self.assertEqual(cache.lookup('en|cut|normal', 'How many rest days per week?')[0], 'Two rest days.')
+        self.assertIsNone(cache.lookup('en|bulk|normal', 'how many rest days per week')[0])
+        now[0] = 61
+        self.assertIsNone(cache.lookup('en|cut|normal', 'how many rest days per week')[0])
+
+    def test_similar_question_served_from_cache(self):
+        """Test a second user in the same bucket reuses a reply written without anyone's details"""
+        other = User.objects.create_user(username='other', password='testpass123', first_name='Lina')
+        UserProfile.objects.create(
+            user=other, height=165, age=28, current_weight=70.0, target_weight=60.0,
+            goal='Lose weight', activity_level='Moderate',
+        )
+        record_exchange(other, 'which exercises work the glutes', 'Squats and hip thrusts.')
+        message = 'is it better to stretch before or after running'
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion('Stretch after.')) as post:
+            first = AIEngine(self.user, message, {})
+            first.generate()
+            second = AIEngine(other, message + '?', {})
+            content = second.generate()
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(first.tier, 'llm')
+        self.assertEqual(second.tier, 'cache')
+        self.assertEqual(content, 'Stretch after.')
+        prompt = post.call_args.kwargs['json']['input']
+        self.assertEqual([message['role'] for message in prompt], ['system', 'user'])
+        self.assertNotIn('Sara', prompt[-1]['content'])
+        self.assertNotIn('Current weight', prompt[-1]['content'])
+
+    def test_standalone_question_after_history_is_cacheable(self):
+        """Test earlier turns only block the cache for messages that refer back to them"""
+        message = 'how long should a warm up take before lifting'
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            AIEngine(self.user, message, {}).generate()
+            engine = AIEngine(self.user, message, {})
+            engine.generate()
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(engine.tier, 'cache')
+
+    def test_follow_up_detection(self):
+        """Test messages that lean on earlier turns are told apart from standalone questions"""
+        for message in ('and the second one?', 'why?', 'what about squats instead', 'وش عن التمرين الثاني'):
+            self.assertTrue(is_follow_up(message), message)
+        for message in ('how do I use the leg press', 'كيف استخدم جهاز ضغط الأرجل'):
+            self.assertFalse(is_follow_up(message), message)
+
+    def test_buckets_are_bounded(self):
+        """Test buckets grow with their entries and the least recently used one is evicted"""
+        cache = SemanticCache(capacity=512, max_buckets=2)
+        for bucket in ('a', 'b'):
+            cache.store(bucket, 'how many rest days per week', 'Two.')
+        cache.lookup('a', 'how many rest days per week')
+        cache.store('c', 'how many rest days per week', 'Two.')
+
+        self.assertEqual(list(cache._buckets), ['a', 'c'])
+        self.assertEqual(len(cache._buckets['a'].vectors), 8)
+
+    def test_follow_ups_bypass_cache(self):
+        """Test a turn sent with conversation history never reads or fills the cache"""
+        record_exchange(self.user, 'which exercises work the glutes', 'Squats and hip thrusts.')
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            for _ in range(2):
+                engine = AIEngine(self.user, 'and the second one?', {})
+                engine.generate()
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(engine.tier, 'llm')
+        self.assertEqual(metrics.snapshot()['counters']['ai_semantic_cache{outcome=bypass}'], 2)
+
+    def test_personal_messages_bypass_cache(self):
+        """Test messages with the user's own numbers always go upstream"""
+        message = 'i weigh 70 kg is it better to stretch before or after running'
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()) as post:
+            AIEngine(self.user, message, {}).generate()
+            engine = AIEngine(self.user, message, {})
+            engine.generate()
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(engine.tier, 'llm')
+        self.assertEqual(metrics.snapshot()['counters']['ai_semantic_cache{outcome=bypass}'], 2)
+
+
+
+class StageTimingTestCase(AIEngineTestCase):
+    """Test per-stage timing of a chat request"""
+
+    def test_stages_recorded(self):
+        """Test each stage of an upstream request feeds its own histogram"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()):
+            AIEngine(self.user, 'hello', {}).generate()
+
+        histograms = metrics.snapshot()['histograms']
+        for stage in ('profile_query', 'build_context', 'history', 'upstream', 'record_exchange'):
+            self.assertEqual(histograms[f'ai_stage_ms{{stage={stage}}}']['count'], 1)
+        self.assertIn('ai_stage_ms{stage=detectors}', histograms)
+
+    @override_settings(AI_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        """Test the Server-Timing header lists the stages when enabled"""
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()):
+            response_data, status_code, headers = run_ai_request(self.user, 'hello', {})
+
+        self.assertEqual(status_code, 200)
+        self.assertIn('build_context;dur=', headers['Server-Timing'])
+        self.assertIn('upstream;dur=', headers['Server-Timing'])
+        self.assertTrue(headers['Server-Timing'].split(', ')[-1].startswith('total;dur='))
+
+
+class ThrottleTestCase(AIEngineTestCase):
+    """Test token-bucket rate limits on the chat endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def chat(self):
+        with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion()):
+            return self.client.post(reverse('openai-chat'), {'message': 'hello'}, format='json')
+
+    def test_bucket_refills_over_time(self):
+        """Test a bucket allows its burst, then one token per 1/rate seconds"""
+        now = [0.0]
+        bucket = TokenBucket(cache, 'test-bucket', '60/min', 2, clock=lambda: now[0])
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 1.0)
+        now[0] = 1.0
+        self.assertEqual(bucket.take(), 0)
+
+    def test_contended_lock_fails_closed(self):
+        """Test a bucket whose lock is busy throttles, and only a stuck lock lets requests through"""
+        bucket = TokenBucket(cache, 'test-bucket', '60/min', 2)
+        cache.set('test-bucket:lock', time.time())
+
+        self.assertGreater(bucket.take(), 0)
+        cache.set('test-bucket:lock', time.time() - 10)
+        self.assertEqual(bucket.take(), 0)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(counters['ai_throttle_lock_timeouts{holder=busy}'], 1)
+        self.assertEqual(counters['ai_throttle_lock_timeouts{holder=stuck}'], 1)
+
+    @override_settings(AI_THROTTLE_USER_LIMIT={'rate': '1/min', 'burst': 1})
+    def test_user_limit_returns_429_with_retry_after(self):
+        """Test a user over their limit gets 429 and Retry-After, and a mode gets its own limit"""
+        self.assertEqual(self.chat().status_code, 200)
+        response = self.chat()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(metrics.snapshot()['counters']['ai_throttled{scope=user}'], 1)
+
+        USER_BEHAVIOR_STATE[self.user.id]['pregnancy_mode'] = {'enabled': True}
+        self.assertEqual(self.chat().status_code, 200)
+
+    @override_settings(AI_THROTTLE_GLOBAL_LIMIT={'rate': '1/min', 'burst': 1})
+    def test_global_limit_applies_across_users(self):
+        """Test the global bucket limits every user together"""
+        self.assertEqual(self.chat().status_code, 200)
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+
+        response = self.chat()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(metrics.snapshot()['counters']['ai_throttled{scope=global}'], 1)
+
+
+
+class CallLogTestCase(AIEngineTestCase):
+    """Test the append-only AI call log"""
+
+    def setUp(self):
+        super().setUp()
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, True)
+
+    def test_generate_records_call(self):
+        """Test each generate call is written with its context hash, route and reply"""
+        with override_settings(AI_CALL_LOG_DIR=self.log_dir):
+            with mock.patch('main_app.ai.client.requests.post', return_value=fake_completion('Logged reply')):
+                AIEngine(self.user, 'hello', {'message': 'hello'}).generate()
+            get_writer().flush()
+
+        [record] = list(read_call_log([self.log_dir]))
+        self.assertEqual(record['message'], 'hello')
+        self.assertEqual(record['reply'], 'Logged reply')
+        self.assertEqual(record['model'], 'gpt-4.1-mini')
+        self.assertEqual(len(record['context_hash']), 16)
+        self.assertIn('upstream', record['stages_ms'])
+        self.assertIsNone(record['error'])
+
+    def test_files_rotate_and_old_ones_are_removed(self):
+        """Test the writer starts a new file past max_bytes and keeps only the newest backups"""
+        writer = CallLogWriter(self.log_dir, max_bytes=200, backups=2)
+        for index in range(10):
+            writer.submit({'ts': str(index), 'message': 'x' * 100})
+        writer.close()
+
+        self.assertEqual(len(log_files(self.log_dir)), 2)
+        self.assertEqual([record['ts'] for record in read_call_log([self.log_dir])], ['8', '9'])
+
+    def test_rotation_keeps_other_workers_active_files(self):
+        """Test pruning skips another process's newest (possibly open) file"""
+        for stamp in ('20260101T000000000000', '20260101T000001000000'):
+            with gzip.open(os.path.join(self.log_dir, f'ai-calls-{stamp}-99999.jsonl.gz'), 'wb') as handle:
+                handle.write(b'{}\n')
+        writer = CallLogWriter(self.log_dir, max_bytes=200, backups=1)
+        for index in range(3):
+            writer.submit({'ts': str(index), 'message': 'x' * 100})
+        writer.close()
+
+        names = [path.name for path in log_files(self.log_dir)]
+        self.assertEqual(names[0], 'ai-calls-20260101T000001000000-99999.jsonl.gz')
+        self.assertEqual(len(names), 2)
+
+
+class PromptRetrievalTestCase(TestCase):
+    """Test retrieval of relevant catalog snippets for the prompt"""
+
+    def test_equipment_fields_follow_question(self):
+        """Test a specific question narrows the instructions but keeps safety notes"""
+        self.assertIsNone(relevant_equipment_fields('leg_press', 'how do I use the leg press'))
+        self.assertEqual(
+            relevant_equipment_fields('leg_press', 'how heavy should a beginner start on the leg press'),
+            {'beginner_weight', 'safety'},
+        )
+        self.assertIn('breathing', relevant_equipment_fields('leg_press', 'كيف اتنفس في جهاز ضغط الأرجل'))
+
+    def test_mode_guidance_keeps_safety_rules(self):
+        """Test optional sections are dropped unless relevant while safety rules stay"""
+        context = build_diastasis_mode_context({'stage': 2, 'separation_fingers': 2}, {'age': 30}, {'tdee': 2000}, 'english')
+
+        trimmed = select_relevant_guidance(context, 'is walking ok today')
+        self.assertIn('CRITICAL SAFETY RULES', trimmed)
+        self.assertIn('NO Crunches', trimmed)
+        self.assertIn('IMPORTANT CHECK', trimmed)
+        self.assertNotIn('WORKOUT PLAN FORMAT', trimmed)
+        self.assertLess(len(trimmed), len(context))
+
+        planned = select_relevant_guidance(context, 'give me a weekly plan')
+        self.assertIn('WORKOUT PLAN FORMAT', planned)
+
+    def test_mode_guidance_matches_arabic_questions(self):
+        """Test Arabic pain reports keep the stop rule and Arabic workout requests keep the plan format"""
+        context = build_diastasis_mode_context({'stage': 2, 'separation_fingers': 2}, {'age': 30}, {'tdee': 2000}, 'arabic')
+
+        pain = select_relevant_guidance(context, 'عندي ألم جديد في بطني')
+        self.assertIn('If user reports new pain', pain)
+        self.assertIn('PROGRESS MONITORING', pain)
+        self.assertIn('WORKOUT PLAN FORMAT', select_relevant_guidance(context, 'اعطني تمارين اليوم'))
+        self.assertIn('WORKOUT PLAN FORMAT', select_relevant_guidance(context, 'ابغى خطة للأسبوع'))
+
+    def test_sections_with_stop_rules_are_kept(self):
+        """Test an optional section is never dropped while it carries a stop rule"""
+        context = 'SAFETY:\nNo crunches\n\nPROGRESS MONITORING:\nTrack gap.\nIf dizzy → stop and rest.'
+
+        self.assertEqual(select_relevant_guidance(context, 'what should I eat'), context)
+
+    @override_settings(AI_RETRIEVAL_ENABLED=False)
+    def test_disabled_keeps_full_context(self):
+        """Test the full context is sent when retrieval is switched off"""
+        context = build_diastasis_mode_context({'stage': 2, 'separation_fingers': 2}, {}, {}, 'english')
+
+        self.assertEqual(select_relevant_guidance(context, 'hello'), context)
+
+
+class VideoCatalogTestCase(TestCase):
+    """Test the bitmask-indexed video catalog and pickers"""
+
+    def setUp(self):
+        reset_catalog()
+
+    def test_general_videos_do_not_repeat_until_exhausted(self):
+        """Test every general video is shown once before any repeats"""
+        state = {}
+        total = len(get_catalog().videos.videos_in(get_catalog().videos.mask(collection='general')))
+
+        titles = [get_video_recommendation(state, {}, 'english')['title'] for _ in range(total)]
+        self.assertEqual(len(set(titles)), total)
+        self.assertIsNotNone(get_video_recommendation(state, {}, 'english'))
+
+    def test_dislikes_exclude_titles(self):
+        """Test disliked exercises are filtered by title"""
+        state = {'preferences': {'workout_dislikes': ['jumping', 'cardio']}}
+
+        for _ in range(10):
+            title = get_video_recommendation(state, {}, 'english')['title'].lower()
+            self.assertNotIn('jumping', title)
+            self.assertNotIn('cardio', title)
+
+    def test_title_mask_matches_whole_phrase(self):
+        """Test a dislike matches titles containing the whole phrase, not its words scattered"""
+        videos = get_catalog().videos
+
+        titles = [video['title'] for video in videos.videos_in(videos.title_mask('Beginner Workout'))]
+        self.assertEqual(titles, ['Pamela Reif – 10 min Beginner Workout'])
+        self.assertEqual(videos.title_mask('workout beginner'), 0)
+        self.assertTrue(videos.title_mask('low impact') & videos.title_mask('LOW-IMPACT STRENGTH'))
+
+    def test_title_mask_cache_is_bounded(self):
+        """Test title masks for free-text dislikes evict the least recently used entry"""
+        reset_catalog()
+        videos = get_catalog().videos
+        with mock.patch('main_app.ai.catalog.TITLE_MASK_CACHE_SIZE', 2):
+            for text in ('yoga', 'cardio', 'yoga', 'core'):
+                videos.title_mask(text)
+
+        self.assertEqual(list(videos._title_masks), ['yoga', 'core'])
+
+    def test_adaptive_videos_match_condition(self):
+        """Test adaptive picks only use the user's category or general videos"""
+        state = {}
+        for _ in range(6):
+            video = get_adaptive_video_recommendation(state, {'wheelchair_use': True}, 'english')
+            self.assertIn(video['category'], ('wheelchair', 'general'))
+
+    def test_pregnancy_videos_rotate_trainers(self):
+        """Test consecutive pregnancy picks use different trainers"""
+        state = {}
+        first = get_pregnancy_video_recommendation(state, 'english')
+        second = get_pregnancy_video_recommendation(state, 'english')
+
+        self.assertNotEqual(first['trainer'], second['trainer'])
+
+
+@override_settings(AI_CATALOG_CHECK_INTERVAL=0)
+class CatalogStoreTestCase(TestCase):
+    """Test the database-backed catalog and per-worker snapshots"""
+
+    def setUp(self):
+        reset_catalog()
+        self.addCleanup(reset_catalog)
+
+    def test_falls_back_to_python_data(self):
+        """Test the prompts.py data is served before the catalog is loaded"""
+        catalog = get_catalog()
+
+        self.assertIsNone(catalog.version)
+        self.assertIn('leg_press', catalog.gym_equipment)
+
+    def test_loader_and_reload_on_version_change(self):
+        """Test loaded rows are served and an edit triggers exactly one reload"""
+        counts = load_catalog_from_python()
+        self.assertEqual(counts['videos'], CatalogVideo.objects.count())
+
+        loaded = get_catalog()
+        self.assertEqual(loaded.version, CatalogVersion.objects.get(pk=1).version)
+        self.assertEqual(loaded.safety_alerts['pregnancy']['bleeding']['en'], 'bleeding')
+        self.assertIs(get_catalog(), loaded)
+
+        machine = GymEquipment.objects.get(key='leg_press')
+        machine.name = 'Leg Press'
+        machine.save()
+
+        reloaded = get_catalog()
+        self.assertIsNot(reloaded, loaded)
+        self.assertEqual(reloaded.gym_equipment['leg_press']['name'], 'Leg Press')
+
+    def test_bulk_delete_triggers_reload(self):
+        """Test a queryset delete (admin "delete selected") also bumps the version"""
+        load_catalog_from_python()
+        loaded = get_catalog()
+
+        GymEquipment.objects.filter(key='leg_press').delete()
+
+        self.assertNotIn('leg_press', get_catalog().gym_equipment)
+        self.assertNotEqual(get_catalog().version, loaded.version)
+
+    @override_settings(AI_CATALOG_CHECK_INTERVAL=60)
+    def test_version_checked_at_most_once_per_interval(self):
+        """Test the version row is not queried on every call"""
+        get_catalog()
+        with self.assertNumQueries(0):
+            get_catalog()
+
+
+class BenchmarkHarnessTestCase(TransactionTestCase):
+    """Test the offline fake upstream and benchmark harness"""
+
+    def setUp(self):
+        USER_BEHAVIOR_STATE.clear()
+        IN_FLIGHT_REQUESTS.clear()
+        RESPONSE_CACHE.clear()
+
+    def test_fake_upstream_answers_in_message_language(self):
+        """Test the fake returns a Responses API payload in the user's language"""
+        with FakeUpstream(latency_ms=0, jitter_ms=0) as fake:
+            client = OpenAIClient(url=fake.url, max_retries=0)
+            completion = client.post({'model': 'gpt-4.1', 'input': [{'role': 'user', 'content': 'كيف حالك'}]}, {})
+
+        self.assertEqual(fake.requests, 1)
+        self.assertIn('ممتاز', completion['output'][0]['content'][0]['text'])
+        self.assertIn('input_tokens', completion['usage'])
+
+    def test_benchmark_reports_latency_split(self):
+        """Test the harness drives the chat view and reports percentiles and stage shares"""
+        # One worker: the in-memory SQLite test database raises "table is locked"
+        # on concurrent writes instead of waiting like a file database
+        report = run_benchmark(total_requests=12, concurrency=1, users=2, latency_ms=5, jitter_ms=0, seed=1)
+
+        self.assertEqual(report['status_counts'], {200: 12})
+        self.assertEqual(report['upstream_requests'], 12)
+        self.assertIsNotNone(report['latency_ms']['p99'])
+        self.assertGreater(report['upstream_ms']['total'], 0)
+        self.assertGreater(report['build_context_ms']['total'], 0)
+
+    def test_benchmark_deletes_only_users_it_created(self):
+        """Test an existing account with the benchmark prefix survives the cleanup"""
+        existing = User.objects.create_user(username='ai_bench_0', password='testpass123')
+
+        run_benchmark(total_requests=2, concurrency=1, users=2, latency_ms=0, jitter_ms=0)
+
+        self.assertEqual(list(User.objects.filter(username__startswith='ai_bench_')), [existing])
+
+    def test_benchmark_command_fails_over_thresholds(self):
+        """Test --max-error-rate turns a failing run into a non-zero exit"""
+        with self.assertRaisesMessage(CommandError, 'error rate 1.0 exceeds 0.1'):
+            call_command('benchmark_ai', requests=2, concurrency=1, users=1, latency_ms=0, jitter_ms=0,
+                         error_rate=1.0, max_error_rate=0.1, stdout=StringIO())
+
+    def test_replay_sends_recorded_calls(self):
+        """Test captured calls are replayed per recorded user at the requested rate"""
+        records = [
+            {'ts': f'2026-01-01T00:00:0{index}+00:00', 'user_id': index % 2, 'message': f'question {index}',
+             'request_data': {'message': f'question {index}', 'async': True}}
+            for index in range(4)
+        ]
+        report = replay_call_log(records, rate=50, concurrency=1, latency_ms=5, jitter_ms=0)
+
+        self.assertEqual(report['status_counts'], {200: 4})
+        self.assertEqual(report['upstream_requests'], 4)
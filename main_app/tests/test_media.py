@@ -0,0 +1,448 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from ..management.commands.backfill_image_placeholders import Command as BackfillCommand
+from ..media.encoding import describe_file, reencode
+from ..media.gc import scan
+from ..media.renditions import forget_known, rendition_name
+from ..media.tasks import run_in_process
+from ..media.uploads import OffsetMismatchError, UploadBusyError, append_chunk, complete_upload
+from ..models import MediaBlob, MediaUpload, Post, UserProfile
+
+
+def make_image(size=(2000, 1500), color=(200, 80, 40), image_format='JPEG', exif=None):
+    """Encoded bytes of a solid-colour test image"""
+    out = io.BytesIO()
+    options = {'exif': exif.tobytes()} if exif is not None else {}
+    Image.new('RGB', size, color).save(out, image_format, **options)
+    return out.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """Base test case with a temporary MEDIA_ROOT and inline media workers"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, MEDIA_WORKERS=0, MEDIA_PROCESSES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        forget_known()
+
+        self.user = User.objects.create_user(username='mediauser', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload_post(self, data=None, name='run.jpg'):
+        upload = SimpleUploadedFile(name, data or make_image(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-list'), {'content': 'Morning run', 'image': upload})
+        self.assertEqual(response.status_code, 201, response.data)
+        return Post.objects.get(id=response.data['id'])
+
+
+class RenditionTestCase(MediaTestCase):
+    """Test resized renditions of post images and profile pictures"""
+
+    def test_upload_generates_renditions(self):
+        """Test a post upload writes card and detail renditions bounded to their size"""
+        post = self.upload_post()
+
+        for rendition, bound in (('card', 640), ('detail', 1280)):
+            with default_storage.open(rendition_name(post.image.name, rendition)) as handle:
+                self.assertEqual(max(Image.open(handle).size), bound)
+
+    def test_serializers_return_size_appropriate_urls(self):
+        """Test the feed gets the card URL, the detail view the detail URL, avatars the avatar URL"""
+        post = self.upload_post()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                reverse('user-profile'),
+                {'profile_picture': SimpleUploadedFile('me.png', make_image(image_format='PNG'), content_type='image/png')},
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        feed = self.client.get(reverse('post-list')).data[0]
+        detail = self.client.get(reverse('post-detail', args=[post.id])).data
+
+        self.assertTrue(feed['image_url'].endswith('.card.webp'))
+        self.assertTrue(detail['image_url'].endswith('.detail.webp'))
+        self.assertTrue(feed['user_profile_picture'].endswith('.avatar.webp'))
+        self.assertEqual(feed['image_renditions']['original'], post.image.url)
+
+    def test_missing_rendition_falls_back_to_original(self):
+        """Test an image without renditions serves the original and generates them on demand"""
+        name = default_storage.save('post_images/old.jpg', ContentFile(make_image()))
+        post = Post.objects.create(user=self.user, content='Old post', image=name)
+
+        first = self.client.get(reverse('post-detail', args=[post.id])).data
+        second = self.client.get(reverse('post-detail', args=[post.id])).data
+
+        self.assertEqual(first['image_url'], post.image.url)
+        self.assertEqual(second['image_url'], default_storage.url(rendition_name(name, 'detail')))
+
+
+class ReencodeTestCase(MediaTestCase):
+    """Test uploads are re-encoded with orientation applied and metadata stripped"""
+
+    def test_upload_reencoded_to_webp(self):
+        """Test a rotated JPEG with EXIF becomes an upright, capped WebP without EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'PhoneMaker'
+        post = self.upload_post(make_image(size=(3000, 1000), exif=exif))
+
+        self.assertTrue(post.image.name.endswith('.webp'))
+        self.assertEqual(post.image.name.count('/'), 3)
+        with default_storage.open(post.image.name) as handle:
+            image = Image.open(handle)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (853, 2560))
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(MEDIA_PROCESSES=1)
+    def test_encoding_runs_in_process_pool(self):
+        """Test the encoder round-trips through a worker process"""
+        encoded = run_in_process(reencode, make_image(size=(100, 50)), 'AVIF', 60, 2560)
+
+        self.assertEqual(Image.open(io.BytesIO(encoded)).format, 'AVIF')
+
+
+class ContentAddressedStorageTestCase(MediaTestCase):
+    """Test uploads are stored once per content hash and reference counted"""
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test saving the same bytes twice returns one digest-named file"""
+        data = make_image()
+        first = default_storage.save('post_images/a.jpg', ContentFile(data))
+        second = default_storage.save('post_images/b.JPG', ContentFile(data))
+
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first, f'post_images/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second, first)
+
+    def test_reposted_photo_is_reference_counted(self):
+        """Test two posts of the same photo share the blob until both are deleted"""
+        data = make_image()
+        first = self.upload_post(data)
+        second = self.upload_post(data)
+        upload = MediaBlob.objects.exclude(name=first.image.name).get()
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+        self.assertEqual(upload.refcount, 0)
+        self.assertIsNotNone(upload.orphaned_at)
+
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).refcount, 1)
+        self.user.delete()
+        self.assertIsNotNone(MediaBlob.objects.get(name=second.image.name).orphaned_at)
+
+
+class ChunkedUploadTestCase(MediaTestCase):
+    """Test resumable chunked uploads attached to posts"""
+
+    def start_upload(self, data, **extra):
+        response = self.client.post(reverse('upload-list'), {
+            'kind': 'post_image', 'filename': 'ride.jpg', 'size': len(data), **extra,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['upload_id']
+
+    def put_chunk(self, upload_id, offset, chunk):
+        return self.client.put(
+            reverse('upload-detail', args=[upload_id]), data=chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload_resumes_and_attaches_to_post(self):
+        """Test chunks append at their offset, a stale offset is rejected and the upload is attached"""
+        data = make_image()
+        upload_id = self.start_upload(data, sha256=hashlib.sha256(data).hexdigest())
+        half = len(data) // 2
+
+        self.assertEqual(self.put_chunk(upload_id, 0, data[:half]).data['offset'], half)
+        stale = self.put_chunk(upload_id, 0, data[:half])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.data['offset'], half)
+        resumed = self.client.get(reverse('upload-detail', args=[upload_id]))
+        self.assertEqual(resumed.data['offset'], half)
+        self.put_chunk(upload_id, half, data[half:])
+
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 200, response.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-list'), {'content': 'Long ride', 'upload_id': upload_id})
+        self.assertEqual(response.status_code, 201, response.data)
+
+        post = Post.objects.get(id=response.data['id'])
+        self.assertTrue(post.image.name.endswith('.webp'))
+        self.assertEqual(post.image.name.count('/'), 3)
+        self.assertTrue(default_storage.exists(rendition_name(post.image.name, 'card')))
+        self.assertEqual(MediaUpload.objects.get(id=upload_id).status, 'attached')
+
+    def test_concurrent_chunk_retries_keep_the_digest(self):
+        """Test a retried chunk that loses the offset race does not feed the winner's hasher"""
+        data = make_image()
+        upload_id = self.start_upload(data, sha256=hashlib.sha256(data).hexdigest())
+        half = len(data) // 2
+        self.put_chunk(upload_id, 0, data[:half])
+        loser, winner = MediaUpload.objects.get(id=upload_id), MediaUpload.objects.get(id=upload_id)
+
+        class WinnerFirst(io.BytesIO):
+            # The winner runs start to finish while the loser is mid-chunk
+            def read(self, size=-1):
+                if winner.received == half:
+                    append_chunk(winner, half, io.BytesIO(data[half:]), len(data) - half)
+                return super().read(size)
+
+        with self.assertRaises(OffsetMismatchError):
+            append_chunk(loser, half, WinnerFirst(data[half:]), len(data) - half)
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_complete_in_progress_conflicts(self):
+        """Test a second complete while the first is verifying gets 409, not a storage error"""
+        data = make_image()
+        upload_id = self.start_upload(data)
+        self.put_chunk(upload_id, 0, data)
+        stale = MediaUpload.objects.get(id=upload_id)
+        MediaUpload.objects.filter(id=upload_id).update(status='verifying')
+
+        with self.assertRaises(UploadBusyError):
+            complete_upload(stale)
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_unfinished_upload_cannot_be_attached(self):
+        """Test attaching an upload that is still uploading or verifying gets 409 and leaves it alone"""
+        data = make_image()
+        upload_id = self.start_upload(data)
+        self.put_chunk(upload_id, 0, data)
+
+        for upload_status in ('uploading', 'verifying'):
+            MediaUpload.objects.filter(id=upload_id).update(status=upload_status)
+            response = self.client.post(reverse('post-list'), {'content': 'Long ride', 'upload_id': upload_id})
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(MediaUpload.objects.get(id=upload_id).status, upload_status)
+        self.assertFalse(Post.objects.exists())
+
+    def test_checksum_mismatch_is_rejected(self):
+        """Test completing an upload whose bytes differ from the declared sha256 fails"""
+        data = make_image()
+        upload_id = self.start_upload(data, sha256='0' * 64)
+        self.put_chunk(upload_id, 0, data)
+
+        response = self.client.post(reverse('upload-complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Checksum mismatch', response.data['error'])
+
+
+class MediaServeTestCase(MediaTestCase):
+    """Test serving media with cache headers, ranges and proxy offload"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = make_image()
+        self.name = default_storage.save('post_images/run.jpg', ContentFile(self.data))
+        self.url = settings.MEDIA_URL + self.name
+
+    def test_addressed_file_is_immutable_and_revalidates(self):
+        """Test a content-addressed file is cached forever and answers If-None-Match with 304"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.getvalue(), self.data)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        """Test a byte range returns 206 with only those bytes, and a range past the end 416"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.getvalue(), self.data[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.getvalue(), self.data[-5:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_offload_and_hidden_paths(self):
+        """Test X-Accel-Redirect hands the file to the proxy and in-progress uploads are not served"""
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+
+        default_storage.save_derived('.uploads/secret.part', ContentFile(b'partial'))
+        self.assertEqual(self.client.get(settings.MEDIA_URL + '.uploads/secret.part').status_code, 404)
+        self.assertEqual(self.client.get(settings.MEDIA_URL + '../db.sqlite3').status_code, 404)
+
+
+class MediaGarbageCollectionTestCase(MediaTestCase):
+    """Test gc_media removes only unreferenced files past the grace period"""
+
+    def test_removes_unreferenced_files(self):
+        """Test a dry run only reports, then the replaced upload is deleted and the post's files kept"""
+        post = self.upload_post()
+        original = MediaBlob.objects.get(refcount=0).name
+        kept = [post.image.name, rendition_name(post.image.name, 'card'), rendition_name(post.image.name, 'detail')]
+
+        call_command('gc_media', dry_run=True, grace_hours=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(original))
+
+        out = io.StringIO()
+        call_command('gc_media', grace_hours=0, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertGreaterEqual(report['reclaimed_bytes'], len(make_image()))
+        self.assertEqual(sorted(name for name, _, _ in scan(self.media_root)), sorted(kept))
+        self.assertFalse(MediaBlob.objects.filter(name=original).exists())
+
+    def test_grace_period_and_quarantine(self):
+        """Test fresh orphans survive the default grace period and old ones can be quarantined"""
+        name = default_storage.save('post_images/stray.jpg', ContentFile(make_image()))
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine, True)
+        call_command('gc_media', grace_hours=0, quarantine=quarantine, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+
+
+class ImagePlaceholderTestCase(MediaTestCase):
+    """Test width, height, dominant colour and BlurHash of uploaded images"""
+
+    def test_ingest_records_placeholders(self):
+        """Test an uploaded post image gets its dimensions, colour and BlurHash in the API"""
+        post = self.upload_post(make_image(size=(1200, 800), color=(30, 120, 200)))
+
+        response = self.client.get(reverse('post-detail', args=[post.id]))
+        self.assertEqual((response.data['image_width'], response.data['image_height']), (1200, 800))
+        red, green, blue = (int(response.data['image_color'][i:i + 2], 16) for i in (1, 3, 5))
+        self.assertLess(max(abs(red - 30), abs(green - 120), abs(blue - 200)), 8)
+        self.assertEqual(len(response.data['image_blurhash']), 28)
+
+    def test_backfill_command(self):
+        """Test the backfill fills in images stored before placeholders were recorded"""
+        name = default_storage.save('post_images/old.jpg', ContentFile(make_image(size=(300, 600))))
+        post = Post.objects.create(user=self.user, content='Old post', image=name)
+
+        call_command('backfill_image_placeholders', processes=1, stdout=io.StringIO(),
+                     checkpoint=os.path.join(self.media_root, 'backfill.json'))
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (300, 600))
+        self.assertTrue(post.image_blurhash)
+
+    def test_replaced_image_drops_old_placeholders(self):
+        """Test a new or cleared image never shows the previous image's colour, BlurHash or size"""
+        post = self.upload_post(make_image(size=(1200, 800)))
+        replacement = SimpleUploadedFile('tall.jpg', make_image(size=(300, 600)), content_type='image/jpeg')
+
+        # Ingestion (deferred to commit) has not run yet: only the header sizes are known
+        response = self.client.put(reverse('post-detail', args=[post.id]), {'image': replacement})
+        self.assertEqual((response.data['image_width'], response.data['image_height']), (300, 600))
+        self.assertEqual((response.data['image_color'], response.data['image_blurhash']), ('', ''))
+
+        self.profile.profile_picture = post.image.name
+        self.profile.save()
+        self.profile.profile_picture_blurhash = 'stale'
+        self.profile.save()
+        response = self.client.put(reverse('user-profile'), {'profile_picture': ''})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.profile_picture_width, self.profile.profile_picture_blurhash), (None, ''))
+
+    def test_backfill_keeps_values_written_meanwhile(self):
+        """Test a row whose image changed while the batch was processed is not overwritten"""
+        name = default_storage.save('post_images/old.jpg', ContentFile(make_image(size=(300, 600))))
+        post = Post.objects.create(user=self.user, content='Old post', image=name)
+
+        def replaced_during_processing(path):
+            # An ingest of a new image lands between the read and the write
+            Post.objects.filter(pk=post.pk).update(image='post_images/new.webp', image_width=50, image_blurhash='fresh')
+            return describe_file(path)
+
+        with mock.patch.object(BackfillCommand, 'worker', staticmethod(replaced_during_processing)):
+            call_command('backfill_image_placeholders', processes=0, stdout=io.StringIO(),
+                         checkpoint=os.path.join(self.media_root, 'backfill.json'))
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_blurhash), (50, 'fresh'))
+
+    def test_worker_args_follow_the_path(self):
+        """Test the worker is called as worker(path, *worker_args)"""
+        name = default_storage.save('post_images/old.jpg', ContentFile(make_image(size=(300, 600))))
+        Post.objects.create(user=self.user, content='Old post', image=name)
+        calls = []
+
+        def worker(path, *args):
+            calls.append((path, args))
+            return describe_file(path)
+
+        with mock.patch.object(BackfillCommand, 'worker', staticmethod(worker)), \
+                mock.patch.object(BackfillCommand, 'worker_args', lambda command, options: ('webp', 80)):
+            call_command('backfill_image_placeholders', processes=0, stdout=io.StringIO(),
+                         checkpoint=os.path.join(self.media_root, 'backfill.json'))
+        self.assertEqual(calls, [(default_storage.path(name), ('webp', 80))])
+
+    def test_backfill_resumes_from_checkpoint(self):
+        """Test a bulk run continues after the checkpointed pk and removes the checkpoint when done"""
+        name = default_storage.save('post_images/old.jpg', ContentFile(make_image(size=(300, 600))))
+        posts = [Post.objects.create(user=self.user, content=f'Old post {i}', image=name) for i in range(3)]
+        checkpoint = os.path.join(self.media_root, 'backfill.json')
+        with open(checkpoint, 'w') as handle:
+            json.dump({'main_app.Post.image': posts[1].pk}, handle)
+
+        call_command('backfill_image_placeholders', processes=0, batch_size=1, checkpoint=checkpoint,
+                     stdout=io.StringIO())
+        blurhashes = [Post.objects.get(pk=post.pk).image_blurhash for post in posts]
+        self.assertEqual(blurhashes[:2], ['', ''])
+        self.assertTrue(blurhashes[2])
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class UploadValidationTestCase(MediaTestCase):
+    """Test header-only upload validation and early size rejection"""
+
+    def post_image(self, data, name='upload.png', **extra):
+        upload = SimpleUploadedFile(name, data, content_type='image/png')
+        return self.client.post(reverse('post-list'), {'content': 'Check', 'image': upload}, **extra)
+
+    def test_rejects_non_images_and_decompression_bombs(self):
+        """Test a non-image and an image with too many pixels are rejected from their header"""
+        response = self.post_image(b'not an image at all', name='fake.jpg')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('valid image', response.data['error'])
+
+        bomb = io.BytesIO()
+        Image.new('1', (9000, 9000)).save(bomb, 'PNG')
+        response = self.post_image(bomb.getvalue())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('9000x9000', response.data['error'])
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_oversized_body_from_content_length(self):
+        """Test a body larger than the upload limit is refused before it is parsed"""
+        response = self.post_image(make_image(), CONTENT_LENGTH=str(50 * 1024 * 1024))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('too large', response.data['error'])
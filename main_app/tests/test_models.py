@@ -1,8 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from rest_framework.test import APIClient
 from ..models import UserProfile, WorkoutPlan, Post, Comment
+from ..plan_cache import reset_plan_cache
 
 
 class ModelTestCase(TestCase):
@@ -426,3 +429,53 @@ class ModelValidationTestCase(ModelTestCase):
 
 
 
+
+
+class WorkoutPlanCacheTestCase(ModelTestCase):
+    """Test the per-worker cache of global workout plans behind the list endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        reset_plan_cache()
+        self.addCleanup(reset_plan_cache)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        WorkoutPlan.objects.create(user=other, title='Not mine', goal_type='cut')
+
+    def titles(self, **params):
+        response = self.client.get(reverse('workout-plan-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [plan['title'] for plan in response.data]
+
+    def test_list_merges_own_and_global_plans_in_one_query(self):
+        """Test the list is newest first, excludes other users' plans and costs one query once warm"""
+        self.assertEqual(self.titles(), ['Home Workout', 'Advanced Workout', 'Beginner Workout'])
+        self.assertEqual(self.titles(goal_type='home'), ['Home Workout'])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('workout-plan-list'))
+        self.assertEqual(response.data[1]['user_username'], 'testuser')
+
+    @override_settings(WORKOUT_PLAN_CHECK_INTERVAL=0)
+    def test_global_plan_changes_invalidate_cache(self):
+        """Test editing a global plan, or making a plan global, reloads the cached set"""
+        self.titles()
+        self.workout_plan3.title = 'Home Circuit'
+        self.workout_plan3.save()
+        self.assertIn('Home Circuit', self.titles())
+
+        plan = WorkoutPlan.objects.get(title='Not mine')
+        plan.user = None
+        plan.save()
+        self.assertIn('Not mine', self.titles())
+
+        WorkoutPlan.objects.get(pk=self.workout_plan3.pk).delete()
+        self.assertNotIn('Home Circuit', self.titles())
+
+    @override_settings(WORKOUT_PLAN_CHECK_INTERVAL=0)
+    def test_queryset_delete_invalidates_cache(self):
+        """Test a bulk delete (admin "delete selected", seed_workout_plans) reloads the cached set"""
+        self.titles()
+        WorkoutPlan.objects.filter(user=None, goal_type='home').delete()
+
+        self.assertNotIn('Home Workout', self.titles())
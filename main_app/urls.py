@@ -2,6 +2,8 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
+    AIJobView,
+    AIMetricsView,
     CommentListView,
     CommentDetailView,
     CreateUserView,
@@ -11,6 +13,9 @@ from .views import (
     LoginView,
     PostDetailView,
     PostListView,
+    UploadCompleteView,
+    UploadDetailView,
+    UploadListView,
     UserProfileDetailView,
     WorkoutPlanDetailView,
     WorkoutPlanListView,
@@ -45,6 +50,11 @@ urlpatterns = [
     # post detail (get, update, delete)
     path('posts/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
 
+    # chunked image uploads (start, resume/append, complete)
+    path('uploads/', UploadListView.as_view(), name='upload-list'),
+    path('uploads/<uuid:upload_id>/', UploadDetailView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:upload_id>/complete/', UploadCompleteView.as_view(), name='upload-complete'),
+
     # comments for a post (list, create)
     path('posts/<int:post_id>/comments/', CommentListView.as_view(), name='comment-list'),
 
@@ -54,6 +64,12 @@ urlpatterns = [
     # OpenAI Chat endpoint
     path('api/openai/', OpenAIView.as_view(), name='openai-chat'),
 
+    # Background AI chat job status/result
+    path('api/openai/jobs/<uuid:job_id>/', AIJobView.as_view(), name='openai-job'),
+
+    # AI prompt/latency metrics (staff only)
+    path('api/openai/metrics/', AIMetricsView.as_view(), name='openai-metrics'),
+
     # Follow/Unfollow user
     path('users/<int:user_id>/follow/', FollowUserView.as_view(), name='follow-user'),
 ]
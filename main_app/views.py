@@ -5,17 +5,19 @@ import re
 from datetime import timedelta
 
 import requests
+from django.conf import settings
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db import models
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Comment, Follow, Post, UserProfile, WorkoutPlan
+from .models import AIJob, Comment, Follow, MediaUpload, Post, UserProfile, WorkoutPlan
 from .serializers import (
     CommentSerializer,
     PostSerializer,
@@ -23,11 +25,67 @@ from .serializers import (
     UserSerializer,
     WorkoutPlanSerializer,
 )
+from .ai import metrics as ai_metrics
 from .ai.ai_generator import generate_ai_response
+from .ai.jobs import QueueFullError, expire_stale_jobs, submit_job
+from .ai.throttling import AIChatThrottle
+from .media.ingest import schedule_ingest
+from .plan_cache import list_workout_plans
+from .media.uploads import (
+    OffsetMismatchError,
+    UploadBusyError,
+    UploadError,
+    append_chunk,
+    complete_upload,
+    create_upload,
+    max_upload_size,
+    take_completed_upload,
+)
+
+
+def _is_truthy(value):
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 'yes', 'on')
+    return bool(value)
+
+
+UPLOAD_FORM_ALLOWANCE = 64 * 1024
+
+
+def _reject_oversized(request):
+    """413 from Content-Length alone, before request.data reads and parses the body"""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return None
+    # Allow for the multipart boundaries and the other form fields
+    if length > max_upload_size() + UPLOAD_FORM_ALLOWANCE:
+        return Response(
+            {'error': f'Image file too large. Maximum size is {max_upload_size() // (1024 * 1024)}MB.'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    return None
+
+
+def _request_data(request):
+    """Mutable shallow copy of request.data; QueryDict.copy() deep-copies every uploaded file"""
+    if hasattr(request.data, 'dict'):
+        return request.data.dict()
+    return dict(request.data)
 
 
 class OpenAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [AIChatThrottle]
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Throttled):
+            return Response(
+                {'error': 'Too many requests. Please try again shortly.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(exc.wait)},
+            )
+        return super().handle_exception(exc)
 
     def post(self, request):
         data = request.data or {}
@@ -35,6 +93,24 @@ class OpenAIView(APIView):
         if not user_message:
             return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Background mode: return a job id now, the client polls AIJobView for the reply
+        if _is_truthy(data.get('async', request.query_params.get('async'))):
+            try:
+                job = submit_job(request.user, user_message, data)
+            except QueueFullError as exc:
+                return Response(
+                    {'error': str(exc)},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(exc.retry_after)},
+                )
+            except Exception as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({
+                'job_id': str(job.id),
+                'status': job.status,
+                'poll_url': reverse('openai-job', args=[job.id]),
+            }, status=status.HTTP_202_ACCEPTED)
+
         try:
             return generate_ai_response(request.user, user_message, data)
         except ValueError as exc:
@@ -42,11 +118,39 @@ class OpenAIView(APIView):
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+class AIJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        """Poll a background AI chat job"""
+        try:
+            job = AIJob.objects.get(id=job_id, user=request.user)
+        except AIJob.DoesNotExist:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status in ('queued', 'running') and expire_stale_jobs(job.id):
+            # Its worker is gone (restart) or it overran AI_JOB_TIMEOUT
+            job.refresh_from_db()
+
+        content = {'job_id': str(job.id), 'status': job.status}
+        if job.status in ('done', 'failed'):
+            content['status_code'] = job.status_code
+            content['result'] = job.result
+        return Response(content, status=status.HTTP_200_OK)
+
+
+class AIMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Prompt size and latency metrics for this worker process"""
+        return Response(ai_metrics.snapshot(), status=status.HTTP_200_OK)
+
 # ============================================================
 # FITLIFE AI COACH - MASTER SYSTEM PROMPT
 # ============================================================
 # This is the permanent brain of FitLife AI Chat
-# Replace {{user_name}} dynamically with the logged-in user's name
+# Kept static; the user's name and profile travel in the per-request context
 # ============================================================
 
 
@@ -253,14 +357,16 @@ class UserProfileDetailView(APIView):
             return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def put(self, request):
+        oversized = _reject_oversized(request)
+        if oversized:
+            return oversized
         try:
             profile, created = UserProfile.objects.get_or_create(user=request.user)
             
             
             if 'profile_picture' in request.data and request.data['profile_picture'] == '':
                 
-                if profile.profile_picture:
-                    profile.profile_picture.delete(save=False)
+                # The blob may be shared; gc_media deletes it once nothing references it
                 profile.profile_picture = None
                 profile.save()
                 
@@ -285,9 +391,16 @@ class UserProfileDetailView(APIView):
                     profile.selected_workout_plan = None
                     profile.save()
             
-            data = request.data.copy()
-            if request.FILES:
-                data.update(request.FILES)
+            data = _request_data(request)
+            picture_upload = None
+            if data.get('profile_picture_upload_id'):
+                try:
+                    picture_upload = take_completed_upload(
+                        request.user, data.pop('profile_picture_upload_id'), 'profile_picture')
+                except UploadBusyError as exc:
+                    return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+                except UploadError as exc:
+                    return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             
             # Handle age and height conversion from string to int/None
             if 'age' in data:
@@ -335,6 +448,11 @@ class UserProfileDetailView(APIView):
             serializer = UserProfileSerializer(profile, data=data, partial=True, context={'request': request})
             if serializer.is_valid():
                 serializer.save()
+                if picture_upload is not None:
+                    profile.profile_picture = picture_upload.name
+                    profile.save()
+                if 'profile_picture' in request.FILES or picture_upload is not None:
+                    schedule_ingest(profile.profile_picture)
                 response_data = serializer.data
                 # Ensure all fields are present in response
                 if response_data.get('age') is None:
@@ -376,16 +494,9 @@ class WorkoutPlanListView(APIView):
     def get(self, request):
         
         try:
-            workout_plans = WorkoutPlan.objects.filter(
-                models.Q(user=request.user) | models.Q(user=None)
-            ).order_by('-created_at')
-            
-            goal_type = request.query_params.get('goal_type', None)
-            if goal_type:
-                workout_plans = workout_plans.filter(goal_type=goal_type)
-            
-            serializer = WorkoutPlanSerializer(workout_plans, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Global plans come from this worker's cache; only the user's own are queried
+            plans = list_workout_plans(request.user, request.query_params.get('goal_type', None))
+            return Response(plans, status=status.HTTP_200_OK)
         except Exception as err:
             return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -460,22 +571,24 @@ class PostListView(APIView):
             return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def post(self, request):
-       
+        oversized = _reject_oversized(request)
+        if oversized:
+            return oversized
         try:
-            data = request.data.copy() if request.data else {}
-            
-            if request.FILES:
-                data.update(request.FILES)
-            
+            data = _request_data(request)
             data['user'] = request.user.id
             
             if 'content' not in data or not data.get('content', '').strip():
                 return Response({'error': 'Post content is required'}, status=status.HTTP_400_BAD_REQUEST)
             
-            if 'image' in request.FILES:
-                image_file = request.FILES['image']
-                if image_file.size > 10 * 1024 * 1024:
-                    return Response({'error': 'Image file too large. Maximum size is 10MB.'}, status=status.HTTP_400_BAD_REQUEST)
+            image_upload = None
+            if data.get('upload_id'):
+                try:
+                    image_upload = take_completed_upload(request.user, data.pop('upload_id'), 'post_image')
+                except UploadBusyError as exc:
+                    return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+                except UploadError as exc:
+                    return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             
             if 'workout_plan' in data:
                 workout_plan_value = data['workout_plan']
@@ -502,6 +615,10 @@ class PostListView(APIView):
             serializer = PostSerializer(data=data, context={'request': request})
             if serializer.is_valid():
                 post = serializer.save()
+                if image_upload is not None:
+                    post.image = image_upload.name
+                    post.save()
+                schedule_ingest(post.image)
                 return Response(PostSerializer(post, context={'request': request}).data, status=status.HTTP_201_CREATED)
             
             error_message = "Validation error"
@@ -526,7 +643,7 @@ class PostDetailView(APIView):
         
         try:
             post = Post.objects.select_related('user', 'user__profile').get(pk=pk)
-            serializer = PostSerializer(post, context={'request': request})
+            serializer = PostSerializer(post, context={'request': request, 'image_rendition': 'detail'})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Post.DoesNotExist:
             return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -534,20 +651,23 @@ class PostDetailView(APIView):
             return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def put(self, request, pk):
-       
+        oversized = _reject_oversized(request)
+        if oversized:
+            return oversized
         try:
             post = Post.objects.select_related('user', 'user__profile').get(pk=pk)
             
             if post.user != request.user:
                 return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
             
-            data = request.data.copy()
-            if request.FILES:
-                data.update(request.FILES)
+            data = _request_data(request)
             serializer = PostSerializer(post, data=data, partial=True, context={'request': request})
             if serializer.is_valid():
                 serializer.save()
-                return Response(PostSerializer(post, context={'request': request}).data, status=status.HTTP_200_OK)
+                if 'image' in request.FILES:
+                    schedule_ingest(post.image)
+                context = {'request': request, 'image_rendition': 'detail'}
+                return Response(PostSerializer(post, context=context).data, status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Post.DoesNotExist:
             return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -570,6 +690,98 @@ class PostDetailView(APIView):
             return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _upload_state(upload):
+    return {
+        'upload_id': str(upload.id),
+        'kind': upload.kind,
+        'status': upload.status,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': settings.MEDIA_UPLOAD_CHUNK_SIZE,
+    }
+
+
+class UploadListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Start a chunked upload: kind, filename, size and optional sha256"""
+        try:
+            upload = create_upload(
+                request.user,
+                request.data.get('kind', 'post_image'),
+                request.data.get('filename'),
+                request.data.get('size'),
+                request.data.get('sha256', ''),
+            )
+            return Response(_upload_state(upload), status=status.HTTP_201_CREATED)
+        except UploadError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as err:
+            return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class UploadDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        """Current offset, to resume an interrupted upload"""
+        try:
+            upload = MediaUpload.objects.get(id=upload_id, user=request.user)
+        except MediaUpload.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_upload_state(upload), status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        """Append one chunk; the raw body starts at the Upload-Offset header"""
+        try:
+            upload = MediaUpload.objects.get(id=upload_id, user=request.user)
+        except MediaUpload.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'error': 'Upload-Offset header is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Read the body straight from the socket; request.data would buffer it
+            append_chunk(upload, offset, request.stream, length)
+            return Response(_upload_state(upload), status=status.HTTP_200_OK)
+        except OffsetMismatchError as exc:
+            return Response(
+                {'error': str(exc), 'offset': exc.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(exc.offset)},
+            )
+        except UploadError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as err:
+            return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class UploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        """Verify the assembled upload and store it; attach it by upload_id afterwards"""
+        try:
+            upload = MediaUpload.objects.get(id=upload_id, user=request.user)
+        except MediaUpload.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            complete_upload(upload)
+            return Response(_upload_state(upload), status=status.HTTP_200_OK)
+        except OffsetMismatchError as exc:
+            return Response({'error': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadBusyError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as err:
+            return Response({'error': str(err)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class CommentListView(APIView):
     permission_classes = [IsAuthenticated]
 